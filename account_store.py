@@ -0,0 +1,381 @@
+import datetime as dt
+
+import numpy as np
+
+# Starting capacity of a new store. Both axes grow by doubling, so appending a date or an account is amortised O(1)
+# copies of the other axis rather than a full rebuild of the matrix.
+INITIAL_CAPACITY = 8
+
+
+def parse_value(value):
+    """
+    Convert a raw account value (csv cell, user input or number) into a float.
+    :param value: String, int, float or None. Blank strings and None are treated as missing.
+    :return: float, or None if the value is missing
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if value == "":
+            return None
+        try:
+            return float(value.replace(",", "").lstrip("£$€¥"))
+        except ValueError:
+            raise ValueError(f"'{value}' is not a valid account value.")
+    return float(value)
+
+
+def format_value(value):
+    """
+    Format a stored float for writing back out to a csv. Whole numbers are written without a decimal point so that
+    files written by hand are not littered with '.0' after a save.
+    :param value: float or None
+    :return: string representation
+    """
+    if value is None:
+        return ""
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def to_ordinal(date):
+    """
+    Convert a date or datetime into the integer day ordinal used for the date axis.
+    :param date: date or datetime object
+    :return: int
+    """
+    return date.toordinal()
+
+
+def to_ordinals(dates):
+    """
+    Convert a list of dates or datetimes into an array of day ordinals.
+    :param dates: Iterable of date or datetime objects
+    :return: numpy int64 array
+    """
+    return np.fromiter((x.toordinal() for x in dates), dtype=np.int64)
+
+
+class AccountStore(object):
+    """
+    Columnar storage for a set of bank accounts. All accounts share a single sorted date axis. Values are held in a
+    (dates x accounts) float matrix alongside a boolean matrix marking which cells hold a real entry. Missing cells are
+    kept as 0.0 so that sums over the matrix need no special handling.
+    """
+    def __init__(self):
+        """
+        Create an empty store.
+        """
+        # Date axis, kept in chronological order. The ordinal array is used for all searching.
+        self.dates = []
+        self._ordinals = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+
+        # Account axis
+        self.names = []
+        self.types = []
+        self.currencies = []
+        self._columns = {}
+
+        self._values = np.zeros((INITIAL_CAPACITY, INITIAL_CAPACITY), dtype=np.float64, order="F")
+        self._present = np.zeros((INITIAL_CAPACITY, INITIAL_CAPACITY), dtype=bool, order="F")
+
+    @property
+    def n_dates(self):
+        return len(self.dates)
+
+    @property
+    def n_accounts(self):
+        return len(self.names)
+
+    @property
+    def ordinals(self):
+        """
+        Day ordinals of the date axis.
+        """
+        return self._ordinals[:self.n_dates]
+
+    @property
+    def values(self):
+        """
+        (dates x accounts) matrix of values. Missing cells are 0.0.
+        """
+        return self._values[:self.n_dates, :self.n_accounts]
+
+    @property
+    def present(self):
+        """
+        (dates x accounts) boolean matrix. True where an entry exists.
+        """
+        return self._present[:self.n_dates, :self.n_accounts]
+
+    def _reserve(self, n_dates, n_accounts):
+        """
+        Make sure the underlying buffers can hold the requested number of dates and accounts.
+        :param n_dates: Number of dates required
+        :param n_accounts: Number of accounts required
+        :return: None
+        """
+        rows, cols = self._values.shape
+        if n_dates <= rows and n_accounts <= cols:
+            return
+        while rows < n_dates:
+            rows *= 2
+        while cols < n_accounts:
+            cols *= 2
+
+        new_values = np.zeros((rows, cols), dtype=np.float64, order="F")
+        new_present = np.zeros((rows, cols), dtype=bool, order="F")
+        new_values[:self.n_dates, :self.n_accounts] = self.values
+        new_present[:self.n_dates, :self.n_accounts] = self.present
+        self._values = new_values
+        self._present = new_present
+
+        if len(self._ordinals) < rows:
+            new_ordinals = np.zeros(rows, dtype=np.int64)
+            new_ordinals[:self.n_dates] = self.ordinals
+            self._ordinals = new_ordinals
+
+    def load(self, dates, names, types, currencies, values, present):
+        """
+        Replace the contents of the store in one go. Dates do not need to be sorted.
+        :param dates: List of datetime objects
+        :param names: List of account names
+        :param types: List of account types
+        :param currencies: List of account currencies
+        :param values: (dates x accounts) array-like of floats
+        :param present: (dates x accounts) array-like of bools
+        :return: None
+        """
+        ordinals = np.array([to_ordinal(x) for x in dates], dtype=np.int64)
+        order = np.argsort(ordinals, kind="stable")
+        ordinals = ordinals[order]
+        if len(ordinals) > 1 and np.any(ordinals[1:] == ordinals[:-1]):
+            duplicate = dates[order[1:][ordinals[1:] == ordinals[:-1]][0]]
+            raise ValueError(f"Date {duplicate.date()} appears more than once.")
+        assert len(set(names)) == len(names), "Account names must be unique."
+
+        values = np.asarray(values, dtype=np.float64).reshape(len(dates), len(names))[order]
+        present = np.asarray(present, dtype=bool).reshape(len(dates), len(names))[order]
+
+        self.dates = [dates[x] for x in order]
+        self.names = list(names)
+        self.types = list(types)
+        self.currencies = list(currencies)
+        self._columns = {name: idx for idx, name in enumerate(self.names)}
+
+        rows = max(INITIAL_CAPACITY, len(self.dates))
+        cols = max(INITIAL_CAPACITY, len(self.names))
+        self._ordinals = np.zeros(rows, dtype=np.int64)
+        self._ordinals[:len(ordinals)] = ordinals
+        self._values = np.zeros((rows, cols), dtype=np.float64, order="F")
+        self._present = np.zeros((rows, cols), dtype=bool, order="F")
+        self._values[:self.n_dates, :self.n_accounts] = np.where(present, values, 0.0)
+        self._present[:self.n_dates, :self.n_accounts] = present
+
+    def date_index(self, date):
+        """
+        Find the row of a date on the date axis.
+        :param date: date or datetime object
+        :return: Row index or None if the date is not present
+        """
+        ordinal = to_ordinal(date)
+        idx = int(np.searchsorted(self.ordinals, ordinal))
+        if idx < self.n_dates and self._ordinals[idx] == ordinal:
+            return idx
+        return None
+
+    def column_index(self, name):
+        """
+        Find the column of an account.
+        :param name: Account name
+        :return: Column index
+        """
+        return self._columns[name]
+
+    def has_account(self, name):
+        return name in self._columns
+
+    def add_date(self, date):
+        """
+        Add a date to the axis, keeping it in chronological order. Every account is missing on a new date.
+        :param date: datetime object
+        :return: Row index of the date
+        """
+        existing = self.date_index(date)
+        if existing is not None:
+            return existing
+
+        n = self.n_dates
+        self._reserve(n + 1, self.n_accounts)
+        idx = int(np.searchsorted(self.ordinals, to_ordinal(date)))
+        if idx < n:
+            # Shift later rows down by one. Appending (the usual case) skips this.
+            self._ordinals[idx + 1:n + 1] = self._ordinals[idx:n]
+            self._values[idx + 1:n + 1] = self._values[idx:n]
+            self._present[idx + 1:n + 1] = self._present[idx:n]
+        self._ordinals[idx] = to_ordinal(date)
+        self._values[idx] = 0.0
+        self._present[idx] = False
+        if not isinstance(date, dt.datetime):
+            date = dt.datetime.combine(date, dt.time())
+        self.dates.insert(idx, date)
+
+        return idx
+
+    def add_dates(self, dates):
+        """
+        Add many dates at once. The matrix is rebuilt a single time rather than shifting rows for every date.
+        :param dates: Iterable of datetime objects. Dates already on the axis are ignored.
+        :return: None
+        """
+        new_ordinals, first = np.unique(to_ordinals(dates), return_index=True)
+        new_dates = [dates[x] for x in first]
+        keep = ~np.isin(new_ordinals, self.ordinals)
+        new_ordinals = new_ordinals[keep]
+        if not len(new_ordinals):
+            return
+        new_dates = [dt.datetime.combine(x, dt.time()) if not isinstance(x, dt.datetime) else x
+                     for x, k in zip(new_dates, keep) if k]
+
+        n_old = self.n_dates
+        combined = np.concatenate([self.ordinals, new_ordinals])
+        order = np.argsort(combined, kind="stable")
+        old_rows = np.searchsorted(combined[order], self.ordinals)
+        all_dates = self.dates + new_dates
+
+        old_values = self.values.copy()
+        old_present = self.present.copy()
+        self._reserve(len(combined), self.n_accounts)
+        self._ordinals[:len(combined)] = combined[order]
+        self._values[:len(combined)] = 0.0
+        self._present[:len(combined)] = False
+        self._values[old_rows, :self.n_accounts] = old_values
+        self._present[old_rows, :self.n_accounts] = old_present
+        self.dates = [all_dates[x] for x in order]
+        assert self.n_dates == n_old + len(new_ordinals)
+
+    def remove_date(self, date):
+        """
+        Remove a date (and every value held on it) from the axis.
+        :param date: date or datetime object
+        :return: None
+        """
+        idx = self.date_index(date)
+        assert idx is not None, f"{date} is not present."
+        n = self.n_dates
+        self._ordinals[idx:n - 1] = self._ordinals[idx + 1:n]
+        self._values[idx:n - 1] = self._values[idx + 1:n]
+        self._present[idx:n - 1] = self._present[idx + 1:n]
+        self._values[n - 1] = 0.0
+        self._present[n - 1] = False
+        del self.dates[idx]
+
+    def add_account(self, name, account_type, currency):
+        """
+        Add an account column. The account has no entries until values are set.
+        :param name: Account name
+        :param account_type: Type of account
+        :param currency: Currency of the account values
+        :return: Column index of the account
+        """
+        assert name not in self._columns, f"An account called {name} already exists."
+        idx = self.n_accounts
+        self._reserve(self.n_dates, idx + 1)
+        self._values[:, idx] = 0.0
+        self._present[:, idx] = False
+        self.names.append(name)
+        self.types.append(account_type)
+        self.currencies.append(currency)
+        self._columns[name] = idx
+
+        return idx
+
+    def remove_account(self, name):
+        """
+        Remove an account column.
+        :param name: Account name
+        :return: None
+        """
+        idx = self._columns[name]
+        n = self.n_accounts
+        self._values[:, idx:n - 1] = self._values[:, idx + 1:n]
+        self._present[:, idx:n - 1] = self._present[:, idx + 1:n]
+        self._values[:, n - 1] = 0.0
+        self._present[:, n - 1] = False
+        del self.names[idx]
+        del self.types[idx]
+        del self.currencies[idx]
+        self._columns = {x: i for i, x in enumerate(self.names)}
+
+    def set_value(self, name, date, value):
+        """
+        Set the value of an account on a date. The date is added to the axis if required.
+        :param name: Account name
+        :param date: datetime object
+        :param value: float or None to mark the entry as missing
+        :return: None
+        """
+        col = self._columns[name]
+        row = self.add_date(date)
+        if value is None:
+            self._values[row, col] = 0.0
+            self._present[row, col] = False
+        else:
+            self._values[row, col] = value
+            self._present[row, col] = True
+
+    def set_values(self, names, dates, values):
+        """
+        Set many values in one vectorised assignment. Dates are added to the axis if required.
+        :param names: List of account names
+        :param dates: List of datetime objects, one per name
+        :param values: List of floats (None or NaN to mark the entry as missing), one per name
+        :return: None
+        """
+        if not len(names):
+            return
+        self.add_dates(dates)
+        rows = np.searchsorted(self.ordinals, to_ordinals(dates))
+        cols = np.array([self._columns[x] for x in names], dtype=np.int64)
+        values = np.array([np.nan if x is None else x for x in values], dtype=np.float64)
+        present = ~np.isnan(values)
+        self._values[rows, cols] = np.where(present, values, 0.0)
+        self._present[rows, cols] = present
+
+    def set_column(self, name, values):
+        """
+        Replace every value of one account.
+        :param name: Account name
+        :param values: Array over the date axis. NaN marks a missing entry.
+        :return: None
+        """
+        col = self._columns[name]
+        present = ~np.isnan(values)
+        self._values[:self.n_dates, col] = np.where(present, values, 0.0)
+        self._present[:self.n_dates, col] = present
+
+    def get_value(self, name, date):
+        """
+        Get the value of an account on a date.
+        :param name: Account name
+        :param date: date or datetime object
+        :return: float, or None if there is no entry
+        """
+        row = self.date_index(date)
+        if row is None:
+            return None
+        col = self._columns[name]
+        if not self._present[row, col]:
+            return None
+        return float(self._values[row, col])
+
+    def column(self, name):
+        """
+        Views onto the values and presence of a single account.
+        :param name: Account name
+        :return: (values, present) 1D arrays over the date axis
+        """
+        col = self._columns[name]
+        return self._values[:self.n_dates, col], self._present[:self.n_dates, col]
@@ -0,0 +1,250 @@
+import numpy as np
+
+from account_store import to_ordinals
+from interpolation import interpolate, DEFAULT_INTERPOLATION
+from rollups import month_ids, PERIODS, PERIOD_MONTHS
+
+DAYS_PER_YEAR = 365.25
+# Default rolling window, in days
+DEFAULT_WINDOW = 30
+
+
+def _fill_indices(present):
+    """
+    For every row and column, the nearest rows with an entry on either side.
+    :param present: (dates x accounts) bool array
+    :return: (last, following). last is the last row at or before each row with an entry (-1 for none), following is
+    the first row at or after each row with an entry (len(present) for none).
+    """
+    n = len(present)
+    rows = np.arange(n)[:, None]
+    last = np.maximum.accumulate(np.where(present, rows, -1), axis=0)
+    following = np.minimum.accumulate(np.where(present, rows, n)[::-1], axis=0)[::-1]
+    return last, following
+
+
+def value_matrix(c, dates=None, method=DEFAULT_INTERPOLATION, convert=True):
+    """
+    Values of every account on many dates at once, interpolating between entries. Step and linear interpolation are
+    done for all accounts together from the nearest entries either side of each date; monotone interpolation is done
+    an account at a time.
+    :param c: Context
+    :param dates: List of datetimes. Defaults to the dates of the Context.
+    :param method: Interpolation method from interpolation.INTERPOLATION_METHODS
+    :param convert: Convert each account to the reporting currency
+    :return: (dates x accounts) array, in the order of c.store.names. NaN outside the span of an account's entries.
+    """
+    c._require_all()
+    store = c.store
+    ordinals = store.ordinals
+    values = store.values
+    present = store.present
+    query = ordinals if dates is None else to_ordinals(dates)
+    n = len(ordinals)
+
+    if method == "monotone" or n == 0:
+        result = np.column_stack([interpolate(ordinals[present[:, idx]], values[present[:, idx], idx], query, method)
+                                  for idx in range(store.n_accounts)]) if store.n_accounts \
+            else np.zeros((len(query), 0))
+    else:
+        last, following = _fill_indices(present)
+        columns = np.arange(store.n_accounts)
+        # Row of the Context dates at or before each query date
+        row = np.searchsorted(ordinals, query, side="right") - 1
+        before = row < 0
+        row = np.maximum(row, 0)
+        left = last[row]
+        right = np.where((row + 1 < n)[:, None], following[np.minimum(row + 1, n - 1)], n)
+        x0 = ordinals[np.maximum(left, 0)].astype(np.float64)
+        y0 = values[np.maximum(left, 0), columns]
+        on_entry = x0 == query[:, None]
+        outside = before[:, None] | (left < 0) | ((right >= n) & ~on_entry)
+
+        if method == "step":
+            result = y0.copy()
+        else:
+            x1 = ordinals[np.minimum(right, n - 1)].astype(np.float64)
+            y1 = values[np.minimum(right, n - 1), columns]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result = np.where(on_entry, y0, y0 + (query[:, None] - x0) / (x1 - x0) * (y1 - y0))
+        result[outside] = np.nan
+
+    if convert:
+        result = result * _conversion_matrix(c, query)
+    return result
+
+
+def _conversion_matrix(c, ordinals):
+    """
+    :return: (dates x accounts) array of factors converting each account to the reporting currency
+    """
+    currencies = c.store.currencies
+    factors = np.ones((len(ordinals), len(currencies)))
+    for currency in set(currencies) - {c.reporting_currency}:
+        columns = [idx for idx, x in enumerate(currencies) if x == currency]
+        factors[:, columns] = c.conversion_factors(currency, ordinals)[:, None]
+    return factors
+
+
+def period_change(c, period="month"):
+    """
+    Change in every account from the end of one period to the end of the next, in each account's own currency.
+    :param c: Context
+    :param period: Period length from rollups.PERIODS
+    :return: (period labels, change, relative change). change and relative change are (periods x accounts) arrays,
+    NaN where there is nothing to compare. Relative change is a fraction of the previous period's end value.
+    """
+    rollup = c.rollup(period)
+    previous = rollup.end - rollup.change
+    with np.errstate(invalid="ignore", divide="ignore"):
+        relative = np.where(previous != 0, rollup.change / np.abs(previous), np.nan)
+    return rollup.labels, rollup.change, relative
+
+
+def annualized_growth(c, start=None, end=None):
+    """
+    Compound annual growth rate of every account, (end value / start value) ^ (1 / years) - 1.
+    :param c: Context
+    :param start: Datetime to measure from. Defaults to each account's first entry.
+    :param end: Datetime to measure to. Defaults to each account's last entry.
+    :return: 1D array over c.store.names. NaN where the start and end values are not both positive or span no time.
+    """
+    c._require_all()
+    store = c.store
+    n = store.n_dates
+    columns = np.arange(store.n_accounts)
+    any_entry = store.present.any(axis=0)
+    if start is None:
+        first_row = np.argmax(store.present, axis=0)
+        start_values = store.values[first_row, columns]
+        start_days = store.ordinals[first_row]
+    else:
+        start_values = value_matrix(c, [start], convert=False)[0]
+        start_days = np.full(store.n_accounts, start.toordinal())
+    if end is None:
+        last_row = n - 1 - np.argmax(store.present[::-1], axis=0)
+        end_values = store.values[last_row, columns]
+        end_days = store.ordinals[last_row]
+    else:
+        end_values = value_matrix(c, [end], convert=False)[0]
+        end_days = np.full(store.n_accounts, end.toordinal())
+
+    years = (end_days - start_days) / DAYS_PER_YEAR
+    valid = any_entry & (start_values > 0) & (end_values > 0) & (years > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        growth = (end_values / start_values) ** (1 / years) - 1
+    return np.where(valid, growth, np.nan)
+
+
+def _rolling_sum(values, window):
+    """
+    Sum of each trailing window of rows, from a cumulative sum.
+    :return: Array the shape of values, with the first window - 1 rows NaN
+    """
+    cumulative = np.cumsum(values, axis=0)
+    result = np.full(values.shape, np.nan)
+    if window <= len(values):
+        result[window - 1] = cumulative[window - 1]
+        result[window:] = cumulative[window:] - cumulative[:-window]
+    return result
+
+
+def rolling_mean(values, window=DEFAULT_WINDOW):
+    """
+    Mean of each trailing window of rows, for every column at once.
+    :param values: (dates x accounts) array on an evenly spaced date axis
+    :param window: Number of rows in each window
+    :return: Array the shape of values. NaN until a full window is available, or where the window holds a NaN.
+    """
+    assert window >= 1, f"Window must be at least 1, not {window}."
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    sums = _rolling_sum(np.where(missing, 0.0, values), window)
+    gaps = _rolling_sum(missing.astype(np.float64), window)
+    return np.where(gaps > 0, np.nan, sums / window)
+
+
+def rolling_volatility(values, window=DEFAULT_WINDOW):
+    """
+    Standard deviation of the row to row changes within each trailing window of rows, for every column at once.
+    :param values: (dates x accounts) array on an evenly spaced date axis
+    :param window: Number of changes in each window
+    :return: Array the shape of values. NaN until a full window is available, or where the window holds a NaN.
+    """
+    assert window >= 2, f"Window must be at least 2, not {window}."
+    values = np.asarray(values, dtype=np.float64)
+    changes = np.full(values.shape, np.nan)
+    changes[1:] = np.diff(values, axis=0)
+    missing = np.isnan(changes)
+    # Centre each column first, so the sums of squares stay small and the subtraction below stays accurate
+    centred = np.where(missing, 0.0, changes - np.nanmean(changes, axis=0) if (~missing).any() else changes)
+    sums = _rolling_sum(centred, window)
+    squares = _rolling_sum(centred ** 2, window)
+    gaps = _rolling_sum(missing.astype(np.float64), window)
+    variance = np.maximum(squares - sums ** 2 / window, 0) / (window - 1)
+    return np.where(gaps > 0, np.nan, np.sqrt(variance))
+
+
+def rolling_stats(c, window=DEFAULT_WINDOW, method=DEFAULT_INTERPOLATION):
+    """
+    Rolling mean and volatility of every account over its daily values, in the reporting currency.
+    :param c: Context
+    :param window: Window length in days
+    :param method: Interpolation method for the days between entries
+    :return: (daily dates, rolling mean, rolling volatility) with the arrays (days x accounts)
+    """
+    dates = c.daily_dates()
+    values = value_matrix(c, dates, method)
+    return dates, rolling_mean(values, window), rolling_volatility(values, window)
+
+
+def period_end_dates(c, period="year"):
+    """
+    :param c: Context
+    :param period: Period length from rollups.PERIODS
+    :return: The last date of the Context in each period that has one
+    """
+    assert period in PERIODS, f"Invalid period {period}. Must be from: {PERIODS}"
+    groups = month_ids(c.store.ordinals) // PERIOD_MONTHS[period]
+    last_rows = np.nonzero(np.append(groups[1:] != groups[:-1], True))[0] if len(groups) else []
+    return [c.all_dates[x] for x in last_rows]
+
+
+def contributions(c, dates=None, period="year", total="Total Worth"):
+    """
+    Split the change in a total between consecutive dates into the contribution of each account. Accounts are
+    counted the way the totals count them (no entry counts as zero, converted to the reporting currency and
+    weighted by account type), so each row of contributions adds up to the change in the total.
+    :param c: Context
+    :param dates: Sorted datetimes to measure between. Defaults to the last date of each period.
+    :param period: Period length from rollups.PERIODS, used when dates is not given
+    :param total: Name of the total, from the Context total weightings
+    :return: (dates, contributions) with contributions a (len(dates) - 1 x accounts) array in the order of
+    c.store.names, NaN for changes to or from dates outside the span of the Context
+    """
+    c._require_all()
+    store = c.store
+    weightings = c._totals_weightings or {}
+    if total not in weightings:
+        from data_handler import TOTAL_WEIGHTINGS
+        weightings = TOTAL_WEIGHTINGS
+    assert total in weightings, f"Unknown total {total}. Must be from: {list(weightings)}"
+    weights = np.array([weightings[total].get(x.lower(), 0) for x in store.types], dtype=np.float64)
+    weighted = store.values * _conversion_matrix(c, store.ordinals) * weights
+
+    if dates is None:
+        dates = period_end_dates(c, period)
+    query = to_ordinals(dates).astype(np.float64)
+    ordinals = store.ordinals
+    if not len(ordinals):
+        return dates, np.full((max(len(dates) - 1, 0), store.n_accounts), np.nan)
+    # Totals are linear between the dates of the Context, so the accounts are too
+    row = np.clip(np.searchsorted(ordinals, query, side="right") - 1, 0, max(store.n_dates - 2, 0))
+    following = np.minimum(row + 1, store.n_dates - 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.where(following > row, (query - ordinals[row]) / (ordinals[following] - ordinals[row]), 0.0)
+    at_dates = weighted[row] + t[:, None] * (weighted[following] - weighted[row])
+    # Like the totals, nothing is extrapolated past the first and last dates
+    at_dates[(query < ordinals[0]) | (query > ordinals[-1])] = np.nan
+
+    return dates, np.diff(at_dates, axis=0)
@@ -0,0 +1,169 @@
+"""
+Start up benchmark for the command line tools.
+
+Every measurement runs in a fresh interpreter, so it includes everything a user waits for before the programme does
+any work. For each command the wall clock time is taken over several runs, and `python -X importtime` is used to break
+the import time down by module.
+
+Usage (from the repository root):
+    python benchmarks/startup.py
+    python benchmarks/startup.py --data Data/latest_data.csv --json startup.json
+    python benchmarks/startup.py --compare startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_REPEATS = 7
+DEFAULT_TOP_MODULES = 10
+# A command is reported as a regression when its median is this much slower than in the compared results
+REGRESSION_THRESHOLD = 0.2
+
+# name: python arguments
+COMMANDS = {"import data_handler": ["-c", "import data_handler"],
+            "import inspect_data": ["-c", "import inspect_data"],
+            "import plotter": ["-c", "import plotter"],
+            "plotter --help": ["plotter.py", "--help"],
+            "inspect_data --help": ["inspect_data.py", "--help"],
+            # With no requests on stdin the client never connects, so this is its start up alone
+            "inspect_data -a query": ["inspect_data.py", "-a", "query"]}
+
+
+def parse_args():
+    """
+    Wrapper for argparse.
+    :return: command line arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--data", help="Also time loading this data file (with its report)")
+    parser.add_argument("-r", "--repeats", help="Runs per command", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("-n", "--top", help="Slowest imports to list per command", type=int,
+                        default=DEFAULT_TOP_MODULES)
+    parser.add_argument("-j", "--json", help="Write the results to this file")
+    parser.add_argument("-c", "--compare", help="Compare against results previously written with --json")
+
+    return parser.parse_args()
+
+
+def _run(python_args, env=None):
+    """
+    Run python in the repository root.
+    :return: CompletedProcess with stderr captured
+    """
+    return subprocess.run([sys.executable] + python_args, cwd=REPO_ROOT, env=env, stdin=subprocess.DEVNULL,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+
+
+def time_command(python_args, repeats):
+    """
+    Wall clock time of a command in a fresh interpreter.
+    :param python_args: Arguments to python
+    :param repeats: Number of runs
+    :return: Dictionary of median, min and max seconds
+    """
+    # One run first so every timed run sees a warm disk cache and compiled bytecode
+    _run(python_args)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _run(python_args)
+        times.append(time.perf_counter() - start)
+
+    return {"median": statistics.median(times), "min": min(times), "max": max(times)}
+
+
+def import_breakdown(python_args, top):
+    """
+    Break the imports of a command down by module with -X importtime.
+    :param python_args: Arguments to python
+    :param top: Number of modules to return
+    :return: Dictionary of total import seconds and the slowest modules as [name, self seconds, cumulative seconds]
+    """
+    result = _run(["-X", "importtime"] + python_args)
+    modules = []
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Top level imports are not indented, and their cumulative times add up to the total
+        if not name[1:].startswith(" "):
+            total += int(cumulative_us)
+        modules.append([name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6])
+
+    modules.sort(key=lambda x: x[2], reverse=True)
+    return {"total": total / 1e6, "slowest": modules[:top]}
+
+
+def run_benchmarks(data_path=None, repeats=DEFAULT_REPEATS, top=DEFAULT_TOP_MODULES):
+    """
+    :param data_path: Optional data file to time loading
+    :param repeats: Runs per command
+    :param top: Slowest imports to list per command
+    :return: Dictionary of command name to results
+    """
+    commands = dict(COMMANDS)
+    if data_path:
+        commands["load data"] = ["-c", "import sys, data_handler; data_handler.initialise_context(sys.argv[1])",
+                                 os.path.abspath(data_path)]
+
+    results = {}
+    for name, python_args in commands.items():
+        results[name] = {"wall": time_command(python_args, repeats), "imports": import_breakdown(python_args, top)}
+
+    return results
+
+
+def print_results(results, previous=None):
+    """
+    Print the results, with the change from previous results if given.
+    :param results: Output of run_benchmarks
+    :param previous: Optional earlier output of run_benchmarks
+    :return: List of the names of commands that have regressed
+    """
+    regressions = []
+    for name, result in results.items():
+        wall = result["wall"]
+        line = f"{name:<22} median {wall['median'] * 1000:8.1f} ms  (min {wall['min'] * 1000:.1f}, " \
+               f"max {wall['max'] * 1000:.1f})  imports {result['imports']['total'] * 1000:8.1f} ms"
+        if previous and name in previous:
+            before = previous[name]["wall"]["median"]
+            change = (wall["median"] - before) / before
+            line += f"  {change:+.0%}"
+            if change > REGRESSION_THRESHOLD:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+        for module, self_time, cumulative in result["imports"]["slowest"]:
+            print(f"    {module:<50} {cumulative * 1000:8.1f} ms  (self {self_time * 1000:.1f})")
+
+    return regressions
+
+
+def main(args):
+    """
+    Script entry with arguments from parseargs.
+    :param args: Parseargs executed.
+    :return: Exit code, 1 if anything regressed against --compare
+    """
+    results = run_benchmarks(args.data, args.repeats, args.top)
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+    regressions = print_results(results, previous)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"python": sys.version, "platform": sys.platform, "results": results}, f, indent=2)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,266 @@
+"""
+Benchmark suite for the main data operations, run against a generated history.
+
+Each scenario is set up afresh for every run and only the operation itself is timed. Peak memory comes from a separate
+run under tracemalloc, so that tracing does not slow down the timed runs.
+
+Usage (from the repository root):
+    python benchmarks/suite.py
+    python benchmarks/suite.py --accounts 200 --dates 5000 --sparsity 0.5 --json before.json
+    python benchmarks/suite.py --accounts 200 --dates 5000 --sparsity 0.5 --compare before.json
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_handler import Context, OUTPUT_DATE_FORMAT, CHECK_DATE_FORMATS
+from downsample import downsample
+from interpolation import INTERPOLATION_METHODS
+from account_store import to_ordinals
+import analytics
+import exporters
+import inspect_data
+import plotter
+import projection
+from synthetic import generate_history, write_history, parse_type_mix, LAYOUTS
+
+DEFAULT_REPEATS = 5
+# Points per series for the plot data preparation, about one per pixel of a full screen figure
+PLOT_POINTS = 1600
+# A scenario is reported as a regression when its median is this much slower than in the compared results
+REGRESSION_THRESHOLD = 0.2
+
+
+def _load(path):
+    return Context(path, use_snapshot=False, use_journal=False)
+
+
+def _loaded(path):
+    c = _load(path)
+    c.generate_totals()
+    return c
+
+
+def setup_load_csv(path, work_dir):
+    return lambda: _load(path)
+
+
+def setup_load_snapshot(path, work_dir):
+    saved_path = os.path.join(work_dir, "snapshot.csv")
+    if not os.path.exists(saved_path):
+        # Saving writes the snapshot alongside the csv
+        _loaded(path).save_to_csv(saved_path, allow_overwrite=True)
+    return lambda: Context(saved_path, use_journal=False)
+
+
+def setup_load_sqlite(path, work_dir):
+    database_path = os.path.join(work_dir, "history.db")
+    if not os.path.exists(database_path):
+        _load(path).save_to_sqlite(database_path)
+    return lambda: Context(database_path)
+
+
+def setup_generate_totals(path, work_dir):
+    return _load(path).generate_totals
+
+
+def setup_save_to_csv(path, work_dir):
+    c = _loaded(path)
+    saved_path = os.path.join(work_dir, "saved.csv")
+    if os.path.exists(saved_path):
+        os.remove(saved_path)
+    return lambda: c.save_to_csv(saved_path, allow_overwrite=True)
+
+
+def setup_print_all(path, work_dir):
+    c = _loaded(path)
+
+    def _run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            inspect_data._print_all(c)
+    return _run
+
+
+def _setup_export(layout):
+    def _setup(path, work_dir):
+        c = _loaded(path)
+        export_path = os.path.join(work_dir, f"export.{layout}")
+        return lambda: exporters.write_export(c, export_path, layout)
+    return _setup
+
+
+def _setup_interpolation(method):
+    def _setup(path, work_dir):
+        c = _loaded(path)
+        dates = c.daily_dates()
+
+        def _run():
+            for _bc in c.all_accounts.values():
+                _bc.interpolate_values(dates, method)
+        return _run
+    return _setup
+
+
+def setup_plot_prep(path, work_dir):
+    c = _loaded(path)
+    dates = c.all_dates
+    bank_accounts = list(c.all_accounts.values()) + list(c.totals.values())
+
+    def _run():
+        # Everything draw_accounts does for each series before handing it to matplotlib
+        x_axis = to_ordinals(dates)
+        for _bc in bank_accounts:
+            downsample(x_axis, plotter._get_values(c, _bc, dates), PLOT_POINTS)
+    return _run
+
+
+def setup_analytics(path, work_dir):
+    c = _loaded(path)
+
+    def _run():
+        analytics.rolling_stats(c)
+        analytics.annualized_growth(c)
+        analytics.contributions(c, period="month")
+    return _run
+
+
+def setup_projection(path, work_dir):
+    c = _loaded(path)
+    # Ten thousand paths of ten years of monthly steps for every account and both totals
+    return lambda: projection.project(c, seed=0)
+
+
+# name: function of (data file path, scratch directory) returning the operation to time
+SCENARIOS = {"load_csv": setup_load_csv,
+             "load_snapshot": setup_load_snapshot,
+             "load_sqlite": setup_load_sqlite,
+             "generate_totals": setup_generate_totals,
+             "save_to_csv": setup_save_to_csv,
+             "print_all": setup_print_all}
+SCENARIOS.update({f"export_{x}": _setup_export(x) for x in exporters.EXPORT_LAYOUTS})
+SCENARIOS.update({f"interpolate_{x}": _setup_interpolation(x) for x in INTERPOLATION_METHODS})
+SCENARIOS["plot_prep"] = setup_plot_prep
+SCENARIOS["analytics"] = setup_analytics
+SCENARIOS["projection"] = setup_projection
+
+
+def measure(setup, path, work_dir, repeats):
+    """
+    :param setup: Scenario setup function
+    :param path: Data file path
+    :param work_dir: Scratch directory
+    :param repeats: Number of timed runs
+    :return: Dictionary of median, min and max seconds, and peak traced bytes
+    """
+    times = []
+    for _ in range(repeats):
+        run = setup(path, work_dir)
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    run = setup(path, work_dir)
+    gc.collect()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"median": statistics.median(times), "min": min(times), "max": max(times), "peak_bytes": peak}
+
+
+def _commit():
+    """
+    :return: The current git commit, or None outside a git checkout
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args():
+    """
+    Wrapper for argparse.
+    :return: command line arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--accounts", help="Number of accounts", type=int, default=50)
+    parser.add_argument("-d", "--dates", help="Number of dates", type=int, default=2000)
+    parser.add_argument("-s", "--sparsity", help="Fraction of values left blank", type=float, default=0.2)
+    parser.add_argument("-t", "--types", help="Account type mix as type=weight pairs, e.g. current=3,credit=1")
+    parser.add_argument("-f", "--date-format", help="Date format of the file", default=OUTPUT_DATE_FORMAT,
+                        choices=sorted(set(CHECK_DATE_FORMATS + [OUTPUT_DATE_FORMAT])))
+    parser.add_argument("-l", "--layout", help="File layout", choices=LAYOUTS, default="wide")
+    parser.add_argument("--seed", help="Random seed", type=int, default=0)
+    parser.add_argument("-r", "--repeats", help="Timed runs per scenario", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("-b", "--scenarios", help=f"Comma separated scenarios to run, from {list(SCENARIOS)}")
+    parser.add_argument("-j", "--json", help="Write the results to this file")
+    parser.add_argument("-c", "--compare", help="Compare against results previously written with --json")
+
+    return parser.parse_args()
+
+
+def main(args):
+    """
+    Script entry with arguments from parseargs.
+    :param args: Parseargs executed.
+    :return: Exit code, 1 if anything regressed against --compare
+    """
+    names = [x.strip() for x in args.scenarios.split(",")] if args.scenarios else list(SCENARIOS)
+    for name in names:
+        assert name in SCENARIOS, f"Invalid scenario {name}. Must be from: {list(SCENARIOS)}"
+    config = {"accounts": args.accounts, "dates": args.dates, "sparsity": args.sparsity, "types": args.types,
+              "date_format": args.date_format, "layout": args.layout, "seed": args.seed, "repeats": args.repeats}
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if previous["config"] != config:
+            print(f"Warning: {args.compare} was run with a different configuration: {previous['config']}")
+        previous = previous["results"]
+
+    results = {}
+    regressions = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "history.csv")
+        type_mix = parse_type_mix(args.types) if args.types else None
+        history = generate_history(args.accounts, args.dates, args.sparsity, type_mix, seed=args.seed)
+        write_history(path, *history, date_format=args.date_format, layout=args.layout)
+
+        for name in names:
+            result = measure(SCENARIOS[name], path, work_dir, args.repeats)
+            results[name] = result
+            line = f"{name:<22} median {result['median'] * 1000:9.1f} ms  (min {result['min'] * 1000:.1f}, " \
+                   f"max {result['max'] * 1000:.1f})  peak {result['peak_bytes'] / 2 ** 20:8.2f} MiB"
+            if previous and name in previous:
+                change = (result["median"] - previous[name]["median"]) / previous[name]["median"]
+                line += f"  {change:+.0%}"
+                if change > REGRESSION_THRESHOLD:
+                    line += "  REGRESSION"
+                    regressions.append(name)
+            print(line)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"commit": _commit(), "python": sys.version, "platform": sys.platform, "config": config,
+                       "results": results}, f, indent=2)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
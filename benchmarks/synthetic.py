@@ -0,0 +1,138 @@
+"""
+Synthetic account history generator, for benchmarking with realistic sized data files.
+
+Usage (from the repository root):
+    python benchmarks/synthetic.py history.csv --accounts 50 --dates 2000
+    python benchmarks/synthetic.py history.csv -n 200 -d 5000 --sparsity 0.5 --types current=2,credit=1 --layout long
+"""
+import argparse
+import csv
+import datetime as dt
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_handler import ACCOUNT_TYPES, CHECK_DATE_FORMATS, OUTPUT_DATE_FORMAT, WIDE_HEADER, LONG_HEADER
+
+LAYOUTS = ["wide", "long"]
+# Relative number of accounts of each type
+DEFAULT_TYPE_MIX = {"current": 3, "debit": 1, "savings": 3, "credit": 2, "mortgage": 1}
+# Typical starting balance and daily change of each account type, in pounds
+TYPE_SCALES = {"current": (2000, 40),
+               "debit": (500, 20),
+               "savings": (10000, 25),
+               "credit": (800, 30),
+               "mortgage": (150000, 60)}
+
+
+def parse_type_mix(mix_str):
+    """
+    :param mix_str: Comma separated type=weight pairs, e.g. "current=3,credit=1"
+    :return: Dictionary of account type to relative weight
+    """
+    mix = {}
+    for pair in mix_str.split(","):
+        account_type, weight = pair.split("=")
+        assert account_type.strip().lower() in ACCOUNT_TYPES, (f"Invalid account type {account_type}. "
+                                                               f"Must be from: {ACCOUNT_TYPES}")
+        mix[account_type.strip().lower()] = float(weight)
+    return mix
+
+
+def generate_history(n_accounts, n_dates, sparsity=0.0, type_mix=None, step_days=1, end_date=None, seed=0):
+    """
+    Generate a random history of account values. Each account is a random walk scaled for its type, and the dates
+    are evenly spaced, ending yesterday by default so that none of them are in the future.
+    :param n_accounts: Number of accounts
+    :param n_dates: Number of dates
+    :param sparsity: Fraction of values left blank. Every account keeps its first value.
+    :param type_mix: Dictionary of account type to relative weight. Defaults to DEFAULT_TYPE_MIX.
+    :param step_days: Days between dates
+    :param end_date: Last date. Defaults to yesterday.
+    :param seed: Random seed, so that the same arguments always give the same history
+    :return: (dates, names, types, values) with values an (n_dates, n_accounts) array with NaN for blanks
+    """
+    assert 0 <= sparsity < 1, f"Sparsity must be at least 0 and below 1, not {sparsity}."
+    rng = np.random.default_rng(seed)
+    type_mix = type_mix or DEFAULT_TYPE_MIX
+    if end_date is None:
+        end_date = dt.datetime.combine(dt.date.today(), dt.time()) - dt.timedelta(days=1)
+    dates = [end_date - dt.timedelta(days=step_days * x) for x in range(n_dates - 1, -1, -1)]
+
+    mix_types = list(type_mix.keys())
+    weights = np.array([type_mix[x] for x in mix_types], dtype=np.float64)
+    types = [mix_types[x] for x in rng.choice(len(mix_types), size=n_accounts, p=weights / weights.sum())]
+    names = [f"{account_type.title()} {idx}" for idx, account_type in enumerate(types)]
+
+    start = np.array([TYPE_SCALES[x][0] for x in types]) * rng.uniform(0.5, 1.5, n_accounts)
+    step = np.array([TYPE_SCALES[x][1] for x in types]) * np.sqrt(step_days)
+    values = np.abs(start + np.cumsum(rng.normal(0, 1, (n_dates, n_accounts)) * step, axis=0)).round(2)
+    values[rng.random((n_dates, n_accounts)) < sparsity] = np.nan
+    values[0] = np.abs(start).round(2)
+
+    return dates, names, types, values
+
+
+def write_history(path, dates, names, types, values, date_format=OUTPUT_DATE_FORMAT, layout="wide"):
+    """
+    Write a generated history as a data file that read_data_file understands.
+    :param path: Path to write to
+    :param dates: List of datetimes
+    :param names: List of account names
+    :param types: List of account types
+    :param values: (n_dates, n_accounts) array with NaN for blanks
+    :param date_format: strftime format for the dates
+    :param layout: "wide" (one row per account) or "long" (one row per value)
+    :return: None
+    """
+    assert layout in LAYOUTS, f"Invalid layout {layout}. Must be from: {LAYOUTS}"
+    date_strs = [x.strftime(date_format) for x in dates]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        if layout == "wide":
+            writer.writerow(WIDE_HEADER + date_strs)
+            for idx, (name, account_type) in enumerate(zip(names, types)):
+                writer.writerow([name, account_type.title()] + ["" if np.isnan(x) else f"{x:.2f}"
+                                                                for x in values[:, idx]])
+        else:
+            writer.writerow(LONG_HEADER)
+            for date_idx, idx in zip(*np.nonzero(~np.isnan(values))):
+                writer.writerow([date_strs[date_idx], names[idx], types[idx].title(), f"{values[date_idx, idx]:.2f}"])
+
+
+def parse_args():
+    """
+    Wrapper for argparse.
+    :return: command line arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output", help="Path of the data file to write")
+    parser.add_argument("-n", "--accounts", help="Number of accounts", type=int, default=20)
+    parser.add_argument("-d", "--dates", help="Number of dates", type=int, default=1000)
+    parser.add_argument("-s", "--sparsity", help="Fraction of values left blank", type=float, default=0.0)
+    parser.add_argument("-t", "--types", help="Account type mix as type=weight pairs, e.g. current=3,credit=1")
+    parser.add_argument("-f", "--date-format", help="Date format of the file", default=OUTPUT_DATE_FORMAT,
+                        choices=sorted(set(CHECK_DATE_FORMATS + [OUTPUT_DATE_FORMAT])))
+    parser.add_argument("-l", "--layout", help="File layout", choices=LAYOUTS, default="wide")
+    parser.add_argument("--step-days", help="Days between dates", type=int, default=1)
+    parser.add_argument("--seed", help="Random seed", type=int, default=0)
+
+    return parser.parse_args()
+
+
+def main(args):
+    """
+    Script entry with arguments from parseargs.
+    :param args: Parseargs executed.
+    :return: None
+    """
+    type_mix = parse_type_mix(args.types) if args.types else None
+    history = generate_history(args.accounts, args.dates, args.sparsity, type_mix, args.step_days, seed=args.seed)
+    write_history(args.output, *history, date_format=args.date_format, layout=args.layout)
+    print(f"Wrote {args.accounts} accounts on {args.dates} dates to {args.output}")
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,393 @@
+import io
+import json
+import math
+import os
+import signal
+import socket
+import sys
+
+from journal import JOURNAL_SUFFIX, encode_date, decode_date
+
+# The socket sits next to the data file, e.g. files/inspect_data.sock
+DAEMON_SOCKET_NAME = "inspect_data.sock"
+# Socket of the daemon serving the main data file, in data_handler.DATA_DIRECTORY. Worked out here so that the client
+# does not need data_handler, or numpy, to find it.
+DEFAULT_SOCKET_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "files", DAEMON_SOCKET_NAME)
+# Seconds between checks of the data file for changes
+WATCH_INTERVAL = 1.0
+# Longest request line accepted, in bytes
+MAX_REQUEST_BYTES = 1 << 20
+# Seconds a client waits for an answer
+CLIENT_TIMEOUT = 30
+REPORT_KINDS = ["quick", "date", "period"]
+
+
+def socket_path_for(data_path):
+    """
+    :param data_path: Path to a data file
+    :return: Path of the socket a daemon serving that file listens on
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(data_path)), DAEMON_SOCKET_NAME)
+
+
+def _file_state(data_path):
+    """
+    :param data_path: Path to a data file
+    :return: (size, mtime_ns) of the data file and of every file alongside it that changes what is loaded from it (the
+    journal, a SQLite write-ahead log and the exchange rates), None for each that does not exist
+    """
+    # fx needs numpy, which the client side of this module does without
+    from fx import FX_FILE_NAME
+    states = []
+    for path in [data_path, data_path + JOURNAL_SUFFIX, data_path + "-wal",
+                 os.path.join(os.path.dirname(data_path), FX_FILE_NAME)]:
+        try:
+            stat = os.stat(path)
+            states.append((stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            states.append(None)
+    return tuple(states)
+
+
+def _number(value):
+    """
+    :return: value as a float, None for missing or NaN (which JSON has no way of writing)
+    """
+    return None if value is None or math.isnan(value) else float(value)
+
+
+class QueryError(ValueError):
+    """
+    Raised by DaemonClient when the daemon could not answer a query.
+    """
+
+
+class QueryServer(object):
+    """
+    Holds a Context in memory and answers queries about it over a Unix domain socket, so that scripts asking many
+    small questions pay for loading the data once rather than on every call.
+
+    The protocol is one JSON object per line in each direction. A request names its query and any arguments, with
+    dates written as 2020-01-31, e.g. {"query": "value", "account": "Savings", "date": "2020-01-31"}. The reply is
+    {"ok": true, "result": ...} or {"ok": false, "error": "..."}, carrying the request's "id" if it had one. Any number
+    of requests can be sent over one connection, and any number of clients can be connected at once.
+
+    The data file is checked for changes every watch_interval seconds. A changed file is loaded in a worker thread
+    while queries carry on being answered from the old Context, which is then swapped for the new one.
+    """
+    def __init__(self, data_path, socket_path=None, watch_interval=WATCH_INTERVAL):
+        """
+        :param data_path: Path to the data file to serve
+        :param socket_path: Path to listen on. Defaults to socket_path_for(data_path).
+        :param watch_interval: Seconds between checks of the data file for changes
+        """
+        self.data_path = data_path
+        self.socket_path = socket_path or socket_path_for(data_path)
+        self.watch_interval = watch_interval
+        self.context = None
+        self.reloads = 0
+        self._state = None
+        self._reloading = None
+        # query name: handler taking the request dictionary and returning a JSON-serialisable result
+        self.queries = {"ping": self._ping,
+                        "accounts": self._accounts,
+                        "dates": self._dates,
+                        "value": self._value,
+                        "values": self._values,
+                        "range": self._range,
+                        "totals": self._totals,
+                        "report": self._report,
+                        "reload": self._reload}
+
+    def _load(self):
+        """
+        Load the data file. Runs in a worker thread.
+        :return: (state of the files when loading started, Context)
+        """
+        # Only the daemon itself needs the data handling, the client side of this module stays light
+        from data_handler import initialise_context
+        state = _file_state(self.data_path)
+        return state, initialise_context(self.data_path, report=False)
+
+    async def reload(self):
+        """
+        Load the data file again, unless a reload is already under way in which case wait for that one.
+        :return: None
+        """
+        import asyncio
+        if self._reloading is None:
+            self._reloading = asyncio.get_running_loop().run_in_executor(None, self._load)
+            try:
+                self._state, self.context = await self._reloading
+                self.reloads += 1
+            finally:
+                self._reloading = None
+        else:
+            await asyncio.shield(self._reloading)
+
+    async def _watch(self):
+        import asyncio
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            if _file_state(self.data_path) != self._state:
+                try:
+                    await self.reload()
+                except Exception as e:
+                    # Most likely caught part way through a write. Keep serving the old data and try again next time.
+                    print(f"Could not reload {self.data_path}: {e}")
+
+    def _account(self, name):
+        """
+        :param name: Name of an account or a total
+        :return: The BankAccount
+        """
+        c = self.context
+        for key in [name, str(name).title()]:
+            if key in c.totals:
+                return c.totals[key]
+            if key in c.all_accounts:
+                return c.all_accounts[key]
+        raise KeyError(f"Unknown account {name}.")
+
+    def _ping(self, request):
+        c = self.context
+        return {"accounts": len(c.all_accounts), "dates": len(c.all_dates), "reloads": self.reloads}
+
+    def _accounts(self, request):
+        return [{"name": _bc.name, "type": _bc.type, "currency": _bc.currency, "entries": _bc.count_entries()}
+                for _bc in self.context.all_accounts.values()]
+
+    def _dates(self, request):
+        return [encode_date(x) for x in self.context.all_dates]
+
+    def _value(self, request):
+        """
+        {"account", "date", "interp" (optional), "method" (optional)}: the value on a date, null if there is none
+        """
+        args = {"method": request["method"]} if "method" in request else {}
+        return self._account(request["account"]).get_value_on_date(decode_date(request["date"]),
+                                                                    bool(request.get("interp")), **args)
+
+    def _values(self, request):
+        """
+        {"account", "dates", "method" (optional)}: values on many dates at once, interpolated between entries
+        """
+        args = {"method": request["method"]} if "method" in request else {}
+        values = self._account(request["account"]).interpolate_values([decode_date(x) for x in request["dates"]],
+                                                                       **args)
+        return [_number(x) for x in values]
+
+    def _range(self, request):
+        """
+        {"account", "start", "end"}: the entries from start to end, inclusive
+        """
+        _bc = self._account(request["account"])
+        # The dates are sorted, so the range is one slice found with two binary searches
+        ordinals = _bc._store.ordinals
+        first = int(ordinals.searchsorted(decode_date(request["start"]).toordinal(), side="left"))
+        after = int(ordinals.searchsorted(decode_date(request["end"]).toordinal(), side="right"))
+        present = _bc.present[first:after]
+        dates = _bc.dates[first:after]
+        return {"dates": [encode_date(d) for d, p in zip(dates, present) if p],
+                "values": _bc.values[first:after][present].tolist()}
+
+    def _totals(self, request):
+        """
+        {"date", "interp" (optional)}: every total on a date
+        """
+        date = decode_date(request["date"])
+        return {name: _bc.get_value_on_date(date, bool(request.get("interp")))
+                for name, _bc in self.context.totals.items()}
+
+    def _report(self, request):
+        """
+        {"kind": one of REPORT_KINDS, "date" for a date report, "period" for a period report}: the report text
+        """
+        kind = request.get("kind", "quick")
+        assert kind in REPORT_KINDS, f"Invalid report {kind}. Must be from: {REPORT_KINDS}"
+        # Written into a buffer of its own rather than by redirecting stdout, which would also catch anything printed by
+        # a reload running in another thread
+        buffer = io.StringIO()
+        if kind == "quick":
+            self.context.quick_report(out=buffer)
+        elif kind == "date":
+            self.context.date_report(decode_date(request["date"]), bool(request.get("interp")), out=buffer)
+        else:
+            self.context.period_report(request.get("period", "year"), out=buffer)
+        return buffer.getvalue()
+
+    async def _reload(self, request):
+        await self.reload()
+        return self._ping(request)
+
+    async def respond(self, line):
+        """
+        :param line: One request, as a line of JSON
+        :return: The reply, as a line of JSON
+        """
+        import asyncio
+        reply = {}
+        try:
+            request = json.loads(line)
+            assert isinstance(request, dict), "A request must be a JSON object."
+            if "id" in request:
+                reply["id"] = request["id"]
+            query = request.get("query")
+            assert query in self.queries, f"Invalid query {query}. Must be from: {list(self.queries)}"
+            result = self.queries[query](request)
+            if asyncio.iscoroutine(result):
+                result = await result
+            reply.update(ok=True, result=result)
+        except (ValueError, AssertionError, KeyError, TypeError, OSError, RuntimeError) as e:
+            reply.update(ok=False, error=str(e.args[0]) if isinstance(e, KeyError) and e.args else str(e))
+        return (json.dumps(reply) + "\n").encode()
+
+    async def _serve_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(b'{"ok": false, "error": "Request too long."}\n')
+                    break
+                if not line:
+                    break
+                writer.write(await self.respond(line))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Left behind by a daemon that did not shut down cleanly
+            os.remove(self.socket_path)
+        else:
+            raise RuntimeError(f"A daemon is already serving on {self.socket_path}.")
+        finally:
+            probe.close()
+
+    async def serve(self):
+        """
+        Load the data and answer queries until cancelled or sent SIGTERM.
+        :return: None
+        """
+        import asyncio
+        await self.reload()
+        self._remove_stale_socket()
+        server = await asyncio.start_unix_server(self._serve_client, path=self.socket_path, limit=MAX_REQUEST_BYTES)
+        watcher = asyncio.ensure_future(self._watch())
+        serving = asyncio.ensure_future(server.serve_forever())
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, serving.cancel)
+        print(f"Serving {self.data_path} on {self.socket_path}")
+        try:
+            await serving
+        except asyncio.CancelledError:
+            pass
+        finally:
+            watcher.cancel()
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def run(self):
+        """
+        Serve from the command line until interrupted. asyncio is only imported here, on the server side.
+        :return: None
+        """
+        import asyncio
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+
+class DaemonClient(object):
+    """
+    A connection to a QueryServer. Keep one open to ask many questions, each costs a single round trip.
+    """
+    def __init__(self, socket_path, timeout=CLIENT_TIMEOUT):
+        """
+        :param socket_path: Path the daemon is listening on
+        :param timeout: Seconds to wait for each answer
+        """
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(socket_path)
+        except OSError:
+            self._socket.close()
+            raise
+        self._file = self._socket.makefile("rwb")
+
+    def send(self, request):
+        """
+        :param request: Request dictionary
+        :return: Reply dictionary
+        """
+        self._file.write((json.dumps(request) + "\n").encode())
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("The daemon closed the connection.")
+        return json.loads(line)
+
+    def query(self, query, **fields):
+        """
+        :param query: Query name, e.g. "value"
+        :param fields: Arguments of the query. Dates may be given as datetimes.
+        :return: The result of the query
+        """
+        request = {k: (encode_date(v) if hasattr(v, "strftime") else v) for k, v in fields.items()}
+        reply = self.send(dict(request, query=query))
+        if not reply["ok"]:
+            raise QueryError(reply["error"])
+        return reply["result"]
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+
+def run_client(socket_path, requests):
+    """
+    Send requests to a running daemon and print the replies, one per line. Report text is printed as it is.
+    :param socket_path: Path the daemon is listening on
+    :param requests: Iterable of requests, each a line of JSON
+    :return: Number of requests that failed
+    """
+    client = None
+    failed = 0
+    try:
+        for line in requests:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                print(json.dumps({"ok": False, "error": f"Invalid request: {e}"}))
+                failed += 1
+                continue
+            # Connected on the first request, so with none there is nothing to connect to
+            if client is None:
+                try:
+                    client = DaemonClient(socket_path)
+                except (FileNotFoundError, ConnectionRefusedError):
+                    print(f"No daemon is listening on {socket_path}, start it with -a serve", file=sys.stderr)
+                    return failed + 1
+            reply = client.send(request)
+            if reply["ok"] and isinstance(reply["result"], str):
+                print(reply["result"], end="")
+            else:
+                print(json.dumps(reply))
+            failed += not reply["ok"]
+    finally:
+        if client is not None:
+            client.close()
+    return failed
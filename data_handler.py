@@ -1,29 +1,66 @@
+import array
 import datetime
 import datetime as dt
+import functools
+import glob
+import itertools
+import json
 import os
 import csv
+import sqlite3
+
+import numpy as np
+
+from account_store import AccountStore, parse_value, format_value, to_ordinals
+from interpolation import interpolate, DEFAULT_INTERPOLATION
+from snapshot import read_snapshot, write_snapshot
+from journal import Journal, encode_date, decode_date
+from row_index import read_row_index, read_row, write_row_index
+from file_signature import file_signature, signature_matches
+from profiling import timed, counted
+from fx import RateTable, format_money, BASE_CURRENCY, FX_FILE_NAME, FX_HEADER
+from rollups import RollupPyramid
+from storage import SqliteStorage, storage_backend, SQLITE_FILE_NAME
 
 ACCOUNT_TYPES = ["current",
                  "debit",
                  "savings",
                  "credit",
                  "mortgage"]
-# List of date formats to expect. This is used to avoid confusion for d-m and m-d formatting
+# List of date formats to expect. This is used to avoid confusion for d-m and m-d formatting. d-m is listed first so it
+# wins for a single ambiguous value. Whole columns are checked together by sniff_date_format.
 CHECK_DATE_FORMATS = ["%d-%m-%y",
                       "%d-%b-%y",
-                      "%d-%b-%Y"]
+                      "%d-%b-%Y",
+                      "%m-%d-%y"]
+# Number of distinct (date string, format) pairs kept by the date parser
+DATE_CACHE_SIZE = 4096
+# Header layouts accepted by read_data_file. Either may also have a "Currency" column, which in wide files comes
+# straight after the type. Files where every account is in the base currency are written without it.
+WIDE_HEADER = ["Account", "Type"]
+LONG_HEADER = ["Date", "Account", "Type", "Value"]
+# Number of rows of a long-format file used to detect its date format
+LONG_FORMAT_SNIFF_ROWS = 1000
 OUTPUT_DATE_FORMAT = "%d-%b-%Y"
+# How each account type contributes to each of the calculated totals. Types missing from a total are left out of it.
+TOTAL_WEIGHTINGS = {"Total Money": {"current": 1, "debit": 1, "savings": 1, "credit": -1},
+                    "Total Worth": {"current": 1, "debit": 1, "savings": 1, "credit": -1, "mortgage": -1}}
+# Operations accepted by Context.apply_edits, and the columns of an edits csv (see read_edit_file)
+EDIT_OPERATIONS = ["add_account", "remove_account", "add_date", "remove_date", "set_value"]
+EDIT_HEADER = ["Operation", "Account", "Type", "Currency", "Date", "Value"]
 DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), "files")
 SAVE_FILE_NAME = "latest_data.csv"
 
 
 class BankAccount(object):
     """
-    A class that contains information about a single bank account.
+    A class that contains information about a single bank account. Values are not held on the account itself, it is a
+    view onto a single column of an AccountStore. A newly created account owns a private store until it is added to a
+    Context, at which point it becomes a view onto the shared Context store.
     """
-    def __init__(self, account_name, account_type, currency="GBP"):
+    def __init__(self, account_name, account_type, currency=BASE_CURRENCY):
         """
-        Each instance has a name and an assumed currency of GBP
+        Each instance has a name and a currency, GBP unless given
         :param account_name: Display name for the account in any summaries and graphs
         :param account_type: Type of bank account from ACCOUNT_TYPES.
         :param currency: Currency to be associated with any values.
@@ -34,39 +71,72 @@ class BankAccount(object):
         self.type = account_type.title()
         self.currency = currency
 
-        # Historical values over time are stored in a dictionary
-        self.history = {}
+        # Historical values over time are stored in a column of an AccountStore
+        self._store = AccountStore()
+        self._store.add_account(self.name, self.type, self.currency)
 
-    def _interpolate_value(self, date):
+    @property
+    def dates(self):
+        """
+        All dates on the date axis of the underlying store.
+        """
+        return self._store.dates
+
+    @property
+    def values(self):
+        """
+        Array of values over the date axis. Missing entries are 0.
+        """
+        return self._store.column(self.name)[0]
+
+    @property
+    def present(self):
+        """
+        Boolean array over the date axis. True where there is an entry.
+        """
+        return self._store.column(self.name)[1]
+
+    def interpolate_values(self, dates, method=DEFAULT_INTERPOLATION):
+        """
+        Estimate the bank account value on many dates in one call. Dates with an entry return that entry.
+        :param dates: List of date or datetime objects
+        :param method: Interpolation method from interpolation.INTERPOLATION_METHODS
+        :return: numpy array of values. NaN where a date is outside the span of the account's entries.
+        """
+        present = self.present
+        return interpolate(self._store.ordinals[present], self.values[present], to_ordinals(dates), method)
+
+    def _interpolate_value(self, date, method=DEFAULT_INTERPOLATION):
         """
         Interpolate the bank account value at a given date.
         :param date: Datetime object for the requested date
-        :return: Value at date
+        :param method: Interpolation method from interpolation.INTERPOLATION_METHODS
+        :return: Value at date, or None if the date is outside the span of the account's entries
         """
-        # TODO implement a rational interpolation function
-        t = 1
+        value = self.interpolate_values([date], method)[0]
+        if np.isnan(value):
+            return None
+        return float(value)
 
-    def get_value_on_date(self, date, interp=False):
+    @counted("BankAccount.get_value_on_date")
+    def get_value_on_date(self, date, interp=False, method=DEFAULT_INTERPOLATION):
         """
         Return the value within the bank account on a given date. If interp is False, and there is not an entry for that date,
         then the function will return None
         :param date: Datetime object for the requested date
         :param interp: If the date is not preset, should one be interpolated.
+        :param method: Interpolation method used when interp is True.
         :return: value on the date
         """
-        if not interp and date.strftime(OUTPUT_DATE_FORMAT) not in self.history.keys():
-            return ""
-        elif interp and date.strftime(OUTPUT_DATE_FORMAT) not in self.history.keys():
-            return self._interpolate_value(date)
-        elif date.strftime(OUTPUT_DATE_FORMAT) in self.history.keys():
-            return self.history[date.strftime(OUTPUT_DATE_FORMAT)]
-        else:
-            return None
+        value = self._store.get_value(self.name, date)
+        if value is None and interp:
+            return self._interpolate_value(date, method)
+        return value
 
     def add_entry(self, value, date):
         """
         Create a new entry for a given date
-        :param value: Account value
+        :param value: Account value. A blank string or None removes any existing entry.
         :param date: Date for the associated value.
         :return: None
         """
@@ -74,79 +144,435 @@ class BankAccount(object):
             date_object = handle_date_string(date)
         else:
             date_object = date
-        date_str = dt.datetime.strftime(date_object, OUTPUT_DATE_FORMAT)
 
-        self.history[date_str] = value
+        self._store.set_value(self.name, date_object, parse_value(value))
+
+    def count_entries(self):
+        """
+        :return: The number of dates which hold a real entry for this account.
+        """
+        return int(self.present.sum())
 
     def print_status(self):
         """
         Report the intertnal state of the bank account.
         :return: None
         """
-        for date in self.history.keys():
-            v = self.history[date]
-            if v == "":
-                v = 0
-            print("    {} : £{:.2f}".format(date, float(v)))
+        for date, v in zip(self.dates, self.values):
+            print("    {} : {}".format(date.strftime(OUTPUT_DATE_FORMAT), format_money(v, self.currency)))
+
+
+class AccountDict(dict):
+    """
+    Dictionary of account name to BankAccount which can also hold accounts that have not been read from disk yet.
+    Looking up a deferred account loads it. Walking the dictionary (keys, values, items, iteration) loads everything
+    first, so code that visits all accounts always sees the full set in file order.
+    """
+    def __init__(self):
+        super().__init__()
+        self._pending = {}
+        self._order = []
+        self._loader = None
+
+    def defer(self, names, loader):
+        """
+        Register accounts to be loaded on first access.
+        :param names: Account names, in file order
+        :param loader: Function taking an account name and returning its BankAccount
+        :return: None
+        """
+        self._order = list(names)
+        self._pending = dict.fromkeys(x for x in names if not dict.__contains__(self, x))
+        self._loader = loader
+
+    @property
+    def pending(self):
+        """
+        Names of the accounts not loaded yet.
+        """
+        return list(self._pending)
+
+    def loaded_items(self):
+        """
+        (name, BankAccount) pairs for the accounts loaded so far, without loading any others.
+        """
+        return list(dict.items(self))
+
+    def _load(self, key):
+        del self._pending[key]
+        account = self._loader(key)
+        dict.__setitem__(self, key, account)
+        return account
+
+    def load_all(self):
+        """
+        Load every deferred account.
+        :return: None
+        """
+        if not self._pending:
+            return
+        for key in list(self._pending):
+            self._load(key)
+        ordered = [(x, dict.__getitem__(self, x)) for x in self._order if dict.__contains__(self, x)]
+        ordered.extend((k, v) for k, v in dict.items(self) if k not in self._order)
+        dict.clear(self)
+        dict.update(self, ordered)
+
+    def __missing__(self, key):
+        if key in self._pending:
+            return self._load(key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self._pending
+
+    def __len__(self):
+        return dict.__len__(self) + len(self._pending)
+
+    def __delitem__(self, key):
+        if key in self._pending:
+            del self._pending[key]
+        else:
+            dict.__delitem__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        self.load_all()
+        return dict.__iter__(self)
+
+    def keys(self):
+        self.load_all()
+        return dict.keys(self)
 
+    def values(self):
+        self.load_all()
+        return dict.values(self)
+
+    def items(self):
+        self.load_all()
+        return dict.items(self)
 
 
 class Context(object):
     """
     Wrapper for the full programme content at run-time. Handles loading and saving of data.
     """
-    TOTAL_NAMES = ["Total Money", "Total Worth"]
-    def __init__(self, historical, populate=True):
+    TOTAL_NAMES = list(TOTAL_WEIGHTINGS.keys())
+    def __init__(self, historical, populate=True, use_snapshot=True, use_journal=True, accounts=None, fx_rates=None,
+                 reporting_currency=None):
         """
         Establish programme context
         :param historical: absolute filepath to a previous data export
+        :param populate: Load the data in the file
+        :param use_snapshot: Load from the binary snapshot of the file when it is up to date
+        :param use_journal: Replay any edits journaled against the file, and journal new edits
+        :param accounts: Optional list of account names. If given, only these accounts are read from the file up front
+        and the rest are read the first time they are accessed.
+        :param fx_rates: Optional RateTable, needed if any account is not in the reporting currency.
+        :param reporting_currency: Currency the totals are calculated in. Defaults to the base currency of fx_rates.
         """
         # A tag to track if there is any change during runtime
         self.updated_this_run = False
+        # Change tracking. mutation_count counts edits made this run. The dirty sets describe how the data differs from
+        # the file it was loaded from (which includes any journaled edits replayed on load).
+        self.mutation_count = 0
+        self.dirty_accounts = set()
+        self.dirty_dates = set()
+        self.axis_changed = False
+        self._source = None
 
         assert os.path.exists(historical), f"Given historical data filepath ({historical}) does not exist."
-        self.all_accounts = {}
-        if populate:
-            self._load_historical(historical)
+        # Every account value lives in one columnar store. The BankAccount objects in all_accounts are views onto it.
+        self.store = AccountStore()
+        self.all_accounts = AccountDict()
         self.totals = {}
+        self._totals_store = None
+        self._totals_weightings = None
+        # Monthly, quarterly and yearly aggregates of the accounts and the totals, built the first time they are needed
+        self._rollups = None
+        self._totals_rollups = None
+        self.fx_rates = fx_rates
+        self.reporting_currency = reporting_currency or (fx_rates.base_currency if fx_rates else BASE_CURRENCY)
+        # Edits made through the Context methods are appended here rather than rewriting the whole file
+        self.journal = None
+        # For data loaded from a SQLite database, the database itself. Edits are written straight into it instead.
+        self.database = None
+        self._row_index = None
+        if populate:
+            if storage_backend(historical) == "sqlite":
+                self._load_database(historical, accounts)
+            elif accounts is not None:
+                self._load_lazy(historical, accounts)
+            elif not (use_snapshot and self._load_snapshot(historical)):
+                self._load_historical(historical)
+            self._source = (historical, file_signature(historical))
+            if use_journal and self.database is None:
+                self.journal = Journal(historical)
+                self._replay_journal()
+            # Replayed edits are not changes made during this run
+            self.mutation_count = 0
+
+    def __getstate__(self):
+        # A database connection cannot be sent to another process. Copies sent to worker processes only read, so
+        # they go without.
+        state = dict(self.__dict__)
+        state["database"] = None
+        return state
+
+    @property
+    def all_dates(self):
+        """
+        The shared, chronologically sorted, date axis of all accounts.
+        """
+        return self.store.dates
+
+    def daily_dates(self):
+        """
+        Every calendar day from the first to the last loaded date.
+        :return: List of datetime objects
+        """
+        if not self.all_dates:
+            return []
+        first = self.all_dates[0]
+        return [first + dt.timedelta(days=x) for x in range((self.all_dates[-1] - first).days + 1)]
+
+    def resample(self, dates, method=DEFAULT_INTERPOLATION):
+        """
+        Estimate every account on a common set of dates, e.g. the grid from daily_dates.
+        :param dates: List of date or datetime objects
+        :param method: Interpolation method from interpolation.INTERPOLATION_METHODS
+        :return: (dates x accounts) numpy array in store column order. NaN where an account has no surrounding entries.
+        """
+        self._require_all()
+        query = to_ordinals(dates)
+        ordinals = self.store.ordinals
+        resampled = np.full((len(query), self.store.n_accounts), np.nan)
+        for col in range(self.store.n_accounts):
+            present = self.store.present[:, col]
+            resampled[:, col] = interpolate(ordinals[present], self.store.values[present, col], query, method)
+
+        return resampled
 
+    @timed("Context._unpack_csv")
     def _unpack_csv(self, abs_path):
         """
-        A general function for unpacking a csv of the expected format into
+        A general function for unpacking a csv of either supported layout (see read_data_file).
         :param abs_path: Absolute path to the csv
-        :return: dates (list of dates), data (dict of account values)
+        :return: dates, names, types, currencies, values. values is a (dates x accounts) array with NaN for no entry.
         """
-        try:
-            with open(abs_path, newline="") as csv_file:
-                read_in = csv.reader(csv_file, delimiter=",")
-                temp_data = {}
-                temp_types = {}
-                for idx, row in enumerate(read_in):
-                    if idx == 0:
-                        dates = row[2:]
-                    else:
-                        temp_data[row[0]] = row[2:]
-                        temp_types[row[0]] = row[1]
-        except:
-            print(f"Something is wrong with {abs_path}")
-            # TODO make this handle exceptions properly
-
-        return dates, temp_data, temp_types
+        return read_data_file(abs_path)
 
+    @timed("Context._load_historical")
     def _load_historical(self, abs_path):
         """
         Update the initial state from the saved state.
         :param abs_path: path to a data set of financial data
         :return: None
         """
-        dates, temp_accout_data, temp_account_types = self._unpack_csv(abs_path)
-        for account in temp_accout_data.keys():
-            _bc = BankAccount(account, temp_account_types[account], "GBP")
-            for date, value in zip(dates, temp_accout_data[account]):
-                _bc.add_entry(value, date)
+        self._load_arrays(*self._unpack_csv(abs_path))
+
+    def _load_arrays(self, dates, names, types, currencies, values):
+        """
+        Fill the store and accounts, from the layout returned by read_data_file.
+        :return: None
+        """
+        present = ~np.isnan(values)
+        self.store.load(dates, names, types, currencies, values, present)
+        for name, account_type, currency in zip(names, types, currencies):
+            _bc = BankAccount(name, account_type, currency)
+            _bc._store = self.store
+            self.all_accounts[_bc.name] = _bc
+
+    @timed("Context._load_database")
+    def _load_database(self, abs_path, accounts=None):
+        """
+        Load from a SQLite database, and write every later edit straight into it.
+        :param abs_path: Path to the database
+        :param accounts: Names of the accounts to load now. The rest are deferred until first accessed. Defaults to
+        loading everything.
+        :return: None
+        """
+        self.database = SqliteStorage(abs_path)
+        if accounts is None:
+            self._load_arrays(*self.database.read())
+            return
+
+        dates = self.database.dates()
+        self.store.load(dates, [], [], [], np.zeros((len(dates), 0)), np.zeros((len(dates), 0), dtype=bool))
+        self.all_accounts.defer(self.database.account_names(), self._load_database_account)
+        for name in accounts:
+            assert name in self.all_accounts, f"{name} is not an account in {abs_path}."
+            self.all_accounts[name]
+
+    def _load_database_account(self, account_name):
+        """
+        Read a single account from the database.
+        :param account_name: Name of the account
+        :return: BankAccount
+        """
+        account_type, currency, ordinals, values = self.database.read_account(account_name)
+        column = np.full(self.store.n_dates, np.nan)
+        column[np.searchsorted(self.store.ordinals, ordinals)] = values
+
+        _bc = BankAccount(account_name, account_type, currency)
+        self.store.add_account(_bc.name, _bc.type, _bc.currency)
+        self.store.set_column(_bc.name, column)
+        _bc._store = self.store
+        return _bc
+
+    @timed("Context._load_lazy")
+    def _load_lazy(self, abs_path, accounts):
+        """
+        Read the date header and only the requested account rows, using the row index to seek straight to each row.
+        Every other account is deferred until it is first accessed. Long-format files have no per-account rows, so
+        they are loaded in full.
+        :param abs_path: path to a data set of financial data
+        :param accounts: Names of the accounts to load now
+        :return: None
+        """
+        self._row_index = read_row_index(abs_path)
+        if self._row_index is None:
+            self._load_historical(abs_path)
+            return
+        self._row_source = abs_path
+
+        with open(abs_path, newline="") as csv_file:
+            header = next(csv.reader(csv_file, delimiter=","))
+        self._row_value_start = _wide_value_start(header)
+        try:
+            dates = parse_date_column(header[self._row_value_start:])
+        except AssertionError as e:
+            raise DataFileError(abs_path, 1, None, str(e))
+        # Rows are in header order, the store is in date order
+        self._row_order = np.argsort(to_ordinals(dates), kind="stable")
+        self.store.load(dates, [], [], [], np.zeros((len(dates), 0)), np.zeros((len(dates), 0), dtype=bool))
+
+        self.all_accounts.defer(self._row_index["rows"].keys(), self._load_account_row)
+        for name in accounts:
+            assert name in self.all_accounts, f"{name} is not an account in {abs_path}."
+            self.all_accounts[name]
+
+    def _load_account_row(self, account_name):
+        """
+        Read a single account from its row in the data file.
+        :param account_name: Name of the account
+        :return: BankAccount
+        """
+        account_type, _, _, row_number = self._row_index["rows"][account_name]
+        row = read_row(self._row_source, self._row_index, account_name)
+        account_type = _check_account_type(self._row_source, row_number, 2, account_type)
+        start = self._row_value_start
+        values = _parse_wide_row(self._row_source, row_number, row[start:], self.store.n_dates, start + 1)
+        currency = (row[2].strip() if start > 2 and len(row) > 2 else "") or BASE_CURRENCY
+
+        _bc = BankAccount(account_name, account_type, currency)
+        self.store.add_account(_bc.name, _bc.type, _bc.currency)
+        self.store.set_column(_bc.name, values[self._row_order])
+        _bc._store = self.store
+        return _bc
+
+    def _require_all(self):
+        """
+        Make sure every account is loaded. Called before anything that works on all accounts or changes the date axis.
+        :return: None
+        """
+        self.all_accounts.load_all()
+
+    @timed("Context._load_snapshot")
+    def _load_snapshot(self, abs_path):
+        """
+        Load the state from the binary snapshot saved alongside a data file, if it is still valid.
+        :param abs_path: path to a data set of financial data
+        :return: True if the snapshot was used
+        """
+        snapshot = read_snapshot(abs_path)
+        if snapshot is None:
+            return False
+
+        self.store.load(snapshot["dates"], snapshot["names"], snapshot["types"], snapshot["currencies"],
+                        snapshot["values"], snapshot["present"])
+        for name, account_type, currency in zip(snapshot["names"], snapshot["types"], snapshot["currencies"]):
+            _bc = BankAccount(name, account_type, currency)
+            _bc._store = self.store
+            self.all_accounts[_bc.name] = _bc
+
+        # Totals are only reused if they were calculated with the current weightings (and exchange rates)
+        if snapshot["totals"] and snapshot["totals_key"] == self._totals_key(TOTAL_WEIGHTINGS):
+            self._set_totals(TOTAL_WEIGHTINGS, np.column_stack(list(snapshot["totals"].values())))
+
+        return True
+
+    def _record(self, op, **fields):
+        """
+        Append an edit to the journal, or write it into the database, if there is one. Called once the edit has been
+        applied, so an edit that fails is never recorded and replayed on the next load.
+        :param op: Name of the edit operation
+        :param fields: Details of the edit
+        :return: None
+        """
+        if self.journal is not None:
+            self.journal.append(op, **fields)
+        if self.database is not None:
+            self.database.append(op, **fields)
 
-            self.all_accounts[account] = _bc
-        self.all_dates = [handle_date_string(x)for x in dates]
+    def _require_accounts(self, names):
+        """
+        Check accounts exist before an edit to them changes anything.
+        :param names: Account names
+        :return: None
+        """
+        missing = [x for x in names if not self.store.has_account(x)]
+        assert not missing, f"{', '.join(missing)} does not exist."
+
+    @timed("Context._replay_journal")
+    def _replay_journal(self):
+        """
+        Apply the edits recorded in the journal on top of the loaded data.
+        :return: None
+        """
+        entries = self.journal.entries()
+        if entries:
+            self._require_all()
+        # Detach the journal while replaying so the edits are not recorded a second time
+        journal, self.journal = self.journal, None
+        try:
+            for entry in entries:
+                self._apply_journal_entry(entry)
+        finally:
+            self.journal = journal
+
+    def _apply_journal_entry(self, entry):
+        """
+        Apply a single journal entry.
+        :param entry: Dictionary as written by _record
+        :return: None
+        """
+        op = entry["op"]
+        if op == "add_account":
+            _bc = BankAccount(entry["account"], entry["type"], entry["currency"])
+            for date_str, value in entry["values"].items():
+                _bc.add_entry(value, decode_date(date_str))
+            self.add_account(_bc)
+        elif op == "remove_account":
+            self.remove_account(entry["account"])
+        elif op == "add_date":
+            self.add_date(decode_date(entry["date"]), entry["values"])
+        elif op == "remove_date":
+            self.remove_date(decode_date(entry["date"]))
+        elif op == "set_value":
+            self.set_value(entry["account"], decode_date(entry["date"]), entry["value"])
+        elif op == "merge_values":
+            self.merge_values([(n, decode_date(d), v) for n, d, v in entry["entries"]],
+                              entry["account_types"], entry["account_currencies"])
+        elif op == "apply_edits":
+            self.apply_edits([_decode_edit(x) for x in entry["edits"]])
+        else:
+            raise ValueError(f"Unknown journal operation {op}.")
 
     def add_account(self, account):
         """
@@ -154,49 +580,512 @@ class Context(object):
         :param account: BackAccount object
         :return: None
         """
-        # TODO I made this a function of the context as we will want to check to see if there are any dates in conflict
+        self._require_all()
+        # An account of the same name is replaced, as it was when accounts were held in a plain dictionary
+        if account.name in self.all_accounts:
+            self.remove_account(account.name)
+
+        self.check_currency(account.currency, account.dates)
+        values = {encode_date(d): (float(v) if p else None)
+                  for d, v, p in zip(account.dates, account.values, account.present)}
+        n_dates = self.store.n_dates
+        self.store.add_account(account.name, account.type, account.currency)
+        self.store.add_dates(account.dates)
+        self._mark_dirty([account.name], account.dates, self.store.n_dates != n_dates)
+        self.store.set_values([account.name] * int(account.present.sum()),
+                              [d for d, p in zip(account.dates, account.present) if p],
+                              account.values[account.present].tolist())
+        self._add_column_to_totals(account.name, 1)
+
+        # From here on the account is a view onto the shared store
+        account._store = self.store
         self.all_accounts[account.name] = account
+        self._record("add_account", account=account.name, type=account.type, currency=account.currency,
+                     values=values)
+
+    def remove_account(self, account_name):
+        """
+        Remove an account and all of its values.
+        :param account_name: Name of the account, as used in all_accounts
+        :return: None
+        """
+        self._require_all()
+        self._require_accounts([account_name])
+        self._add_column_to_totals(account_name, -1)
+        self.store.remove_account(account_name)
+        self._mark_dirty([account_name])
+        del self.all_accounts[account_name]
+        self._record("remove_account", account=account_name)
+
+    def add_date(self, date, values=None):
+        """
+        Add a date for all accounts.
+        :param date: Datetime object for the new date.
+        :param values: Optional dictionary of account name to value on the new date.
+        :return: None
+        """
+        self._require_all()
+        values = {} if values is None else {k: parse_value(v) for k, v in values.items()}
+        self._require_accounts(values.keys())
+        self._mark_dirty(values.keys(), [date], self.store.date_index(date) is None)
+        self.store.add_date(date)
+        for account_name, value in values.items():
+            self.store.set_value(account_name, date, value)
+        self._refresh_total_rows([date])
+        self._record("add_date", date=encode_date(date), values=values)
+
+    def remove_date(self, date):
+        """
+        Remove a date, and the value held on it, from all accounts.
+        :param date: Datetime object for the date to remove.
+        :return: None
+        """
+        self._require_all()
+        self.store.remove_date(date)
+        self._mark_dirty([], [date], True)
+        if self.totals:
+            self._totals_store.remove_date(date)
+        self._record("remove_date", date=encode_date(date))
+
+    def set_value(self, account_name, date, value):
+        """
+        Set the value of one account on one date.
+        :param account_name: Name of the account, as used in all_accounts
+        :param date: Datetime object. The date is added if it is not already present.
+        :param value: New value. A blank string or None removes the entry.
+        :return: None
+        """
+        self._require_all()
+        value = parse_value(value)
+        self._require_accounts([account_name])
+        new_date = self.store.date_index(date) is None
+        self._mark_dirty([account_name], [date], new_date)
+        old_value = self.store.get_value(account_name, date)
+        self.store.set_value(account_name, date, value)
+        if new_date:
+            self._refresh_total_rows([date])
+        else:
+            _bc = self.all_accounts[account_name]
+            self._adjust_totals(date, _bc.type, _bc.currency, (value or 0) - (old_value or 0))
+        self._record("set_value", account=account_name, date=encode_date(date), value=value)
+
+    def merge_values(self, entries, account_types=None, account_currencies=None):
+        """
+        Set many values in a single batch. Accounts that do not exist yet are created.
+        :param entries: List of (account name, datetime, value) tuples. A value of None removes the entry.
+        :param account_types: Dictionary of account name to type. Required for any new account.
+        :param account_currencies: Dictionary of account name to currency for new accounts. Defaults to GBP.
+        :return: None
+        """
+        self._require_all()
+        # New accounts are named as BankAccount names them, so their entries, types and currencies are looked up by
+        # that name from here on
+        def _name(name):
+            return name if name in self.all_accounts else name.title()
+        account_types = {_name(k): v for k, v in (account_types or {}).items()}
+        account_currencies = {_name(k): v for k, v in (account_currencies or {}).items()}
+        entries = [(_name(n), d, parse_value(v)) for n, d, v in entries]
+        new_accounts = list(dict.fromkeys(n for n, _, _ in entries if n not in self.all_accounts))
+        for name in new_accounts:
+            assert name in account_types, f"No account type given for new account {name}."
+            self.check_currency(account_currencies.get(name, BASE_CURRENCY), [d for n, d, _ in entries if n == name])
+        if not entries:
+            # Nothing to change, so nothing to record and the data stays clean
+            return
+
+        for name in new_accounts:
+            _bc = BankAccount(name, account_types[name], account_currencies.get(name, BASE_CURRENCY))
+            self.store.add_account(_bc.name, _bc.type, _bc.currency)
+            _bc._store = self.store
+            self.all_accounts[_bc.name] = _bc
+        n_dates = self.store.n_dates
+        self.store.set_values([x[0] for x in entries], [x[1] for x in entries], [x[2] for x in entries])
+        self._mark_dirty([x[0] for x in entries], [x[1] for x in entries], self.store.n_dates != n_dates)
+        self._refresh_total_rows([x[1] for x in entries])
+        self._record("merge_values",
+                     entries=[(n, encode_date(d), v) for n, d, v in entries],
+                     account_types={n: account_types[n] for n in new_accounts},
+                     account_currencies={n: account_currencies.get(n, BASE_CURRENCY) for n in new_accounts})
+
+    @timed("Context.update_from_file")
+    def update_from_file(self, target, overwrite=False, max_workers=None):
+        """
+        Import one or many exported balance files (see read_data_file for the layouts) in a single batch.
+        Files are parsed in parallel, one per process. Entries that appear more than once with the same value are
+        merged. An entry that disagrees with another file, or with a value already held, is a conflict.
+        :param target: A data file, a glob pattern or a directory of .csv files
+        :param overwrite: If True, conflicts are resolved in favour of the imported files (later files, in sorted path
+        order, win). If False, any conflict aborts the import before anything is changed.
+        :param max_workers: Number of worker processes. Defaults to one per cpu.
+        :return: Number of entries imported
+        """
+        self._require_all()
+        paths = find_data_files(target)
+        if self.journal is not None:
+            paths = [x for x in paths if os.path.abspath(x) != os.path.abspath(self.journal.csv_path)]
+        assert paths, f"No data files found for {target}."
+
+        if len(paths) == 1:
+            results = [read_data_file(paths[0])]
+        else:
+            # Only needed when importing several files, so not paid for at start up
+            import concurrent.futures
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+                results = list(pool.map(read_data_file, paths))
+
+        # Flatten every file into long arrays of (account, date, value, source file)
+        names = list(self.store.names)
+        name_idx = {x: i for i, x in enumerate(names)}
+        account_types = dict(zip(self.store.names, self.store.types))
+        account_currencies = {}
+        ordinals, accounts, values, sources = [], [], [], []
+        for src, (path, (dates, file_names, file_types, file_currencies, file_values)) in enumerate(zip(paths, results)):
+            for name, account_type, currency in zip(file_names, file_types, file_currencies):
+                if name not in name_idx:
+                    name_idx[name] = len(names)
+                    names.append(name)
+                    account_types[name] = account_type
+                    account_currencies[name] = currency
+                elif account_types[name] != account_type:
+                    raise ValueError(f"{path}: {name} has type {account_type}, expected {account_types[name]}.")
+            rows, cols = np.nonzero(~np.isnan(file_values))
+            col_map = np.array([name_idx[x] for x in file_names], dtype=np.int64)
+            ordinals.append(to_ordinals(dates)[rows])
+            accounts.append(col_map[cols])
+            values.append(file_values[rows, cols])
+            sources.append(np.full(len(rows), src, dtype=np.int64))
+        ordinals = np.concatenate(ordinals)
+        accounts = np.concatenate(accounts)
+        values = np.concatenate(values)
+        sources = np.concatenate(sources)
+
+        # Group identical (account, date) pairs, keeping the order of the files within each group
+        order = np.lexsort((sources, ordinals, accounts))
+        ordinals, accounts, values, sources = ordinals[order], accounts[order], values[order], sources[order]
+        same_key = (accounts[1:] == accounts[:-1]) & (ordinals[1:] == ordinals[:-1])
+        conflicts = [(accounts[i], ordinals[i], f"{paths[sources[i]]} has {values[i]}, "
+                                                f"{paths[sources[i + 1]]} has {values[i + 1]}")
+                     for i in np.nonzero(same_key & (values[1:] != values[:-1]))[0]]
+        last = np.ones(len(values), dtype=bool)
+        last[:-1] = ~same_key
+        ordinals, accounts, values = ordinals[last], accounts[last], values[last]
+
+        # Compare against what is already held
+        rows = np.searchsorted(self.store.ordinals, ordinals)
+        on_axis = (rows < self.store.n_dates) & (accounts < self.store.n_accounts)
+        on_axis[on_axis] = self.store.ordinals[rows[on_axis]] == ordinals[on_axis]
+        held = np.zeros(len(values), dtype=bool)
+        held[on_axis] = self.store.present[rows[on_axis], accounts[on_axis]]
+        unchanged = np.zeros(len(values), dtype=bool)
+        unchanged[held] = self.store.values[rows[held], accounts[held]] == values[held]
+        conflicts.extend((accounts[i], ordinals[i], f"currently {self.store.values[rows[i], accounts[i]]}, "
+                                                    f"imported {values[i]}")
+                         for i in np.nonzero(held & ~unchanged)[0])
+
+        if conflicts and not overwrite:
+            details = "\n".join(f"    {names[a]} on {dt.date.fromordinal(int(o)).strftime(OUTPUT_DATE_FORMAT)}: {msg}"
+                                for a, o, msg in conflicts[:10])
+            raise ValueError(f"{len(conflicts)} conflicting entries found. Nothing has been imported.\n{details}")
+
+        changed = ~unchanged
+        entries = [(names[a], dt.datetime.fromordinal(int(o)), float(v))
+                   for a, o, v in zip(accounts[changed], ordinals[changed], values[changed])]
+        self.merge_values(entries, account_types, account_currencies)
+        print(f"Imported {len(entries)} entries from {len(paths)} file(s). "
+              f"{len(conflicts)} conflicts {'overwritten' if overwrite else 'skipped'}.")
+
+        return len(entries)
+
+    @timed("Context.apply_edits")
+    def apply_edits(self, edits):
+        """
+        Apply a batch of edits as a single transaction. The whole batch is checked against the data before anything is
+        changed, and if applying it fails part way the data is put back as it was. Runs of value edits go into the store
+        in one vectorised update, totals are recalculated once at the end and the batch is journaled as one entry.
+        :param edits: List of edit dictionaries, as returned by read_edit_file
+        :return: None
+        """
+        self._require_all()
+        errors = self._check_edits(edits)
+        if errors:
+            details = "\n".join(f"    {x}" for x in errors[:10])
+            raise ValueError(f"{len(errors)} invalid edits found. Nothing has been changed.\n{details}")
+
+        state = self._store_state()
+        weightings = self._totals_weightings if self.totals else None
+        journal, database = self.journal, self.database
+        # With no totals the mutators skip their per edit total updates, and with no journal or database nothing is
+        # recorded until the whole batch has gone in
+        self.journal, self.database, self.totals = None, None, {}
+        try:
+            self._apply_edit_batch(edits)
+            if weightings is not None:
+                self.generate_totals(weightings)
+        except Exception:
+            self._restore_state(state)
+            raise
+        finally:
+            self.journal, self.database = journal, database
+        self._record("apply_edits", edits=[_encode_edit(x) for x in edits])
+
+    def _check_edits(self, edits):
+        """
+        Walk through a batch of edits, keeping track of the accounts and dates each one leaves behind, to find any
+        that could not be applied.
+        :param edits: List of edit dictionaries
+        :return: List of problems, empty if the whole batch can be applied
+        """
+        accounts = set(self.store.names)
+        ordinals = set(self.store.ordinals.tolist())
+        # Totals need every account converting into the reporting currency
+        currencies = None
+        if self.totals:
+            currencies = set(self.fx_rates.currencies) if self.fx_rates is not None else {self.reporting_currency}
+        today = dt.date.today().toordinal()
+
+        errors = []
+        for idx, edit in enumerate(edits, start=1):
+            op = edit.get("op")
+            name = edit.get("account")
+            date = edit.get("date")
+            ordinal = date.toordinal() if date is not None else None
+            problem = None
+            if op not in EDIT_OPERATIONS:
+                problem = f"Unknown operation. Must be from: {EDIT_OPERATIONS}"
+            elif op in ["add_date", "remove_date", "set_value"] and date is None:
+                problem = "A date is required"
+            elif op in ["add_account", "remove_account", "set_value"] and not name:
+                problem = "An account is required"
+            elif ordinal is not None and ordinal > today:
+                problem = f"{date.strftime(OUTPUT_DATE_FORMAT)} is in the future"
+            elif op == "add_account":
+                currency = edit.get("currency") or BASE_CURRENCY
+                if name in accounts:
+                    problem = f"{name} already exists"
+                elif str(edit.get("type")).lower() not in ACCOUNT_TYPES:
+                    problem = f"Invalid account type {edit.get('type')}. Must be from: {ACCOUNT_TYPES}"
+                elif currencies is not None and currency not in currencies:
+                    problem = f"No exchange rates for {currency}"
+                else:
+                    accounts.add(name)
+            elif op == "remove_account":
+                if name not in accounts:
+                    problem = f"{name} does not exist"
+                else:
+                    accounts.remove(name)
+            elif op == "remove_date":
+                if ordinal not in ordinals:
+                    problem = f"{date.strftime(OUTPUT_DATE_FORMAT)} does not exist"
+                else:
+                    ordinals.remove(ordinal)
+            else:
+                missing = [x for x in ([name] if op == "set_value" else (edit.get("values") or {})) if x not in accounts]
+                if missing:
+                    problem = f"{', '.join(missing)} does not exist"
+                else:
+                    ordinals.add(ordinal)
+            if problem:
+                errors.append(f"Edit {idx} ({op}): {problem}.")
+
+        return errors
+
+    def _apply_edit_batch(self, edits):
+        """
+        Apply a batch of checked edits in order. Consecutive value edits are gathered up and set with a single
+        merge_values, so large batches cost little more than the store update itself.
+        :param edits: List of edit dictionaries
+        :return: None
+        """
+        # (account, date): value, so a value edited twice in a run keeps the later one
+        pending = {}
+        for edit in edits:
+            op = edit["op"]
+            if op == "set_value":
+                pending[(edit["account"], edit["date"])] = edit.get("value")
+                continue
+            if pending:
+                self.merge_values([(n, d, v) for (n, d), v in pending.items()])
+                pending = {}
+            if op == "add_account":
+                self.add_account(BankAccount(edit["account"], edit["type"], edit.get("currency") or BASE_CURRENCY))
+            elif op == "remove_account":
+                self.remove_account(edit["account"])
+            elif op == "add_date":
+                self.add_date(edit["date"], edit.get("values"))
+            elif op == "remove_date":
+                self.remove_date(edit["date"])
+        if pending:
+            self.merge_values([(n, d, v) for (n, d), v in pending.items()])
+
+    def _store_state(self):
+        """
+        :return: Copy of everything the mutators change, for _restore_state
+        """
+        return {"store": (list(self.store.dates), list(self.store.names), list(self.store.types),
+                          list(self.store.currencies), self.store.values.copy(), self.store.present.copy()),
+                "accounts": list(self.all_accounts.items()),
+                "dirty": (self.mutation_count, set(self.dirty_accounts), set(self.dirty_dates), self.axis_changed),
+                "totals": (dict(self.totals), self._totals_store, self._totals_weightings, self._totals_rollups,
+                           None if self._totals_store is None else
+                           (list(self._totals_store.dates), list(self._totals_store.names),
+                            list(self._totals_store.types), list(self._totals_store.currencies),
+                            self._totals_store.values.copy(), self._totals_store.present.copy()))}
+
+    def _restore_state(self, state):
+        """
+        Put the accounts and totals back as they were when _store_state was called.
+        :param state: As returned by _store_state
+        :return: None
+        """
+        self.store.load(*state["store"])
+        self.all_accounts.clear()
+        self.all_accounts.update(state["accounts"])
+        self.mutation_count, self.dirty_accounts, self.dirty_dates, self.axis_changed = state["dirty"]
+        self._rollups = None
+        self.totals, self._totals_store, self._totals_weightings, self._totals_rollups, totals = state["totals"]
+        if totals is not None:
+            # The totals accounts are views onto this store, so it is put back in place rather than replaced
+            self._totals_store.load(*totals)
+
+    def compact(self):
+        """
+        Fold the journaled edits into the data file and start a fresh journal. A database has no journal, as edits are
+        written straight into it, so its write-ahead log is folded into the database file instead.
+        :return: True if the data file was written
+        """
+        if self.database is not None:
+            self.database.checkpoint()
+            return True
+        assert self.journal is not None, "There is no journal to compact."
+        return self.save_to_csv(self.journal.csv_path, allow_overwrite=True)
+
+    def _mark_dirty(self, accounts=(), dates=(), axis_changed=False):
+        """
+        Record a change made by one of the mutators.
+        :param accounts: Names of the accounts whose values changed
+        :param dates: Dates whose values changed, or that were added or removed
+        :param axis_changed: True if dates were added to or removed from the date axis
+        :return: None
+        """
+        self.mutation_count += 1
+        self.dirty_accounts.update(accounts)
+        self.dirty_dates.update(dates)
+        self.axis_changed = self.axis_changed or axis_changed
+        # Only the periods holding these dates need aggregating again
+        if self._rollups is not None or self._totals_rollups is not None:
+            ordinals = to_ordinals(list(dates))
+            for pyramid in [self._rollups, self._totals_rollups]:
+                if pyramid is not None:
+                    pyramid.mark_stale(ordinals)
+
+    def _mark_clean(self, full_path):
+        """
+        Forget the recorded changes once the data file holds them.
+        :param full_path: Path to the data file that was written
+        :return: None
+        """
+        self.dirty_accounts = set()
+        self.dirty_dates = set()
+        self.axis_changed = False
+        self._source = (full_path, file_signature(full_path))
 
     def test_updated(self):
+        """
+        :return: True if the data has been changed during this run.
+        """
         if not self.updated_this_run:
-            if self.initial_data_state != self.data_state:
+            if self.mutation_count:
                 self.updated_this_run = True
 
         return self.updated_this_run
 
-    def quick_report(self):
+    @timed("Context.quick_report")
+    def quick_report(self, out=None):
         """
         Give a short report of the internal state of the context.
+        :param out: File-like object to write to. Defaults to stdout.
         :return: None
         """
-        print(f"Data loaded for {len(self.all_accounts.keys())} bank accounts on {len(self.all_dates)} dates.")
-        for key in self.all_accounts.keys():
-            real_entries = [x for x in self.all_accounts[key].history.items() if x[1] != ""]
-            print(f"    {key}: {len(real_entries)}")
-        print("Calculated Totals:")
+        loaded = self.all_accounts.loaded_items()
+        print(f"Data loaded for {len(loaded)} bank accounts on {len(self.all_dates)} dates.", file=out)
+        for key, _bc in loaded:
+            print(f"    {key}: {_bc.count_entries()}", file=out)
+        if self.all_accounts.pending:
+            print(f"    ({len(self.all_accounts.pending)} more accounts will be loaded when needed)", file=out)
+        if not self.all_dates:
+            print("No data", file=out)
+            print("", file=out)
+            return
+        print("Calculated Totals:", file=out)
         for key in self.totals.keys():
-            print("    {}: £{:.2f}".format(key, self.totals[key].get_value_on_date(self.all_dates[-1])))
+            print("    {}: {}".format(key, format_money(self.totals[key].get_value_on_date(self.all_dates[-1]),
+                                                    self.reporting_currency)), file=out)
         print("Dates span from {} to {}. ({:.2f} years)".format(
             dt.datetime.strftime(min(self.all_dates), OUTPUT_DATE_FORMAT),
             dt.datetime.strftime(max(self.all_dates), OUTPUT_DATE_FORMAT),
-            (max(self.all_dates) - min(self.all_dates)).days/365))
-        print("")
+            (max(self.all_dates) - min(self.all_dates)).days/365), file=out)
+        print("", file=out)
 
-    def date_report(self, date, interp=False):
+    @timed("Context.date_report")
+    def date_report(self, date, interp=False, out=None):
         """
-        Report the status of all bank accounts on a given date.
+        Report the status of all bank accounts and totals on a given date, as an aligned table.
         :param date:
-        :param interp: If the date is not preset, should one be interpolated.
+        :param interp: If an account has no entry on the date, should one be interpolated.
+        :param out: File-like object to write to. Defaults to stdout.
         :return:
         """
-        for n, _bc in self.all_accounts.items():
-            v = _bc.get_value_on_date(date)
-            t = _bc.type
-            # TODO use padding to make this neat
-            if v == "":
-                v = 0
-            print("    {} ({}) - £{:.2f}".format(n, t, float(v)))
-        print("        Total Money - £{:.2f}".format(self.totals['Total Money'].get_value_on_date(date)))
+        # tables imports from this module, so it can only be imported once this module has loaded
+        from tables import date_table, write_table
+        write_table(date_table(self, [date], interp), out=out)
+
+    def rollup(self, period, totals=False):
+        """
+        Aggregates of every account (or every total) over each month, quarter or year.
+        :param period: Period length from rollups.PERIODS
+        :param totals: Roll up the totals rather than the accounts
+        :return: rollups.Rollup, with values in each account's own currency (totals are in the reporting currency)
+        """
+        self._require_all()
+        if totals:
+            assert self.totals, "Totals must be generated before they can be rolled up."
+            if self._totals_rollups is None:
+                self._totals_rollups = RollupPyramid(self._totals_store)
+            return self._totals_rollups.level(period)
+        if self._rollups is None:
+            self._rollups = RollupPyramid(self.store)
+        return self._rollups.level(period)
+
+    @timed("Context.period_report")
+    def period_report(self, period="year", out=None):
+        """
+        Report the balance at the end of each period, along with the lowest and highest balance and the change over
+        the period, for every account and total.
+        :param period: Period length from rollups.PERIODS
+        :param out: File-like object to write to. Defaults to stdout.
+        :return: None
+        """
+        accounts = self.rollup(period)
+        totals = self.rollup(period, totals=True) if self.totals else None
+        for idx, label in enumerate(accounts.labels):
+            print(f"    ---  {label}  ---", file=out)
+            for col, n in enumerate(accounts.names):
+                if not accounts.count[idx, col]:
+                    continue
+                _bc = self.all_accounts[n]
+                stats = [format_money(getattr(accounts, x)[idx, col], _bc.currency) for x in ["end", "min", "max"]]
+                change = accounts.change[idx, col]
+                print("    {} ({}) - {} (low {}, high {}{})".format(
+                    n, _bc.type, *stats, "" if np.isnan(change) else f", change {format_money(change, _bc.currency)}"),
+                    file=out)
+            if totals is not None:
+                for col, n in enumerate(totals.names):
+                    change = totals.change[idx, col]
+                    print("        {} - {}{}".format(
+                        n, format_money(totals.end[idx, col], self.reporting_currency),
+                        "" if np.isnan(change) else f" (change {format_money(change, self.reporting_currency)})"),
+                        file=out)
+            print("", file=out)
 
     def full_report(self):
         """
@@ -206,27 +1095,98 @@ class Context(object):
         # TODO Once we have the internal structure for contexts, work out how to report this to command line
         print("Full report isn't implemented yet")
 
-    def _build_csv_row(self, account_key, dates):
+    def _build_csv_row(self, account_key):
         """
         A specific function for building the corresponding csv for for an account.
-        This could be simplified by assuming that the order in self.all_dates matches the
-        internal BankAccount object order, but it will be better to explicitly build the row.
+        The store keeps every account on the same sorted date axis as self.all_dates, so the row can be
+        read straight out of the account column.
         :param account_key: The name of the account for this row.
-        :param dates: A list of dates that forms the header of the csv.
-        :return:
+        :return: List of strings for the csv row
         """
-        new_row = []
         _bc = self.all_accounts[account_key]
-        new_row.append(account_key)
-        new_row.append(_bc.type)
-        for date_str in dates:
-            if date_str in _bc.history.keys():
-                new_row.append(_bc.history[date_str])
-            else:
-                new_row.append("")
+        new_row = [account_key, _bc.type] + ([_bc.currency] if self._write_currency() else [])
+        new_row.extend(format_value(v) if p else "" for v, p in zip(_bc.values.tolist(), _bc.present.tolist()))
 
         return new_row
 
+    def _reusable_rows(self, full_path, header):
+        """
+        When rewriting the file the data was loaded from, rows for accounts that have not changed can be copied
+        across byte for byte rather than formatted again. This is only safe if the file is exactly as it was loaded
+        and its header (so every column) is the one about to be written.
+        :param full_path: Path about to be written
+        :param header: Header row about to be written
+        :return: Dictionary of account name to raw csv line
+        """
+        if self._source is None or self._source[0] != full_path or self.axis_changed:
+            return {}
+        if not signature_matches(self._source[1], full_path):
+            return {}
+        index = read_row_index(full_path)
+        if index is None:
+            return {}
+
+        rows = {}
+        with open(full_path, "rb") as f:
+            f.seek(index["header"][0])
+            if next(csv.reader([f.read(index["header"][1]).decode()])) != header:
+                return {}
+            for name, _bc in self.all_accounts.items():
+                if name in self.dirty_accounts or name not in index["rows"]:
+                    continue
+                _, offset, length, _ = index["rows"][name]
+                f.seek(offset)
+                line = f.read(length).decode()
+                # Names and types are normalised on load, so only rows already written that way can be reused
+                leading = [name, _bc.type] + ([_bc.currency] if self._write_currency() else [])
+                if line.startswith(",".join(leading) + ","):
+                    rows[name] = line if line.endswith("\n") else line + "\r\n"
+
+        return rows
+
+    def save(self, full_path, allow_overwrite=False):
+        """
+        Save the full contents of the context, to a csv or a SQLite database depending on the file extension (see
+        storage.storage_backend).
+        :param full_path: Path to the file
+        :param allow_overwrite: Allow the file to be replaced if it already exists
+        :return: True if saved successfully
+        """
+        if storage_backend(full_path) == "sqlite":
+            return self.save_to_sqlite(full_path, allow_overwrite)
+        return self.save_to_csv(full_path, allow_overwrite)
+
+    @timed("Context.save_to_sqlite")
+    def save_to_sqlite(self, full_path, allow_overwrite=False):
+        """
+        Save the full contents of the context to a SQLite database, replacing anything already in it in a single
+        transaction.
+        :param full_path: Path to the database
+        :param allow_overwrite: Allow the database to be replaced if it already exists
+        :return: True if saved successfully
+        """
+        self._require_all()
+        if os.path.exists(full_path) and os.path.getsize(full_path) and not allow_overwrite:
+            print(f"Cannot save to {full_path} without overwriting.")
+            return False
+
+        own_database = self.database is not None and os.path.abspath(self.database.path) == os.path.abspath(full_path)
+        database = self.database if own_database else SqliteStorage(full_path)
+        try:
+            database.write(self.all_dates, self.store.names, self.store.types, self.store.currencies,
+                           self.store.values, self.store.present)
+        except sqlite3.Error as e:
+            print(f"Could not write to {full_path}: {e}")
+            return False
+        finally:
+            if not own_database:
+                database.close()
+
+        if self._source is not None and self._source[0] == full_path:
+            self._mark_clean(full_path)
+        return True
+
+    @timed("Context.save_to_csv")
     def save_to_csv(self, full_path, allow_overwrite=False):
         """
         Save the full contents of the context to a csv file.
@@ -234,93 +1194,721 @@ class Context(object):
         :param allow_overwrite: Allow the file to be overwritten if it already exists
         :return: True if saved successfully
         """
+        self._require_all()
         path_used = os.path.exists(full_path)
         if path_used and not allow_overwrite:
             print(f"Cannot save to {full_path} without overwriting.")
-            return
+            return False
 
-        # Prepare the rows for the csv output
-        # TODO make sure that the dates are in chronological order
+        # Prepare the rows for the csv output. The store keeps the dates in chronological order.
         dates_out = [dt.datetime.strftime(x, OUTPUT_DATE_FORMAT) for x in self.all_dates]
-        rows_out = {}
+        header = WIDE_HEADER + (["Currency"] if self._write_currency() else []) + dates_out
+        rows_out = self._reusable_rows(full_path, header)
         for key in self.all_accounts.keys():
-            rows_out[key] = self._build_csv_row(key, dates_out)
+            if key not in rows_out:
+                rows_out[key] = self._build_csv_row(key)
 
+        # Write alongside and rename into place, so a crash part way through never leaves a truncated data file
+        temp_path = full_path + ".tmp"
         try:
-            with open(full_path, "w", newline="") as csv_file:
+            with open(temp_path, "w", newline="") as csv_file:
                 write_out = csv.writer(csv_file, delimiter=",")
-                write_out.writerow(["Account", "Type"] + dates_out)
+                write_out.writerow(header)
                 for acc in self.all_accounts.keys():
-                    write_out.writerow(rows_out[acc])
-        except:
+                    if isinstance(rows_out[acc], str):
+                        csv_file.write(rows_out[acc])
+                    else:
+                        write_out.writerow(rows_out[acc])
+                csv_file.flush()
+                os.fsync(csv_file.fileno())
+            os.replace(temp_path, full_path)
+        except OSError:
             print(f"Could not write to {full_path}")
+            return False
+
+        # The file now holds every journaled edit
+        if self.journal is not None and self.journal.csv_path == full_path:
+            self.journal.clear()
+        if self._source is not None and self._source[0] == full_path:
+            self._mark_clean(full_path)
+
+        # Keep a binary snapshot of what was just written so the next start-up can skip parsing the csv
+        try:
+            totals = self._weighted_sum(self.store.values, self.store.ordinals, self._weight_matrix(TOTAL_WEIGHTINGS))
+            totals = dict(zip(TOTAL_WEIGHTINGS.keys(), totals.T))
+        except ValueError:
+            # Missing exchange rates, the totals are left out and calculated on the next load instead
+            totals = None
+        try:
+            write_snapshot(full_path, self.store, totals, self._totals_key(TOTAL_WEIGHTINGS))
+        except OSError:
+            print(f"Could not write a snapshot of {full_path}")
+        try:
+            write_row_index(full_path)
+        except OSError:
+            print(f"Could not write a row index for {full_path}")
+
+        return True
+
+    def _write_currency(self):
+        """
+        :return: True if the csv needs a Currency column, i.e. any account is not in the base currency
+        """
+        return any(x != BASE_CURRENCY for x in self.store.currencies)
 
-    def generate_totals(self):
+    def _totals_key(self, weightings):
         """
-        Generate fake accounts that represent the total value and worth of accounts
+        Describe how totals are calculated, so that stored totals are only reused when they would come out the same.
+        :param weightings: Dictionary of total name to {account type: weight}
+        :return: JSON-serialisable description
+        """
+        if all(x == self.reporting_currency for x in self.store.currencies):
+            return weightings
+        return {"weightings": weightings,
+                "reporting_currency": self.reporting_currency,
+                "fx": self.fx_rates.source if self.fx_rates is not None else None}
+
+    def set_fx_rates(self, fx_rates, reporting_currency=None):
+        """
+        Change the exchange rates and/or reporting currency. Any totals are recalculated.
+        :param fx_rates: RateTable
+        :param reporting_currency: Currency the totals are calculated in. Defaults to the base currency of fx_rates.
         :return: None
         """
-        def _handle_values(str):
-            """
-            Handle the string value returned by an account.
-            :param str: Value in
-            :return: float
-            """
-            if str == "":
-                return 0
-            else:
-                return float(str)
-
-        total_money_bc = BankAccount("Total Money", "Savings")
-        total_worth_bc = BankAccount("Total Worth", "Savings")
-        for date in self.all_dates:
-            pos_value = 0
-            neg_value = 0
-            mortgage_value = 0
-            for _, _bc in self.all_accounts.items():
-                if _bc.type.lower() in ["current", "debit", "savings"]:
-                    pos_value += _handle_values(_bc.get_value_on_date(date))
-                elif _bc.type.lower() == "credit":
-                    neg_value += _handle_values(_bc.get_value_on_date(date))
-                else:
-                    mortgage_value += _handle_values(_bc.get_value_on_date(date))
+        self.fx_rates = fx_rates
+        self.reporting_currency = reporting_currency or fx_rates.base_currency
+        if self.totals:
+            self.generate_totals(self._totals_weightings)
+
+    def conversion_factors(self, currency, ordinals):
+        """
+        Multipliers that convert values in a currency into the reporting currency on each date.
+        :param currency: Currency code
+        :param ordinals: 1D array of day ordinals
+        :return: 1D float array
+        """
+        if currency == self.reporting_currency:
+            return np.ones(len(ordinals))
+        if self.fx_rates is None:
+            raise ValueError(f"No exchange rates are loaded to convert {currency} to {self.reporting_currency}.")
+        return self.fx_rates.factors(currency, self.reporting_currency, ordinals)
+
+    def check_currency(self, currency, dates=()):
+        """
+        Check values in a currency can be converted into the reporting currency, before an account in it is added.
+        The totals cover every date, so when there are totals the rates must cover every date of the Context too.
+        :param currency: Currency code
+        :param dates: Datetime objects the account has values on
+        :return: None. Raises a ValueError if there are no rates for the currency, or none early enough.
+        """
+        ordinals = to_ordinals(list(dates))
+        if self.totals:
+            ordinals = np.union1d(ordinals, self.store.ordinals)
+        self.conversion_factors(currency, ordinals)
+
+    def _weighted_sum(self, values, ordinals, weights):
+        """
+        Weighted sums of account values in the reporting currency. A conversion rate only depends on the currency and
+        the date, so rather than converting every value the accounts are summed per currency in a single matrix
+        product and each currency's sums are then scaled by its rate on each date. When every account is in the
+        reporting currency this is just values @ weights.
+        :param values: (dates x accounts) array
+        :param ordinals: Day ordinals of the rows of values
+        :param weights: (accounts x totals) array
+        :return: (dates x totals) array
+        """
+        currencies = self.store.currencies
+        if all(x == self.reporting_currency for x in currencies):
+            return values @ weights
+
+        groups, group_idx = np.unique(currencies, return_inverse=True)
+        n_accounts, n_totals = weights.shape
+        # Block the weights by currency so that one product gives a (dates x currencies x totals) set of sums
+        blocked = np.zeros((n_accounts, len(groups), n_totals))
+        blocked[np.arange(n_accounts), group_idx] = weights
+        sums = (values @ blocked.reshape(n_accounts, -1)).reshape(len(values), len(groups), n_totals)
+        factors = np.column_stack([self.conversion_factors(x, ordinals) for x in groups])
+
+        return np.einsum("dct,dc->dt", sums, factors)
+
+    def _weight_matrix(self, weightings):
+        """
+        Build the (accounts x totals) matrix of weights for a set of total definitions.
+        :param weightings: Dictionary of total name to a dictionary of {account type: weight}
+        :return: numpy array
+        """
+        weights = np.zeros((self.store.n_accounts, len(weightings)), dtype=np.float64)
+        for col, type_weights in enumerate(weightings.values()):
+            for row, account_type in enumerate(self.store.types):
+                weights[row, col] = type_weights.get(account_type.lower(), 0)
+
+        return weights
+
+    @timed("Context.generate_totals")
+    def generate_totals(self, weightings=None):
+        """
+        Generate fake accounts that represent the total value and worth of accounts. Every total is a weighted
+        sum over all accounts, so all totals for all dates come from a single matrix product.
+        :param weightings: Dictionary of total name to {account type: weight}. Defaults to TOTAL_WEIGHTINGS.
+        :return: None
+        """
+        self._require_all()
+        if weightings is None:
+            weightings = TOTAL_WEIGHTINGS
+
+        self._set_totals(weightings,
+                         self._weighted_sum(self.store.values, self.store.ordinals, self._weight_matrix(weightings)))
+
+    def _adjust_totals(self, date, account_type, currency, delta):
+        """
+        Apply a change in one account value to every total. O(number of totals).
+        :param date: Datetime object of the change
+        :param account_type: Type of the account that changed
+        :param currency: Currency of the account that changed
+        :param delta: Change in value
+        :return: None
+        """
+        if not self.totals or not delta:
+            return
+        delta *= self.conversion_factors(currency, [date.toordinal()])[0]
+        for name, type_weights in self._totals_weightings.items():
+            weight = type_weights.get(account_type.lower(), 0)
+            if weight:
+                self._totals_store.set_value(name, date, self._totals_store.get_value(name, date) + weight * delta)
+
+    def _refresh_total_rows(self, dates):
+        """
+        Recalculate every total on a set of dates from the account values. O(accounts) per date.
+        :param dates: List of datetime objects. Any not yet on the totals date axis are added.
+        :return: None
+        """
+        if not self.totals or not len(dates):
+            return
+        dates = [self.all_dates[x] for x in sorted(set(self.store.date_index(d) for d in dates))]
+        rows = np.searchsorted(self.store.ordinals, to_ordinals(dates))
+        totals = self._weighted_sum(self.store.values[rows], self.store.ordinals[rows],
+                                    self._weight_matrix(self._totals_weightings))
+        names = list(self._totals_weightings.keys())
+        self._totals_store.set_values([n for _ in dates for n in names],
+                                      [d for d in dates for _ in names],
+                                      totals.ravel().tolist())
+
+    def _add_column_to_totals(self, account_name, sign):
+        """
+        Add (sign=1) or take away (sign=-1) a whole account from every total. O(dates).
+        :param account_name: Name of the account
+        :param sign: 1 or -1
+        :return: None
+        """
+        if not self.totals:
+            return
+        # Keep the totals on the same date axis as the accounts
+        self._totals_store.add_dates(self.all_dates)
+        # Every date of the totals changes
+        self._totals_rollups = None
+        column = self.store.column_index(account_name)
+        account_type = self.store.types[column]
+        values = self.store.column(account_name)[0] * self.conversion_factors(self.store.currencies[column],
+                                                                                self.store.ordinals)
+        for name, type_weights in self._totals_weightings.items():
+            current = self._totals_store.column(name)[0]
+            self._totals_store.set_column(name, current + sign * type_weights.get(account_type.lower(), 0) * values)
+
+    def _set_totals(self, weightings, totals):
+        """
+        Replace the totals with pre-calculated values.
+        :param weightings: Dictionary of total name to {account type: weight} the totals were calculated with
+        :param totals: (dates x totals) array over the date axis
+        :return: None
+        """
+        names = list(weightings.keys())
+        self._totals_weightings = weightings
+        self._totals_rollups = None
+        self._totals_store = totals_store = AccountStore()
+        totals_store.load(self.all_dates,
+                          names,
+                          ["Savings"] * len(names),
+                          [self.reporting_currency] * len(names),
+                          totals,
+                          np.ones(totals.shape, dtype=bool))
+        self.totals = {}
+        for name in names:
+            _bc = BankAccount(name, "Savings", self.reporting_currency)
+            _bc._store = totals_store
+            self.totals[name] = _bc
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_date(date_str, date_format):
+    """
+    Cached strptime. The same few date strings are seen over and over (every header of every load), so each
+    (string, format) pair is only ever parsed once.
+    :param date_str: String assumed to be a date.
+    :param date_format: strptime format to try
+    :return: Datetime object, or None if the string does not match the format
+    """
+    try:
+        return dt.datetime.strptime(date_str.strip(), date_format)
+    except ValueError:
+        return None
 
-            total_money_bc.add_entry(pos_value-neg_value, date)
-            total_worth_bc.add_entry(pos_value-neg_value-mortgage_value, date)
 
-        self.totals["Total Money"] = total_money_bc
-        self.totals["Total Worth"] = total_worth_bc
+def _check_not_future(dates):
+    """
+    Check that none of a batch of dates is in the future.
+    :param dates: List of datetime objects
+    :return: None
+    """
+    if dates:
+        assert max(dates).date() <= dt.date.today(), f"A date has been passed that is in the future."
 
 
-def handle_date_string(date_str):
+def sniff_date_format(date_strings):
+    """
+    Work out which of CHECK_DATE_FORMATS a column of date strings is written in. A string such as 01-02-20 is valid as
+    both d-m and m-d, so the decision is made on the whole column. A format must parse every value, and a format that
+    puts the column in chronological order is preferred. Any remaining tie goes to the order of CHECK_DATE_FORMATS.
+    :param date_strings: List of strings assumed to be dates.
+    :return: strptime format string
+    """
+    candidates = []
+    for try_format in CHECK_DATE_FORMATS:
+        parsed = []
+        for date_str in date_strings:
+            date_obj = _parse_date(date_str, try_format)
+            if date_obj is None:
+                break
+            parsed.append(date_obj)
+        else:
+            if all(a < b for a, b in zip(parsed, parsed[1:])):
+                return try_format
+            candidates.append(try_format)
+
+    assert candidates, "Invalid date format provided."
+    return candidates[0]
+
+
+def parse_date_column(date_strings, date_format=None):
+    """
+    Parse a whole column of date strings that share a single format.
+    :param date_strings: List of strings assumed to be dates.
+    :param date_format: strptime format. If None, it is detected with sniff_date_format.
+    :return: List of datetime objects
+    """
+    if date_format is None:
+        date_format = sniff_date_format(date_strings)
+    dates = [_parse_date(x, date_format) for x in date_strings]
+    assert None not in dates, f"Dates do not all match the format {date_format}."
+    _check_not_future(dates)
+
+    return dates
+
+
+@counted("handle_date_string")
+def handle_date_string(date_str, date_format=None):
     """
     Wrapping the dateutil functionality to ensure a datetime object is returned
     :param date_str: String assumed to be a date.
+    :param date_format: strptime format, if already known. Otherwise CHECK_DATE_FORMATS are tried in order.
     :return: Datetime object
     """
-    for try_format in CHECK_DATE_FORMATS:
-        try:
-            date_obj = dt.datetime.strptime(date_str, try_format)
+    date_obj = None
+    for try_format in CHECK_DATE_FORMATS if date_format is None else [date_format]:
+        date_obj = _parse_date(date_str, try_format)
+        if date_obj is not None:
             break
-        except:
-            pass
 
-    assert "date_obj" in locals(), "Invalid date format provided."
-    assert date_obj.date() <= dt.date.today(), f"A date has bee passed that is in the future."
+    assert date_obj is not None, "Invalid date format provided."
+    _check_not_future([date_obj])
 
     return date_obj
 
 
-def initialise_context(target_file):
+class DataFileError(ValueError):
+    """
+    Raised when a data file cannot be read. Reports the file, row and column (both counted from 1) at fault.
+    """
+    def __init__(self, path, row, column, message):
+        self.path = path
+        self.row = row
+        self.column = column
+        location = ", ".join(f"{label} {x}" for label, x in [("row", row), ("column", column)] if x is not None)
+        super().__init__(f"{path} ({location}): {message}")
+
+
+def _detect_layout(abs_path, header):
+    """
+    Work out which layout a data file is written in from its header row.
+    :param abs_path: Path to the file, for error reporting
+    :param header: First row of the file
+    :return: "wide" or "long"
+    """
+    lowered = [x.strip().lower() for x in header]
+    if lowered[:2] == [x.lower() for x in WIDE_HEADER]:
+        return "wide"
+    if all(x.lower() in lowered for x in LONG_HEADER):
+        return "long"
+    raise DataFileError(abs_path, 1, None, f"Header must start with {WIDE_HEADER} or contain {LONG_HEADER}.")
+
+
+def _check_account_type(abs_path, row_number, column, account_type):
+    """
+    Validate an account type read from a file.
+    :return: The account type in title case
+    """
+    if account_type.strip().lower() not in ACCOUNT_TYPES:
+        raise DataFileError(abs_path, row_number, column,
+                            f"Invalid account type '{account_type}'. Account types must be from: {ACCOUNT_TYPES}")
+    return account_type.strip().title()
+
+
+def _wide_value_start(header):
+    """
+    :param header: Header row of a wide-format file
+    :return: Index of the first date column, after the optional Currency column
+    """
+    return 3 if len(header) > 2 and header[2].strip().lower() == "currency" else 2
+
+
+def _parse_wide_row(abs_path, row_number, cells, n_dates, first_column=3):
+    """
+    Parse the values of a single wide-format row into an array in one go. numpy does the float conversion, and only
+    if that fails is the row walked cell by cell to find the culprit.
+    :param abs_path: Path to the file, for error reporting
+    :param row_number: Row of the file, counted from 1
+    :param cells: Value cells of the row (everything after the account name, type and currency)
+    :param n_dates: Number of dates in the header
+    :param first_column: Column of the first value cell, counted from 1, for error reporting
+    :return: 1D float array of length n_dates. NaN where there is no entry.
+    """
+    if len(cells) > n_dates:
+        raise DataFileError(abs_path, row_number, n_dates + first_column, "Row has more values than there are dates.")
+    cells = [x.strip() or "nan" for x in cells]
+    cells.extend(["nan"] * (n_dates - len(cells)))
+    try:
+        return np.array(cells, dtype=np.float64)
+    except ValueError:
+        row = np.empty(n_dates, dtype=np.float64)
+        for idx, cell in enumerate(cells):
+            try:
+                value = parse_value(cell)
+            except ValueError as e:
+                raise DataFileError(abs_path, row_number, idx + first_column, str(e))
+            row[idx] = np.nan if value is None else value
+        return row
+
+
+def _read_wide_rows(abs_path, header, read_in):
+    """
+    Stream the account rows of a wide-format file (one row per account, one column per date). Only the parsed
+    numeric row is kept for each account.
+    :return: dates, names, types, currencies, values (see read_data_file)
+    """
+    start = _wide_value_start(header)
+    try:
+        dates = parse_date_column(header[start:])
+    except AssertionError as e:
+        raise DataFileError(abs_path, 1, None, str(e))
+
+    names = []
+    types = []
+    currencies = []
+    rows = []
+    for row_number, row in enumerate(read_in, start=2):
+        if not any(x.strip() for x in row):
+            continue
+        if len(row) < 2:
+            raise DataFileError(abs_path, row_number, None, "Row is missing the account type.")
+        name = row[0].strip().title()
+        if name in names:
+            raise DataFileError(abs_path, row_number, 1, f"Account {name} appears more than once.")
+        names.append(name)
+        types.append(_check_account_type(abs_path, row_number, 2, row[1]))
+        currencies.append((row[2].strip() if start > 2 and len(row) > 2 else "") or BASE_CURRENCY)
+        rows.append(_parse_wide_row(abs_path, row_number, row[start:], len(dates), start + 1))
+
+    values = np.column_stack(rows) if rows else np.zeros((len(dates), 0))
+    return dates, names, types, currencies, values
+
+
+def _read_long_rows(abs_path, header, read_in):
+    """
+    Stream a long-format file (one row per date, account and value) line by line. Values are accumulated into compact
+    typed arrays and only assembled into a matrix once the whole file has been read.
+    :return: dates, names, types, currencies, values (see read_data_file)
+    """
+    lowered = [x.strip().lower() for x in header]
+    date_col, name_col, type_col, value_col = [lowered.index(x.lower()) for x in LONG_HEADER]
+    currency_col = lowered.index("currency") if "currency" in lowered else None
+
+    # The date format is sniffed from the first block of rows, which is read ahead and then replayed
+    head = list(itertools.islice(read_in, LONG_FORMAT_SNIFF_ROWS))
+    sniff_strings = list(dict.fromkeys(row[date_col] for row in head if len(row) > date_col and row[date_col].strip()))
+    try:
+        date_format = sniff_date_format(sniff_strings)
+    except AssertionError as e:
+        raise DataFileError(abs_path, 2, date_col + 1, str(e))
+
+    columns = {}
+    types = []
+    currencies = []
+    ordinals = array.array("q")
+    account_idx = array.array("q")
+    values = array.array("d")
+    row_numbers = array.array("q")
+    for row_number, row in enumerate(itertools.chain(head, read_in), start=2):
+        if not any(x.strip() for x in row):
+            continue
+        if len(row) < len(header):
+            raise DataFileError(abs_path, row_number, None, f"Expected {len(header)} columns, found {len(row)}.")
+
+        name = row[name_col].strip().title()
+        account_type = _check_account_type(abs_path, row_number, type_col + 1, row[type_col])
+        currency = (row[currency_col].strip() if currency_col is not None else "") or BASE_CURRENCY
+        if name not in columns:
+            columns[name] = len(columns)
+            types.append(account_type)
+            currencies.append(currency)
+        elif types[columns[name]] != account_type:
+            raise DataFileError(abs_path, row_number, type_col + 1,
+                                f"{name} was previously given type {types[columns[name]]}.")
+
+        try:
+            value = parse_value(row[value_col])
+        except ValueError as e:
+            raise DataFileError(abs_path, row_number, value_col + 1, str(e))
+        if value is None:
+            continue
+
+        date_obj = _parse_date(row[date_col], date_format)
+        if date_obj is None:
+            raise DataFileError(abs_path, row_number, date_col + 1,
+                                f"'{row[date_col]}' does not match the date format {date_format}.")
+        ordinals.append(date_obj.toordinal())
+        account_idx.append(columns[name])
+        values.append(value)
+        row_numbers.append(row_number)
+
+    ordinals = np.frombuffer(ordinals, dtype=np.int64) if ordinals else np.zeros(0, dtype=np.int64)
+    account_idx = np.frombuffer(account_idx, dtype=np.int64) if account_idx else np.zeros(0, dtype=np.int64)
+    unique_ordinals, rows = np.unique(ordinals, return_inverse=True)
+
+    # Two entries for the same account on the same date is an error rather than a silent overwrite
+    keys = rows * max(len(columns), 1) + account_idx
+    order = np.argsort(keys, kind="stable")
+    clashes = np.nonzero(keys[order][1:] == keys[order][:-1])[0]
+    if len(clashes):
+        row_number = row_numbers[int(order[clashes[0] + 1])]
+        raise DataFileError(abs_path, row_number, None, "Duplicate entry for this account and date.")
+
+    matrix = np.full((len(unique_ordinals), len(columns)), np.nan)
+    matrix[rows, account_idx] = np.frombuffer(values, dtype=np.float64) if values else np.zeros(0)
+    dates = [dt.datetime.fromordinal(int(x)) for x in unique_ordinals]
+    try:
+        _check_not_future(dates)
+    except AssertionError as e:
+        raise DataFileError(abs_path, None, date_col + 1, str(e))
+
+    return dates, list(columns.keys()), types, currencies, matrix
+
+
+def find_data_files(target):
+    """
+    Expand an import target into a list of data files.
+    :param target: A file, a directory (all .csv files within it) or a glob pattern
+    :return: Sorted list of paths
+    """
+    if os.path.isdir(target):
+        return sorted(glob.glob(os.path.join(target, "*.csv")))
+    if os.path.isfile(target):
+        return [target]
+    return sorted(x for x in glob.glob(target) if os.path.isfile(x))
+
+
+def read_data_file(abs_path):
+    """
+    Read a data file in either supported layout, picked from the header row:
+        wide: Account,Type[,Currency],<date>,<date>,... with one row per account (as written by Context.save_to_csv)
+        long: Date,Account,Type,Value[,Currency] with one row per entry
+    The file is streamed row by row. Any problem is raised as a DataFileError giving the row and column.
+    A SQLite database (see storage.SqliteStorage) is read as well, so databases can be imported like any other file.
+    :param abs_path: Absolute path to the csv
+    :return: dates (list of datetimes), names, types, currencies, values ((dates x accounts) array, NaN for no entry)
+    """
+    if storage_backend(abs_path) == "sqlite":
+        database = SqliteStorage(abs_path, read_only=True)
+        try:
+            return database.read()
+        finally:
+            database.close()
+
+    with open(abs_path, newline="") as csv_file:
+        read_in = csv.reader(csv_file, delimiter=",")
+        header = next(read_in, None)
+        if header is None:
+            # A blank file is a valid, empty, data set
+            return [], [], [], [], np.zeros((0, 0))
+        if _detect_layout(abs_path, header) == "wide":
+            return _read_wide_rows(abs_path, header, read_in)
+        return _read_long_rows(abs_path, header, read_in)
+
+
+def _encode_edit(edit):
+    """
+    :param edit: Edit dictionary
+    :return: JSON-serialisable copy, as written to the journal
+    """
+    return dict(edit, date=encode_date(edit["date"])) if edit.get("date") is not None else dict(edit)
+
+
+def _decode_edit(entry):
+    """
+    :param entry: Edit dictionary as written by _encode_edit
+    :return: Edit dictionary
+    """
+    return dict(entry, date=decode_date(entry["date"])) if entry.get("date") is not None else dict(entry)
+
+
+def _read_edit_rows(abs_path):
+    """
+    :return: List of (row number, {column: raw value}) for the edits in a json or csv edits file
+    """
+    if abs_path.lower().endswith(".json"):
+        with open(abs_path) as f:
+            try:
+                data = json.load(f)
+            except ValueError as e:
+                raise DataFileError(abs_path, None, None, f"Not valid JSON: {e}")
+        data = data.get("edits") if isinstance(data, dict) else data
+        if not isinstance(data, list) or not all(isinstance(x, dict) for x in data):
+            raise DataFileError(abs_path, None, None, "Expected a list of edits, or an object with a list of edits.")
+        # Rows count the edits from 1
+        return [(idx, {k.strip().lower(): v for k, v in x.items()}) for idx, x in enumerate(data, start=1)]
+
+    with open(abs_path, newline="") as csv_file:
+        read_in = csv.reader(csv_file, delimiter=",")
+        header = [x.strip().lower() for x in next(read_in, [])]
+        if "operation" not in header:
+            raise DataFileError(abs_path, 1, None, f"Header must contain Operation, and any of {EDIT_HEADER[1:]}.")
+        return [(row_number, dict(zip(header, row))) for row_number, row in enumerate(read_in, start=2)
+                if any(x.strip() for x in row)]
+
+
+def read_edit_file(abs_path):
+    """
+    Read a batch of edits for Context.apply_edits. Either layout has one edit per row:
+        csv: Operation,Account,Type,Currency,Date,Value (in any order, unused columns may be left out)
+        json: [{"operation": ..., "account": ..., "date": ..., "value": ...}, ...], optionally as {"edits": [...]}.
+        An add_date may also give "values", an object of account name to value.
+    Dates are in any of the data file formats. Any problem is raised as a DataFileError giving the row (or for json,
+    the edit number) and column.
+    :param abs_path: Path to a .csv or .json file
+    :return: List of edit dictionaries with keys op, account, type, currency, date, value and values
+    """
+    rows = _read_edit_rows(abs_path)
+    columns = {x.lower(): idx + 1 for idx, x in enumerate(EDIT_HEADER)}
+    date_strings = list(dict.fromkeys(str(x["date"]).strip() for _, x in rows if str(x.get("date") or "").strip()))
+    try:
+        dates = dict(zip(date_strings, parse_date_column(date_strings))) if date_strings else {}
+    except AssertionError as e:
+        raise DataFileError(abs_path, None, columns["date"], str(e))
+
+    edits = []
+    for row_number, row in rows:
+        op = str(row.get("operation") or row.get("op") or "").strip().lower()
+        if op not in EDIT_OPERATIONS:
+            raise DataFileError(abs_path, row_number, columns["operation"],
+                                f"Invalid operation '{op}'. Must be from: {EDIT_OPERATIONS}")
+        name = str(row.get("account") or "").strip().title() or None
+        try:
+            value = parse_value(row.get("value"))
+        except ValueError as e:
+            raise DataFileError(abs_path, row_number, columns["value"], str(e))
+        try:
+            values = {str(k).strip().title(): parse_value(v) for k, v in (row.get("values") or {}).items()}
+        except (ValueError, AttributeError) as e:
+            raise DataFileError(abs_path, row_number, None, f"Invalid values: {e}")
+        if op == "add_date" and value is not None and name:
+            values[name] = value
+        edits.append({"op": op,
+                      "account": name,
+                      "type": str(row.get("type") or "").strip().title() or None,
+                      "currency": str(row.get("currency") or "").strip().upper() or None,
+                      "date": dates.get(str(row.get("date") or "").strip()),
+                      "value": value,
+                      "values": values})
+
+    return edits
+
+
+def read_rate_table(abs_path, base_currency=BASE_CURRENCY):
+    """
+    Read a table of exchange rates. The file has the columns Date,Currency,Rate (in any order) where Rate is the value
+    of one unit of Currency in the base currency from that date onwards.
+    :param abs_path: Path to the csv
+    :param base_currency: Currency the rates are quoted in
+    :return: RateTable
+    """
+    with open(abs_path, newline="") as csv_file:
+        read_in = csv.reader(csv_file, delimiter=",")
+        header = [x.strip().lower() for x in next(read_in, [])]
+        if not all(x.lower() in header for x in FX_HEADER):
+            raise DataFileError(abs_path, 1, None, f"Header must contain {FX_HEADER}.")
+        date_col, currency_col, rate_col = [header.index(x.lower()) for x in FX_HEADER]
+        rows = [(row_number, row) for row_number, row in enumerate(read_in, start=2) if any(x.strip() for x in row)]
+
+    try:
+        dates = parse_date_column([row[date_col] for _, row in rows])
+    except (AssertionError, IndexError) as e:
+        raise DataFileError(abs_path, None, date_col + 1, str(e))
+
+    by_currency = {}
+    for (row_number, row), date in zip(rows, dates):
+        try:
+            rate = parse_value(row[rate_col])
+        except ValueError as e:
+            raise DataFileError(abs_path, row_number, rate_col + 1, str(e))
+        if rate is None or rate <= 0:
+            raise DataFileError(abs_path, row_number, rate_col + 1, "Exchange rates must be positive numbers.")
+        ordinals, rates = by_currency.setdefault(row[currency_col].strip().upper(), ([], []))
+        ordinals.append(date.toordinal())
+        rates.append(rate)
+
+    table = RateTable(base_currency)
+    for currency, (ordinals, rates) in by_currency.items():
+        table.add_rates(currency, ordinals, rates)
+    stat = os.stat(abs_path)
+    table.source = {"path": os.path.abspath(abs_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    return table
+
+
+def data_file_path(backend="csv"):
+    """
+    :param backend: Storage backend from storage.STORAGE_BACKENDS
+    :return: Path of the main data file for that backend
+    """
+    return os.path.join(DATA_DIRECTORY, SQLITE_FILE_NAME if backend == "sqlite" else SAVE_FILE_NAME)
+
+
+def initialise_context(target_file, accounts=None, report=True):
     """
     Load an instance of the Context class from the location provided.
     :param target_file: A csv file with historical bank account data.
+    :param accounts: Optional list of account names to load up front. The rest are loaded when first needed, and
+    totals (which need every account) are left for the caller to generate.
+    :param report: Print a quick report of the loaded data.
     :return: A Context object to encapsulate the current saved data.
     """
-    c = Context(target_file)
-    c.generate_totals()
+    # Exchange rates are only needed if some accounts are not in pounds, but are picked up whenever they are there
+    fx_path = os.path.join(os.path.dirname(target_file), FX_FILE_NAME)
+    fx_rates = read_rate_table(fx_path) if os.path.exists(fx_path) else None
+    c = Context(target_file, accounts=accounts, fx_rates=fx_rates)
+    if not c.totals and accounts is None:
+        c.generate_totals()
 
-    # Report to the user the top-level of the context that has just been loaded
-    c.quick_report()
+    if report:
+        # Report to the user the top-level of the context that has just been loaded
+        c.quick_report()
 
     return c
@@ -0,0 +1,85 @@
+import numpy as np
+
+# none: plot every point.
+# lttb: largest-triangle-three-buckets, one point per bucket chosen to preserve the visual shape of the line.
+# minmax: the lowest and highest point of each bucket, so no peak or trough is ever lost.
+DOWNSAMPLE_METHODS = ["none", "lttb", "minmax"]
+DEFAULT_DOWNSAMPLE = "lttb"
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-triangle-three-buckets downsampling. The first and last points are kept and the rest of the series is
+    split into n_out - 2 buckets. From each bucket the point forming the largest triangle with the previously kept
+    point and the average of the next bucket is kept.
+    :param x: 1D array of sorted x values
+    :param y: 1D array of y values
+    :param n_out: Number of points to return
+    :return: (x, y) arrays of at most n_out points
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 1 < n_out - 2:
+            next_x, next_y = mean_x[i + 1], mean_y[i + 1]
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+
+    return x[keep], y[keep]
+
+
+def min_max(x, y, n_out):
+    """
+    Keep the lowest and highest point of each of n_out / 2 equal-width buckets (plus the end points), in order.
+    :param x: 1D array of sorted x values
+    :param y: 1D array of y values
+    :param n_out: Approximate number of points to return
+    :return: (x, y) arrays
+    """
+    n = len(x)
+    if n_out >= n or n_out < 4:
+        return x, y
+
+    n_buckets = n_out // 2
+    bucket = np.arange(n) * n_buckets // n
+    # Sort by bucket, then by value, so each bucket's minimum and maximum sit at its two ends
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket[order], np.arange(n_buckets))
+    ends = np.append(starts[1:], n) - 1
+    keep = np.unique(np.concatenate([order[starts], order[ends], [0, n - 1]]))
+
+    return x[keep], y[keep]
+
+
+def downsample(x, y, n_out, method=DEFAULT_DOWNSAMPLE):
+    """
+    Reduce a series to roughly n_out points with the chosen method.
+    :param x: 1D array of sorted x values
+    :param y: 1D array of y values
+    :param n_out: Target number of points
+    :param method: One of DOWNSAMPLE_METHODS
+    :return: (x, y) arrays
+    """
+    assert method in DOWNSAMPLE_METHODS, f"Invalid downsample method {method}. Must be from: {DOWNSAMPLE_METHODS}"
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if method == "lttb":
+        return lttb(x, y, n_out)
+    if method == "minmax":
+        return min_max(x, y, n_out)
+    return x, y
@@ -0,0 +1,157 @@
+import csv
+import io
+import json
+import os
+import sys
+
+from account_store import format_value
+from data_handler import OUTPUT_DATE_FORMAT
+from journal import encode_date
+from profiling import timed
+
+EXPORT_LAYOUTS = ["long", "jsonl"]
+# Files with these extensions are exported as JSON Lines
+JSONL_SUFFIXES = (".jsonl", ".ndjson")
+# Columns of a long export. Without the totals, read_data_file reads it straight back in.
+LONG_EXPORT_HEADER = ["Date", "Account", "Type", "Currency", "Value"]
+# Dates read from the store and written out at a time, so memory stays flat however long the history is
+EXPORT_BLOCK_DATES = 256
+
+
+def export_layout(path):
+    """
+    :param path: Path to export to, or - for stdout
+    :return: The layout from EXPORT_LAYOUTS that suits the path, or None for a data file saved by Context.save
+    """
+    if path.lower().endswith(JSONL_SUFFIXES):
+        return "jsonl"
+    return "long" if path == "-" else None
+
+
+def _columns(c, totals):
+    """
+    :return: (name, type, currency) of every account, followed by the totals if they are wanted
+    """
+    columns = list(zip(c.store.names, c.store.types, c.store.currencies))
+    if totals and c.totals:
+        columns.extend((x, "Total", c.reporting_currency) for x in c.totals)
+    return columns
+
+
+def _blocks(c, totals):
+    """
+    Read the store, and the totals store if wanted, EXPORT_BLOCK_DATES dates at a time.
+    :return: Generator of (dates, values, present) for each block, with values and present lists of rows over the
+    columns of _columns
+    """
+    c._require_all()
+    store = c.store
+    totals_store = c._totals_store if totals and c.totals else None
+    dates = c.all_dates
+    for start in range(0, store.n_dates, EXPORT_BLOCK_DATES):
+        stop = start + EXPORT_BLOCK_DATES
+        values = store.values[start:stop].tolist()
+        present = store.present[start:stop].tolist()
+        if totals_store is not None:
+            # Totals are sums of many floats, so they are rounded back to pennies. They have a value on every date.
+            values = [x + y for x, y in zip(values, totals_store.values[start:stop].round(2).tolist())]
+            present = [x + [True] * totals_store.n_accounts for x in present]
+        yield dates[start:stop], values, present
+
+
+def iter_entries(c, totals=True):
+    """
+    Every entry of the Context, a date at a time in date order.
+    :param c: Context
+    :param totals: Follow the accounts on each date with the totals
+    :return: Generator of (date, account, type, currency, value) tuples
+    """
+    columns = _columns(c, totals)
+    for dates, values, present in _blocks(c, totals):
+        for date, row, flags in zip(dates, values, present):
+            for (name, account_type, currency), v, p in zip(columns, row, flags):
+                if p:
+                    yield date, name, account_type, currency, v
+
+
+def long_csv_chunks(c, totals=True):
+    """
+    The Context as a long-format csv, with the columns of LONG_EXPORT_HEADER and one row per entry.
+    :param c: Context
+    :param totals: Include the totals, as accounts of type Total
+    :return: Generator of blocks of csv text
+    """
+    buffer = io.StringIO()
+    write_out = csv.writer(buffer, delimiter=",", lineterminator="")
+    # Account, Type and Currency sit together, so they are quoted once per account rather than once per row
+    middles = []
+    for column in _columns(c, totals):
+        write_out.writerow(column)
+        middles.append(buffer.getvalue())
+        buffer.seek(0)
+        buffer.truncate()
+
+    yield ",".join(LONG_EXPORT_HEADER) + "\n"
+    for dates, values, present in _blocks(c, totals):
+        lines = []
+        for date, row, flags in zip(dates, values, present):
+            date_str = date.strftime(OUTPUT_DATE_FORMAT)
+            lines.extend(f"{date_str},{m},{format_value(v)}\n" for m, v, p in zip(middles, row, flags) if p)
+        yield "".join(lines)
+
+
+def jsonl_chunks(c, totals=True):
+    """
+    The Context as JSON Lines, one object per entry, e.g.
+        {"date": "2020-01-31", "account": "Savings", "type": "Savings", "currency": "GBP", "value": 100.0}
+    :param c: Context
+    :param totals: Include the totals, as accounts of type Total
+    :return: Generator of blocks of JSON Lines text
+    """
+    middles = [", ".join(f"{json.dumps(k)}: {json.dumps(v)}" for k, v in zip(["account", "type", "currency"], x))
+               for x in _columns(c, totals)]
+    for dates, values, present in _blocks(c, totals):
+        lines = []
+        for date, row, flags in zip(dates, values, present):
+            date_str = encode_date(date)
+            lines.extend(f'{{"date": "{date_str}", {m}, "value": {float(v)!r}}}\n'
+                         for m, v, p in zip(middles, row, flags) if p)
+        yield "".join(lines)
+
+
+_EXPORTERS = {"long": long_csv_chunks, "jsonl": jsonl_chunks}
+
+
+@timed("exporters.write_export")
+def write_export(c, path, layout=None, totals=True):
+    """
+    Stream the Context out to a file or stdout. A file is written alongside and renamed into place, like a save.
+    :param c: Context
+    :param path: Path to write to, or - for stdout
+    :param layout: Layout from EXPORT_LAYOUTS. Defaults to the one picked by export_layout, or long.
+    :param totals: Include the totals
+    :return: True if written successfully
+    """
+    layout = layout or export_layout(path) or "long"
+    assert layout in EXPORT_LAYOUTS, f"Invalid export layout {layout}. Must be from: {EXPORT_LAYOUTS}"
+    chunks = _EXPORTERS[layout](c, totals)
+    if path == "-":
+        try:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # Whatever was reading stopped early, e.g. head. Point stdout at nothing so exiting does not complain.
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return True
+
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "w", newline="") as export_file:
+            for chunk in chunks:
+                export_file.write(chunk)
+        os.replace(temp_path, path)
+    except OSError:
+        print(f"Could not write to {path}")
+        return False
+    return True
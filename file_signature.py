@@ -0,0 +1,49 @@
+import os
+
+
+def file_hash(path):
+    """
+    SHA1 of a file, read in blocks.
+    :param path: Path to the file
+    :return: hex digest
+    """
+    # Only needed when a file has been touched without changing size, so not imported up front
+    import hashlib
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_signature(path, with_hash=False):
+    """
+    Describe the state of a data file, so that the caches and the journal kept next to it can tell whether it has
+    changed since they were written.
+    :param path: Path to a data file
+    :param with_hash: Also take the SHA1 of the file, so that a file touched without being changed still matches
+    :return: Dictionary of size and mtime_ns, and sha1 if asked for
+    """
+    stat = os.stat(path)
+    signature = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        signature["sha1"] = file_hash(path)
+    return signature
+
+
+def signature_matches(signature, path):
+    """
+    Check a stored signature against a data file. Size and modification time are checked first, the hash (when the
+    signature has one) is only computed when the file has been touched without its size changing.
+    :param signature: As returned by file_signature, or None
+    :param path: Path to the data file
+    :return: True if the data file is unchanged
+    """
+    if not signature or not os.path.exists(path):
+        return False
+    current = file_signature(path)
+    if current["size"] != signature.get("size"):
+        return False
+    if current["mtime_ns"] == signature.get("mtime_ns"):
+        return True
+    return "sha1" in signature and file_hash(path) == signature["sha1"]
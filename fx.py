@@ -0,0 +1,114 @@
+import datetime as dt
+
+import numpy as np
+
+# The rate table sits next to the data file, e.g. files/fx_rates.csv
+FX_FILE_NAME = "fx_rates.csv"
+FX_HEADER = ["Date", "Currency", "Rate"]
+# Rates in the table are the value of one unit of each currency in this currency
+BASE_CURRENCY = "GBP"
+# Number of (currency, date axis) conversions kept by a RateTable
+FX_CACHE_SIZE = 64
+CURRENCY_SYMBOLS = {"GBP": "£",
+                    "USD": "$",
+                    "EUR": "€",
+                    "JPY": "¥"}
+
+
+def currency_symbol(currency):
+    """
+    :param currency: Currency code
+    :return: The symbol for the currency, or the code followed by a space if it has no symbol
+    """
+    return CURRENCY_SYMBOLS.get(currency, f"{currency} ")
+
+
+def format_money(value, currency=BASE_CURRENCY):
+    """
+    :param value: Amount
+    :param currency: Currency code
+    :return: e.g. £12.50, or CHF 12.50
+    """
+    return f"{currency_symbol(currency)}{value:.2f}"
+
+
+class RateTable(object):
+    """
+    Exchange rates for any number of currencies on any number of dates, each held as a sorted array of day ordinals
+    and an array of rates against the base currency. A rate applies from its date until the next rate for that
+    currency, so a conversion on any date uses the nearest previous rate.
+    """
+    def __init__(self, base_currency=BASE_CURRENCY):
+        """
+        :param base_currency: Currency the rates are quoted in
+        """
+        self.base_currency = base_currency
+        self._ordinals = {}
+        self._rates = {}
+        # (from currency, to currency, date axis bytes): factors, in least recently added order
+        self._cache = {}
+        # Describes where the rates came from, so totals calculated with them can be matched up later
+        self.source = None
+
+    @property
+    def currencies(self):
+        return [self.base_currency] + list(self._rates.keys())
+
+    def add_rates(self, currency, ordinals, rates):
+        """
+        Add rates for a currency. Rates on dates already in the table replace the old ones.
+        :param currency: Currency code
+        :param ordinals: Day ordinals of the rates
+        :param rates: Value of one unit of the currency in the base currency on each date
+        :return: None
+        """
+        assert currency != self.base_currency, f"Rates cannot be given for the base currency {currency}."
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        rates = np.asarray(rates, dtype=np.float64)
+        assert len(ordinals) == len(rates), "There must be one rate per date."
+        assert np.all(rates > 0), f"Exchange rates for {currency} must be positive."
+        if currency in self._rates:
+            ordinals = np.concatenate([self._ordinals[currency], ordinals])
+            rates = np.concatenate([self._rates[currency], rates])
+        # Keep the last rate given for each date
+        unique_ordinals, last = np.unique(ordinals[::-1], return_index=True)
+        self._ordinals[currency] = unique_ordinals
+        self._rates[currency] = rates[::-1][last]
+        self._cache.clear()
+
+    def _rates_on(self, currency, ordinals):
+        """
+        Value of one unit of a currency in the base currency on many dates, using the nearest previous rate.
+        :param currency: Currency code
+        :param ordinals: 1D array of day ordinals
+        :return: 1D float array
+        """
+        if currency == self.base_currency:
+            return np.ones(len(ordinals))
+        if currency not in self._rates:
+            raise ValueError(f"No exchange rates for {currency}.")
+        idx = np.searchsorted(self._ordinals[currency], ordinals, side="right") - 1
+        if np.any(idx < 0):
+            first = dt.date.fromordinal(int(ordinals[idx < 0].min()))
+            raise ValueError(f"No exchange rate for {currency} on or before {first}.")
+        return self._rates[currency][idx]
+
+    def factors(self, currency, target, ordinals):
+        """
+        Multipliers that convert values in one currency to another on each date, in one batched lookup. Results are
+        cached by currency pair and date axis, so converting many accounts that share a currency only looks the rates
+        up once.
+        :param currency: Currency to convert from
+        :param target: Currency to convert to
+        :param ordinals: 1D array of day ordinals
+        :return: 1D float array the same length as ordinals. Do not modify it, it is shared through the cache.
+        """
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        if currency == target:
+            return np.ones(len(ordinals))
+        key = (currency, target, ordinals.tobytes())
+        if key not in self._cache:
+            if len(self._cache) >= FX_CACHE_SIZE:
+                del self._cache[next(iter(self._cache))]
+            self._cache[key] = self._rates_on(currency, ordinals) / self._rates_on(target, ordinals)
+        return self._cache[key]
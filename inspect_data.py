@@ -1,10 +1,16 @@
 import argparse
+import math
 import os
+import shutil
+import sys
 import datetime as dt
 from ast import literal_eval
 
-from data_handler import BankAccount, Context, initialise_context
-from data_handler import ACCOUNT_TYPES, OUTPUT_DATE_FORMAT, DATA_DIRECTORY, SAVE_FILE_NAME
+from journal import JOURNAL_COMPACT_ENTRIES
+import daemon
+import profiling
+# Everything that needs numpy (data_handler and the modules built on it) is imported by the functions that use it, so
+# that a query, which is answered by the daemon, starts without it
 
 
 def parse_args():
@@ -13,16 +19,38 @@ def parse_args():
     :return: command line arguments
     """
     parser = argparse.ArgumentParser()
-    parser.add_argument("-a", "--action", help="Via commandline the programme can be instructed", required=True, choices=["print", "edit", "auto_update"])
-    parser.add_argument("-t", "--target", help="The path to a .csv file that contains banking information")
+    parser.add_argument("-a", "--action", help="Via commandline the programme can be instructed", required=True,
+                        choices=["print", "edit", "auto_update", "compact", "apply", "export", "serve", "query"])
+    parser.add_argument("-t", "--target", help="The path to a .csv file that contains banking information. "
+                                                 "For auto_update this may also be a directory or glob pattern. "
+                                                 "For apply, a .csv or .json file of edits. For export, the file to "
+                                                 "write, as a SQLite database if it ends in .db or JSON Lines if it "
+                                                 "ends in .jsonl, or - to stream to stdout.")
+    parser.add_argument("-q", "--query", help="For query, a JSON request for the daemon started with -a serve, e.g. "
+                                              '\'{"query": "value", "account": "Savings", "date": "2020-01-31"}\', '
+                                              "or - to read one request per line from stdin", default="-")
+    # Choices are listed here rather than taken from storage, tables and exporters, so that a query does not import
+    # them (or numpy)
+    parser.add_argument("-s", "--storage", help="Where the data is kept, latest_data.csv or latest_data.db",
+                        choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("-f", "--format", help="How print mode writes tables of values. text lines up the columns, "
+                                               "csv and json give the raw values", choices=["text", "csv", "json"])
+    parser.add_argument("-l", "--layout", help="For export, stream one row per entry (and per total) rather than "
+                                               "saving a data file. long is a csv, jsonl is JSON Lines",
+                        choices=["long", "jsonl"])
+    parser.add_argument("--profile", help="Time the main steps of the run and write a JSON summary on exit, to this "
+                                          "file or to stderr if no file is given", nargs="?", const="-")
+    parser.add_argument("--profile-memory", help="With --profile, also record the peak memory of each step",
+                        action="store_true")
 
     return parser.parse_args()
 
 
-def print_context(context):
+def print_context(context, table_format=None):
     """
     Allow for the user to interact with some print options.
     :param context: Context object to be printed.
+    :param table_format: Format for tables of values, from tables.TABLE_FORMATS. Defaults to tables.DEFAULT_TABLE_FORMAT
     :return: None
     """
     while True:
@@ -44,7 +72,11 @@ def print_context(context):
                 # TODO this might need to be thought through more. Else seems weird
         # Exiting the top loop, we can now perform the edit function selected
         print("")
-        PRINT_FUNCTIONS[int(resp)-1](context)
+        print_function = PRINT_FUNCTIONS[int(resp)-1]
+        if print_function in TABLE_PRINT_FUNCTIONS:
+            print_function(context, table_format)
+        else:
+            print_function(context)
 
         # Do we want to do anything else?
         resp = validate_user_input_list("\nDo you want to print any other information in this session? (y/n): ",
@@ -55,12 +87,24 @@ def print_context(context):
     return context
 
 
-def _print_account(c):
+def _table_pages():
+    """
+    :return: Keyword arguments for tables.write_table, pausing after each screenful when printing to a terminal
+    """
+    if not sys.stdout.isatty():
+        return {}
+    return {"page_rows": max(shutil.get_terminal_size().lines - 2, 1),
+            "more": lambda: input("-- More (hit enter to continue, q to stop) --").strip().lower() != "q"}
+
+
+def _print_account(c, table_format=None):
     """
     Print data for a single account.
     :param c: Context object
+    :param table_format: Format for the table, from tables.TABLE_FORMATS. Defaults to tables.DEFAULT_TABLE_FORMAT
     :return: None
     """
+    import tables
     print("   ---  Print an Account  ---\n")
     print("The bank accounts currently loaded are:")
     for bc_name in c.all_accounts.keys():
@@ -71,47 +115,126 @@ def _print_account(c):
     account_name = validate_user_input_list("\nWhat is the name of the account to be printed?: ", options)
 
     if account_name.lower() == "total money":
-        c.totals["Total Money"].print_status()
+        tables.write_table(tables.account_table(c, "Total Money"), table_format, **_table_pages())
     else:
         for key in c.all_accounts.keys():
             if key.lower() == account_name.lower():
-                c.all_accounts[account_name].print_status()
+                tables.write_table(tables.account_table(c, key), table_format, **_table_pages())
 
 
+def _list_dates(c):
+    """
+    Print every date of the Context in one go.
+    :param c: Context object
+    :return: Dictionary of each date as written in OUTPUT_DATE_FORMAT to the datetime
+    """
+    from data_handler import OUTPUT_DATE_FORMAT
+    dates = {x.strftime(OUTPUT_DATE_FORMAT): x for x in c.all_dates}
+    print("The dates currently loaded are:")
+    sys.stdout.write("".join(f"    {x}\n" for x in dates))
+    return dates
+
 
-def _print_date(c):
+def _print_date(c, table_format=None):
     """
     Print data for a single date.
     :param c: Context object
+    :param table_format: Format for the table, from tables.TABLE_FORMATS. Defaults to tables.DEFAULT_TABLE_FORMAT
     :return: None
     """
+    import tables
     print("   ---  Print a Date  ---\n")
+    dates = _list_dates(c)
     while True:
-        print("The dates currently loaded are:")
-        for date in c.all_dates:
-            print(f"    {date.strftime(OUTPUT_DATE_FORMAT)}")
         target_date = double_check_user_input("Which date would you like to print? (please use format 01-Jan-1990): ")
-        if target_date in [x.strftime(OUTPUT_DATE_FORMAT) for x in c.all_dates]:
+        if target_date in dates:
             break
         else:
             print("Invalid date entered. Retrying")
-    target_date = dt.datetime.strptime(target_date, OUTPUT_DATE_FORMAT)
-    c.date_report(target_date)
+    tables.write_table(tables.date_table(c, [dates[target_date]]), table_format)
 
 
-def _print_all(c):
+@profiling.timed("inspect_data._print_all")
+def _print_all(c, table_format=None):
     """
-    Printall data in the context.
+    Print all data in the context, as one table of every account and total on every date.
     :param c: Context object
+    :param table_format: Format for the table, from tables.TABLE_FORMATS. Defaults to tables.DEFAULT_TABLE_FORMAT
     :return: None
     """
+    import tables
     print("   ---  Print All Data  ---\n")
-    for date in c.all_dates:
-        print(f"    ---  {date.strftime(OUTPUT_DATE_FORMAT)}  ---")
-        c.date_report(date)
+    tables.write_table(tables.date_table(c), table_format, **_table_pages())
+
+
+def _print_periods(c):
+    """
+    Print a summary of every account for each month, quarter or year.
+    :param c: Context object
+    :return: None
+    """
+    from rollups import PERIODS
+    print("   ---  Print Period Summaries  ---\n")
+    period = validate_user_input_list(f"Summarise by which period? ({'/'.join(PERIODS)}): ", PERIODS)
+    c.period_report(period.lower())
+
+
+def _print_growth(c):
+    """
+    Print the annual growth of every account, and how much each account added to Total Worth in each period.
+    :param c: Context object
+    :return: None
+    """
+    import analytics
+    from data_handler import OUTPUT_DATE_FORMAT
+    from fx import format_money
+    from rollups import PERIODS
+    print("   ---  Print Growth and Contributions  ---\n")
+    period = validate_user_input_list(f"Break down by which period? ({'/'.join(PERIODS)}): ", PERIODS).lower()
+    names = c.store.names
+    growth = analytics.annualized_growth(c)
+    print("    ---  Annual Growth  ---")
+    for n, rate in zip(names, growth):
+        print(f"    {n} - {'n/a' if math.isnan(rate) else f'{rate:.2%}'}")
+    print("")
+
+    dates, contributions = analytics.contributions(c, period=period)
+    for idx in range(1, len(dates)):
+        print(f"    ---  Total Worth change to {dates[idx].strftime(OUTPUT_DATE_FORMAT)}: "
+              f"{format_money(contributions[idx - 1].sum(), c.reporting_currency)}  ---")
+        for col in (-abs(contributions[idx - 1])).argsort():
+            if contributions[idx - 1, col]:
+                print(f"    {names[col]} - {format_money(contributions[idx - 1, col], c.reporting_currency)}")
         print("")
 
 
+def _print_projection(c, table_format=None):
+    """
+    Print a Monte Carlo projection of the totals, year by year.
+    :param c: Context object
+    :param table_format: Format for the table, from tables.TABLE_FORMATS. Defaults to tables.DEFAULT_TABLE_FORMAT
+    :return: None
+    """
+    from data_handler import OUTPUT_DATE_FORMAT
+    import projection
+    import tables
+    print("   ---  Print Projection  ---\n")
+    years = int(validate_user_input_types("How many years ahead should the totals be projected?: ", [int]))
+    while years <= 0:
+        years = int(validate_user_input_types(f"    {years} is not a positive number of years. Retrying: ", [int]))
+    result = projection.project(c, years, accounts=[])
+    print(f"Percentiles of {result.n_paths} simulated paths:")
+
+    steps = range(0, len(result.dates), projection.STEPS_PER_YEAR)
+    names = result.bands.keys()
+    header = ["Date", "Total", "Currency"] + [f"{x}%" for x in result.percentiles]
+    columns = [[result.dates[x].strftime(OUTPUT_DATE_FORMAT) for _ in names for x in steps],
+               [n for n in names for _ in steps], [c.reporting_currency] * (len(names) * len(steps))]
+    for idx in range(len(result.percentiles)):
+        columns.append([result.bands[n][idx, x] for n in names for x in steps])
+    tables.write_table(tables.Table(header, columns, money={x: "Currency" for x in header[3:]}), table_format)
+
+
 def edit_context(context):
     """
     Allow for the Context instance to be manually edited by the user on run_time
@@ -225,13 +348,23 @@ def _add_account(c):
     :param c: Context object to edit
     :return: edited Context object
     """
+    from data_handler import BankAccount, ACCOUNT_TYPES, OUTPUT_DATE_FORMAT
+    from fx import BASE_CURRENCY
     print("   ---  Add an Account  ---\n")
     while True:
         account_name = double_check_user_input("What is the name of the account to be added?: ")
 
         account_type = validate_user_input_list("What type of account is it?: ",ACCOUNT_TYPES)
 
-        _bc = BankAccount(account_name, account_type)
+        while True:
+            currency = input(f"What currency is the account in? (just hit enter for {BASE_CURRENCY}): ").strip().upper()
+            currency = currency or BASE_CURRENCY
+            try:
+                c.check_currency(currency, c.all_dates)
+                break
+            except ValueError as e:
+                print(f"{e} Retrying")
+        _bc = BankAccount(account_name, account_type, currency)
         # Get a value for the account for all dates
 
         for date in c.all_dates:
@@ -266,6 +399,8 @@ def _add_date(c):
     :param c: Context object to edit
     :return: edited Context object
     """
+    from data_handler import OUTPUT_DATE_FORMAT
+    from fx import currency_symbol
     print("   ---  Add a Date  ---\n")
     while True:
         while True:
@@ -285,13 +420,10 @@ def _add_date(c):
 
         print(f"Please check the values and dates for {new_date_str}:")
         for n, v in temp_value_store.items():
-            print(f"    {n} ({c.all_accounts[n].type}) - £{v}")
+            print(f"    {n} ({c.all_accounts[n].type}) - {currency_symbol(c.all_accounts[n].currency)}{v}")
         check_resp = validate_user_input_list("\nAre the above details correct? (y/n): ",["y","n"])
         if check_resp.lower() == "y":
-            # TODO Unless something changes, we will want to move the 3 lines below into a Context function to ensure date is appended.
-            for bc_name in c.all_accounts.keys():
-                c.all_accounts[bc_name].add_entry(temp_value_store[bc_name], new_date)
-            c.all_dates.append(new_date)
+            c.add_date(new_date, temp_value_store)
             print(f"\nNew date: {new_date_str} added successfully.")
             break
         else:
@@ -326,7 +458,7 @@ def _remove_account(c):
     # Confirming the key to delete by running the same check as was run to validate the account selection.
     for key in c.all_accounts.keys():
         if key.lower() == target_account.lower():
-            del c.all_accounts[key]
+            c.remove_account(key)
             print(f"{key} deleted.")
             break
 
@@ -340,12 +472,10 @@ def _remove_date(c):
     :return: edited Context object
     """
     print("   ---  Remove a Date  ---\n")
+    dates = _list_dates(c)
     while True:
-        print("The dates currently loaded are:")
-        for date in c.all_dates:
-            print(f"    {date.strftime(OUTPUT_DATE_FORMAT)}")
         target_date = double_check_user_input("Which date would you like to remove? (please use format 01-Jan-1990): ")
-        if target_date in [x.strftime(OUTPUT_DATE_FORMAT) for x in c.all_dates]:
+        if target_date in dates:
             check_resp = validate_user_input_list(f"Type 'Delete' to confirm deletion of {target_date}. Type 'Cancel' to abort: ",
                                         ["delete", "cancel"]).lower()
             if check_resp.lower() == "delete":
@@ -357,12 +487,7 @@ def _remove_date(c):
         else:
             print(f"{target_date} does not exist. Retrying.")
 
-    for bc_name, _bc in c.all_accounts.items():
-        del _bc.history[target_date]
-    for date in c.all_dates:
-        if date.strftime(OUTPUT_DATE_FORMAT) == target_date:
-            c.all_dates.remove(date)
-            break
+    c.remove_date(dates[target_date])
     print(f"{target_date} deleted.")
 
     return c
@@ -374,6 +499,7 @@ def _edit_single_value(c):
     :param c: Context object to edit
     :return: edited Context object
     """
+    from data_handler import OUTPUT_DATE_FORMAT
     print("   ---  Remove a Single Entry  ---\n")
     while True:
         print("The bank accounts currently loaded are:")
@@ -391,25 +517,29 @@ def _edit_single_value(c):
             target_account = name
             break
 
+    _bc = c.all_accounts[target_account]
+    date_strings = [x.strftime(OUTPUT_DATE_FORMAT) for x in c.all_dates]
     while True:
         print(f"The dates currently loaded  for {target_account} are:")
-        for date in c.all_accounts[target_account].history.keys():
+        for date in date_strings:
             print(f"    {date}")
         target_date = double_check_user_input("Which date would you like to edit? (please use format 01-Jan-1990): ")
-        if target_date in c.all_accounts[target_account].history.keys():
+        if target_date in date_strings:
             break
         else:
             print(f"{target_date} is not present. Retrying")
+    target_date_obj = c.all_dates[date_strings.index(target_date)]
 
     while True:
-        print(f"Current value of {target_account} on {target_date} - {c.all_accounts[target_account].history[target_date]}")
+        current_value = _bc.get_value_on_date(target_date_obj)
+        print(f"Current value of {target_account} on {target_date} - {current_value}")
         new_value = validate_user_input_types("What is the new value: ", [int, float, str])
-        check_resp = validate_user_input_list(f"Overwrite the value {c.all_accounts[target_account].history[target_date]}"
+        check_resp = validate_user_input_list(f"Overwrite the value {current_value}"
                                               f" with {new_value}? (y/n): ", ["y", "n"])
         if check_resp == "y":
             break
 
-    c.all_accounts[target_account].history[target_date] = new_value
+    c.set_value(target_account, target_date_obj, new_value)
     print(f"The new value of {target_account} on {target_date} is {new_value}")
 
     return c
@@ -421,6 +551,7 @@ def handle_no_file(path):
     :param path: path where the file was expected to be
     :return: None
     """
+    from data_handler import BankAccount, Context
     print(f"{path} does not exist.")
     while True:
         while True:
@@ -446,13 +577,12 @@ def handle_no_file(path):
             print("Creating an example .csv file.")
             _c = Context(path, populate=False)
             dates_in = ["01-Jan-2020", "01-Jan-2021", "01-Jan-2022"]
-            _c.all_dates = [dt.datetime.strptime(x, OUTPUT_DATE_FORMAT) for x in dates_in]
             for acc_name, acc_type in zip(["A", "B", "C"], ["Current", "Savings", "Credit"]):
                 _bc = BankAccount(acc_name, acc_type)
                 for date in dates_in:
                     _bc.add_entry(1, date)
                 _c.add_account(_bc)
-            _c.save_to_csv(path, allow_overwrite=True)
+            _c.save(path, allow_overwrite=True)
             print(f"{path} created successfully.")
         elif resp == "2":
             pass
@@ -461,20 +591,33 @@ def handle_no_file(path):
 
 def exit_programme(context, save_path, overwrite_save=False):
     """
-    Save stuff maybe
+    Save stuff maybe. Edits made to a Context loaded from save_path are already in its journal, so the csv is only
+    rewritten once the journal has grown past JOURNAL_COMPACT_ENTRIES.
     :param context: The current Context object to be handled before exiting.
     save_path: Full Windows Path to a csv file.
     :param overwrite_save: Replace a file if it already exists.
     :return: None
     """
-    # TODO work out how this function fits in and any additional functionality
-    context.save_to_csv(save_path, overwrite_save)
+    if not context.test_updated():
+        # Nothing was changed during this run, so there is nothing to write
+        return
+    if context.database is not None and context.database.path == save_path:
+        # Every edit has already been written into the database
+        return
+    if context.journal is not None and context.journal.csv_path == save_path:
+        if context.journal.entry_count >= JOURNAL_COMPACT_ENTRIES:
+            context.compact()
+    else:
+        context.save_to_csv(save_path, overwrite_save)
 
 # Defining a list of functions now that they have been created
 EDIT_OPTIONS = ["Add Account", "Add Date", "Remove Account", "Remove Date", "Edit Single Value"]
 EDIT_FUNCTIONS = [_add_account, _add_date, _remove_account, _remove_date, _edit_single_value]
-PRINT_OPTIONS = ["Print Account", "Print Date", "Print All"]
-PRINT_FUNCTIONS = [_print_account, _print_date, _print_all]
+PRINT_OPTIONS = ["Print Account", "Print Date", "Print All", "Print Period Summaries", "Print Growth and Contributions",
+                 "Print Projection"]
+PRINT_FUNCTIONS = [_print_account, _print_date, _print_all, _print_periods, _print_growth, _print_projection]
+# Print functions that write tables of values, and so take a table format
+TABLE_PRINT_FUNCTIONS = [_print_account, _print_date, _print_all, _print_projection]
 
 
 def main(args):
@@ -483,22 +626,52 @@ def main(args):
     :param args: Parseargs executed.
     :return: None
     """
-    file_path = os.path.join(DATA_DIRECTORY, SAVE_FILE_NAME)
+    if args.profile:
+        profiling.enable(args.profile, args.profile_memory)
+    if args.action == "query":
+        # Answered by the daemon, without loading (or importing) anything here
+        failed = daemon.run_client(daemon.DEFAULT_SOCKET_PATH, sys.stdin if args.query == "-" else [args.query])
+        sys.exit(1 if failed else 0)
+    from data_handler import initialise_context, read_edit_file, data_file_path, DATA_DIRECTORY
+    file_path = data_file_path(args.storage)
     os.makedirs(DATA_DIRECTORY, exist_ok=True)
 
     if not os.path.exists(file_path):
         # TODO add handling for the blank file created by the blank file option
         handle_no_file(file_path)
 
-    fullContext = initialise_context(file_path)
+    if args.action == "serve":
+        daemon.QueryServer(file_path).run()
+        return
+
+    # The report is only worth printing before an interactive session
+    fullContext = initialise_context(file_path, report=args.action in ["print", "edit"])
 
     if args.action == "auto_update":
-        assert os.path.exists(args.target), f"{args.target} is an invalid filepath. Cannot update."
+        assert args.target, "A file, directory or glob pattern must be given with -t to update from."
         fullContext.update_from_file(args.target)
     elif args.action == "print":
-        print_context(fullContext)
+        print_context(fullContext, args.format)
     elif args.action == "edit":
         fullContext = edit_context(fullContext)
+    elif args.action == "compact":
+        fullContext.compact()
+    elif args.action == "apply":
+        assert args.target, "A file of edits must be given with -t to apply."
+        edits = read_edit_file(args.target)
+        fullContext.apply_edits(edits)
+        # The batch goes straight into the data file rather than waiting in the journal
+        fullContext.compact()
+        print(f"Applied {len(edits)} edits from {args.target}.")
+    elif args.action == "export":
+        assert args.target, "A file to export to must be given with -t, or - for stdout."
+        import exporters
+        layout = args.layout or exporters.export_layout(args.target)
+        if layout is not None:
+            if exporters.write_export(fullContext, args.target, layout) and args.target != "-":
+                print(f"Exported to {args.target}.")
+        elif fullContext.save(args.target, allow_overwrite=True):
+            print(f"Exported to {args.target}.")
 
     # Exit by saving to the file
     exit_programme(fullContext, file_path, overwrite_save=True)
@@ -0,0 +1,82 @@
+import numpy as np
+
+# step: carry the last known value forward until the next entry.
+# linear: straight line between neighbouring entries.
+# monotone: piecewise cubic (Fritsch-Carlson) that never overshoots neighbouring entries.
+INTERPOLATION_METHODS = ["step", "linear", "monotone"]
+DEFAULT_INTERPOLATION = "linear"
+
+
+def _monotone_slopes(known_x, known_y):
+    """
+    Tangents at each known point for a monotone cubic Hermite interpolant. Interior tangents are the weighted
+    harmonic mean of the neighbouring secants, or zero where the data changes direction.
+    :param known_x: Sorted 1D array of x positions
+    :param known_y: 1D array of values at known_x
+    :return: 1D array of slopes
+    """
+    h = np.diff(known_x)
+    delta = np.diff(known_y) / h
+    slopes = np.empty_like(known_y)
+    slopes[0] = delta[0]
+    slopes[-1] = delta[-1]
+    if len(known_x) > 2:
+        w1 = 2 * h[1:] + h[:-1]
+        w2 = h[1:] + 2 * h[:-1]
+        same_direction = (np.sign(delta[:-1]) * np.sign(delta[1:])) > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            harmonic = (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:])
+        slopes[1:-1] = np.where(same_direction, harmonic, 0.0)
+
+    return slopes
+
+
+def interpolate(known_x, known_y, query_x, method=DEFAULT_INTERPOLATION):
+    """
+    Evaluate an interpolant through a set of known points at many query positions in one call. Each query is located
+    with a binary search over known_x, so the cost is O(n log m) for n queries and m known points.
+    Queries outside the span of the known points are not extrapolated and come back as NaN.
+    :param known_x: Sorted 1D array of x positions (e.g. day ordinals)
+    :param known_y: 1D array of values at known_x
+    :param query_x: 1D array of positions to evaluate
+    :param method: One of INTERPOLATION_METHODS
+    :return: 1D float array the same length as query_x
+    """
+    assert method in INTERPOLATION_METHODS, f"Invalid interpolation method {method}. Must be from: {INTERPOLATION_METHODS}"
+    known_x = np.asarray(known_x, dtype=np.float64)
+    known_y = np.asarray(known_y, dtype=np.float64)
+    query_x = np.asarray(query_x, dtype=np.float64)
+
+    result = np.full(query_x.shape, np.nan)
+    if len(known_x) == 0:
+        return result
+
+    inside = (query_x >= known_x[0]) & (query_x <= known_x[-1])
+    q = query_x[inside]
+    # Index of the last known point at or before each query
+    left = np.searchsorted(known_x, q, side="right") - 1
+
+    if method == "step" or len(known_x) == 1:
+        result[inside] = known_y[left]
+        return result
+
+    # Queries landing on the final point use the last interval
+    left = np.minimum(left, len(known_x) - 2)
+    x0 = known_x[left]
+    y0 = known_y[left]
+    y1 = known_y[left + 1]
+    h = known_x[left + 1] - x0
+    t = (q - x0) / h
+
+    if method == "linear":
+        result[inside] = y0 + t * (y1 - y0)
+    else:
+        slopes = _monotone_slopes(known_x, known_y)
+        t2 = t * t
+        t3 = t2 * t
+        result[inside] = ((2 * t3 - 3 * t2 + 1) * y0
+                          + (t3 - 2 * t2 + t) * h * slopes[left]
+                          + (-2 * t3 + 3 * t2) * y1
+                          + (t3 - t2) * h * slopes[left + 1])
+
+    return result
@@ -0,0 +1,127 @@
+import datetime as dt
+import json
+import os
+
+from file_signature import file_signature, signature_matches
+
+# The journal sits next to the csv it applies to, e.g. latest_data.csv.journal
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_DATE_FORMAT = "%Y-%m-%d"
+# Once a journal holds this many edits it is folded back into the csv on exit
+JOURNAL_COMPACT_ENTRIES = 500
+
+
+def journal_path(csv_path):
+    """
+    :param csv_path: Path to a data file
+    :return: Path of the journal for that file
+    """
+    return csv_path + JOURNAL_SUFFIX
+
+
+def encode_date(date):
+    return date.strftime(JOURNAL_DATE_FORMAT)
+
+
+def decode_date(date_str):
+    return dt.datetime.strptime(date_str, JOURNAL_DATE_FORMAT)
+
+
+class Journal(object):
+    """
+    An append-only record of the edits made to a data file since it was last written. Each line is one JSON object.
+    The first line records the size and modification time of the csv the edits apply to, so a journal left behind
+    after the csv has been rewritten is recognised as stale and ignored rather than applied twice.
+    """
+    def __init__(self, csv_path):
+        """
+        :param csv_path: Path to the data file the journal belongs to.
+        """
+        self.csv_path = csv_path
+        self.path = journal_path(csv_path)
+        self.entry_count = 0
+        # Found by entries and only put right on disk by the next append, so loading never writes anything: the
+        # length of the journal up to the end of its last whole entry, and whether it belongs to an older csv
+        self._complete = None
+        self._stale = False
+
+    def entries(self):
+        """
+        Read the edits in the journal, if it applies to the current csv.
+        :return: List of entry dictionaries
+        """
+        if not os.path.exists(self.path) or not os.path.exists(self.csv_path):
+            return []
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+        # Every entry is written with its newline in a single write, so text after the last newline can only be
+        # the remains of an append interrupted by a crash. It is cut off before the next append.
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            print(f"Ignoring an incomplete final entry in {self.path}.")
+            self._complete = complete
+        lines = data[:complete].decode().splitlines()
+        if not lines:
+            return []
+
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            header = {}
+        if header.get("op") != "header" or not signature_matches(header.get("source"), self.csv_path):
+            # The csv has been rewritten since these edits were made, so they are already in it or were abandoned
+            print(f"Ignoring {self.path} as it does not match the current {self.csv_path}.")
+            self._stale = True
+            return []
+
+        entries = []
+        for idx, line in enumerate(lines[1:]):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                raise ValueError(f"{self.path} line {idx + 2} is not a valid journal entry.")
+        self.entry_count = len(entries)
+
+        return entries
+
+    def append(self, op, **fields):
+        """
+        Record a single edit. The entry is flushed to disk before returning.
+        :param op: Name of the edit operation
+        :param fields: JSON-serialisable details of the edit
+        :return: None
+        """
+        self._tidy()
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a") as f:
+            if new_file:
+                f.write(json.dumps({"op": "header", "source": file_signature(self.csv_path)}) + "\n")
+            f.write(json.dumps(dict(op=op, **fields)) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.entry_count += 1
+
+    def _tidy(self):
+        """
+        Before the first append, remove a stale journal or cut off an incomplete final entry found by entries, so the
+        new entry starts on a clean line under the right header.
+        :return: None
+        """
+        if self._stale:
+            self.clear()
+        elif self._complete is not None and os.path.exists(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(self._complete)
+        self._complete = None
+
+    def clear(self):
+        """
+        Remove the journal, once its edits have been written into the csv.
+        :return: None
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.entry_count = 0
+        self._complete = None
+        self._stale = False
@@ -1,10 +1,34 @@
 import argparse
+import functools
+import importlib
+import itertools
 import os
-import matplotlib.pyplot as plt
-import matplotlib.dates as md
+import re
+import threading
+import numpy as np
 
 from data_handler import BankAccount, Context, initialise_context
-from data_handler import ACCOUNT_TYPES, OUTPUT_DATE_FORMAT, DATA_DIRECTORY, SAVE_FILE_NAME
+from data_handler import ACCOUNT_TYPES, OUTPUT_DATE_FORMAT, DATA_DIRECTORY, data_file_path
+from downsample import downsample, DOWNSAMPLE_METHODS, DEFAULT_DOWNSAMPLE
+from account_store import to_ordinals
+from fx import currency_symbol
+from rollups import PERIODS
+from storage import STORAGE_BACKENDS
+from projection import project, DEFAULT_PATHS
+import profiling
+
+# Charts that can be rendered in batch mode: one per account, one per account type, the totals, and one per year
+CHART_KINDS = ["account", "type", "totals", "year"]
+CHART_FORMATS = ["png", "svg"]
+DEFAULT_CHART_FORMAT = "png"
+BATCH_FIGURE_SIZE = (16, 9)
+BATCH_FIGURE_DPI = 100
+# matplotlib takes longer to import than the rest of the programme put together, so it is only imported on the paths
+# that draw something, in the background while the data loads.
+INTERACTIVE_MODULES = ["matplotlib.pyplot", "matplotlib.dates"]
+BATCH_MODULES = ["matplotlib.figure", "matplotlib.dates", "matplotlib.backends.backend_agg"]
+# Opacity of the outermost projection band. Each band further in is shaded this much more.
+PROJECTION_ALPHA = 0.15
 
 
 def parse_args():
@@ -13,93 +37,353 @@ def parse_args():
     :return: command line arguments
     """
     parser = argparse.ArgumentParser()
-    parser.add_argument("-acc", "--accounts", help="Which bank accounts to plot", required=True)
+    parser.add_argument("-ds", "--downsample", help="How to thin out long series before plotting",
+                        choices=DOWNSAMPLE_METHODS, default=DEFAULT_DOWNSAMPLE)
+    parser.add_argument("-p", "--period", help="Plot one point per period, the value at the end of it, rather than "
+                                               "every date", choices=PERIODS)
+    parser.add_argument("-acc", "--accounts", help="Which bank accounts to plot. Either 'all' or a comma separated list "
+                                                  "of account names, which may include 'Total Money'", required=True)
+    parser.add_argument("-o", "--output", help="Render a pack of charts to this directory instead of showing a "
+                                               "window. Needs no display.")
+    parser.add_argument("-c", "--charts", help="Comma separated kinds of chart to render with --output, from "
+                                               f"{CHART_KINDS}", default=",".join(CHART_KINDS))
+    parser.add_argument("-f", "--format", help="Image format for --output", choices=CHART_FORMATS,
+                        default=DEFAULT_CHART_FORMAT)
+    parser.add_argument("-w", "--workers", help="Number of processes to render or project with. Defaults to one per "
+                                                "CPU for rendering, and to projecting in a single process.", type=int)
+    parser.add_argument("-pj", "--project", help="Project the accounts and totals this many years ahead, shading "
+                                                 "the range of likely values", type=float)
+    parser.add_argument("--paths", help="Number of simulated paths for --project", type=int, default=DEFAULT_PATHS)
+    parser.add_argument("--seed", help="Seed for --project, to get the same projection again", type=int)
+    parser.add_argument("-s", "--storage", help="Where the data is kept, latest_data.csv or latest_data.db",
+                        choices=STORAGE_BACKENDS, default="csv")
+    parser.add_argument("--profile", help="Time the main steps of the run and write a JSON summary on exit, to this "
+                                          "file or to stderr if no file is given", nargs="?", const="-")
+    parser.add_argument("--profile-memory", help="With --profile, also record the peak memory of each step",
+                        action="store_true")
 
     return parser.parse_args()
 
 
-def plot_accounts(c, account_list, dates):
+def _get_values(c, bc, dates):
+    """
+    Get the values for an account on all of the given dates in the reporting currency, interpolating any gaps.
+    :param c: Context the account belongs to
+    :param bc: BankAccount to query
+    :param dates: dates for values
+    :return: numpy array of values
+    """
+    values = np.nan_to_num(bc.interpolate_values(dates), nan=0.0)
+    values = values * c.conversion_factors(bc.currency, to_ordinals(dates))
+    if bc.type.lower() in ["credit", "mortgage"]:
+        return -values
+    else:
+        return values
+
+
+def _get_period_values(c, bc, period, dates):
+    """
+    Get the value of an account at the end of each period, in the reporting currency, from the Context rollups.
+    :param c: Context the account belongs to
+    :param bc: BankAccount (or total) to query
+    :param period: Period length from rollups.PERIODS
+    :param dates: Only periods ending between the first and last of these dates are returned
+    :return: (list of period end datetimes, numpy array of values). NaN for periods without an entry.
+    """
+    rollup = c.rollup(period, totals=bc.name in c.totals)
+    ends = rollup.ends
+    values = rollup.column(bc.name)["end"] * c.conversion_factors(bc.currency, to_ordinals(ends))
+    if bc.type.lower() in ["credit", "mortgage"]:
+        values = -values
+    keep = [idx for idx, x in enumerate(ends) if dates[0] <= x <= dates[-1]]
+    return [ends[x] for x in keep], values[keep]
+
+
+def _format_axis(axes, currency):
+    """
+    Once all plotting has been completed, format axes
+    :param axes: A list of all axes to have the formatting applied to
+    :param currency: Currency the values are in
+    :return:
+    """
+    for axis in axes:
+        axis.set_ylabel(f"Value ({currency_symbol(currency).strip()})")
+        # A chart of only assets (or only debts) leaves one of the axes empty
+        if axis.get_legend_handles_labels()[0]:
+            axis.legend()
+        axis.tick_params(axis="x", which="both", labelrotation=0, labelsize=6)
+
+
+def _draw_projection(axis, projection, name, colour, negate=False):
+    """
+    Shade the percentile bands of a projected account or total, pairing the outermost percentiles first, with the
+    median dashed through the middle.
+    :param axis: matplotlib Axes to draw on
+    :param projection: projection.Projection
+    :param name: Account or total name
+    :param colour: Colour of the account's line
+    :param negate: Plot the values negated, as debts are
+    :return: None
+    """
+    import matplotlib.dates as md
+
+    x_axis = md.date2num([x.date() for x in projection.dates])
+    bands = -projection.bands[name] if negate else projection.bands[name]
+    n = len(projection.percentiles)
+    for idx in range(n // 2):
+        axis.fill_between(x_axis, bands[idx], bands[n - 1 - idx], color=colour, alpha=PROJECTION_ALPHA * (idx + 1),
+                          linewidth=0)
+    if n % 2:
+        axis.plot(x_axis, bands[n // 2], color=colour, linestyle="--")
+
+
+@profiling.timed("plotter.draw_accounts")
+def draw_accounts(fig, c, account_list, dates, downsample_method=DEFAULT_DOWNSAMPLE, title="Value of all Accounts",
+                  period=None, projection=None):
     """
-    Plot any number of accounts and dates on a single graph.
+    Draw any number of accounts and dates onto a figure, assets on the top axes and debts on the bottom.
+    :param fig: matplotlib Figure to draw on
     :param c: Context object to plot from
-    :param account_list:
+    :param account_list: Names of the accounts to plot
     :param dates: List of dates to plot
+    :param downsample_method: How to thin out each series, from downsample.DOWNSAMPLE_METHODS. The number of points
+    kept is set from the width of the figure in pixels, so drawing time does not grow with the length of the history.
+    :param title: Figure title
+    :param period: If given (from rollups.PERIODS), plot one point per period, the value at the end of it, rather than
+    every date.
+    :param projection: Optionally a projection.Projection, whose bands are shaded after the history of each account
+    it covers
     :return: None
     """
-    def _get_single_value(bc, date):
-        """
-        Get a single value for an account on a given date.
-        :param bc: BankAccount to query
-        :param date: date for value
-        :return: float of value or None
-        """
-        direct_value = bc.get_value_on_date(date, interp=True)
-        if direct_value == "":
-            return 0
-        else:
-            if bc.type.lower() in ["credit", "mortgage"]:
-                return -float(direct_value)
-            else:
-                return float(direct_value)
-
-    def _format_axis(axes):
-        """
-        Once all plotting has been completed, format axes
-        :param axes: A list of all axes to have the formatting applied to
-        :return:
-        """
-        for axis in axes:
-            axis.set_ylabel("Value (£)")
-            axis.legend()
-            axis.tick_params(axis="x", which="both", labelrotation=0, labelsize=6)
-
+    import matplotlib.dates as md
 
-    fig, (ax_pos, ax_neg) = plt.subplots(nrows=2, ncols=1)
+    ax_pos, ax_neg = fig.subplots(nrows=2, ncols=1)
+    # One point per horizontal pixel is as much as can be seen. minmax keeps two per pixel (the low and the high).
+    n_points = int(fig.get_figwidth() * fig.dpi) * (2 if downsample_method == "minmax" else 1)
+    datenums = md.date2num([date.date() for date in dates])
     xfmt = md.DateFormatter(OUTPUT_DATE_FORMAT)
     ax_pos.xaxis.set_major_formatter(xfmt)
     ax_neg.xaxis.set_major_formatter(xfmt)
 
     top_plot_types = ["current", "debit", "savings"]
 
-    for bc_name, _bc in c.all_accounts.items():
-        if bc_name in account_list:
-            y_axis = [_get_single_value(_bc, date) for date in dates]
-            datenums = md.date2num([date.date() for date in dates])
-            if _bc.type.lower() in top_plot_types:
-                ax_pos.plot(datenums, y_axis, label=bc_name)
-            else:
-                ax_neg.plot(datenums, y_axis, label=bc_name)
-
-    for bc_name, _bc in c.totals.items():
-        if bc_name == "Total Money":
-            y_axis = [_get_single_value(_bc,date) for date in dates]
-            datenums = md.date2num([date.date() for date in dates])
-            if _bc.type.lower() in top_plot_types:
-                ax_pos.plot(datenums,y_axis,label=bc_name)
-            else:
-                ax_neg.plot(datenums,y_axis,label=bc_name)
-
-    _format_axis([ax_pos, ax_neg])
-    fig.suptitle("Value of all Accounts")
+    for bc_name in account_list:
+        if bc_name in c.all_accounts:
+            # Only the accounts being plotted are touched, so a lazily loaded Context reads no others
+            _bc = c.all_accounts[bc_name]
+        elif bc_name in c.totals:
+            _bc = c.totals[bc_name]
+        else:
+            continue
+        if period is None:
+            x_axis, y_axis = downsample(datenums, _get_values(c, _bc, dates), n_points, downsample_method)
+        else:
+            ends, y_axis = _get_period_values(c, _bc, period, dates)
+            x_axis = md.date2num([x.date() for x in ends])
+        axis = ax_pos if _bc.type.lower() in top_plot_types else ax_neg
+        line, = axis.plot(x_axis, y_axis, label=bc_name)
+        if projection is not None and bc_name in projection.bands:
+            _draw_projection(axis, projection, bc_name, line.get_color(), _bc.type.lower() in ["credit", "mortgage"])
+
+    _format_axis([ax_pos, ax_neg], c.reporting_currency)
+    fig.suptitle(title)
+
+
+def plot_accounts(c, account_list, dates, downsample_method=DEFAULT_DOWNSAMPLE, period=None, projection=None):
+    """
+    Plot any number of accounts and dates on a single graph, in a full screen window.
+    :param c: Context object to plot from
+    :param account_list: Names of the accounts to plot
+    :param dates: List of dates to plot
+    :param downsample_method: How to thin out each series, from downsample.DOWNSAMPLE_METHODS
+    :param period: Optionally plot one point per period, from rollups.PERIODS
+    :param projection: Optionally a projection.Projection to shade after the history
+    :return: None
+    """
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure()
+    draw_accounts(fig, c, account_list, dates, downsample_method, period=period, projection=projection)
     mng = plt.get_current_fig_manager()
     mng.full_screen_toggle()
     plt.show()
 
 
+def _chart_file_name(kind, label, image_format):
+    """
+    :return: File name for a chart, e.g. account_Barclays_Current.png
+    """
+    safe_label = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_")
+    return f"{kind}_{safe_label}.{image_format}" if safe_label else f"{kind}.{image_format}"
+
+
+def chart_jobs(c, chart_kinds, account_list, image_format=DEFAULT_CHART_FORMAT):
+    """
+    Work out which charts make up a chart pack.
+    :param c: Context object to plot from
+    :param chart_kinds: Kinds of chart to include, from CHART_KINDS
+    :param account_list: Names of the accounts to include
+    :param image_format: File format of the charts, from CHART_FORMATS
+    :return: List of (file name, title, account names, dates) tuples
+    """
+    for kind in chart_kinds:
+        assert kind in CHART_KINDS, f"Invalid chart kind {kind}. Must be from: {CHART_KINDS}"
+    assert image_format in CHART_FORMATS, f"Invalid chart format {image_format}. Must be from: {CHART_FORMATS}"
+
+    dates = c.all_dates
+    jobs = []
+    if "account" in chart_kinds:
+        for name in account_list:
+            jobs.append((_chart_file_name("account", name, image_format), name, [name], dates))
+    if "type" in chart_kinds:
+        for account_type in ACCOUNT_TYPES:
+            names = [x for x in account_list
+                     if x in c.all_accounts and c.all_accounts[x].type.lower() == account_type]
+            if names:
+                jobs.append((_chart_file_name("type", account_type, image_format),
+                             f"{account_type.title()} Accounts", names, dates))
+    if "totals" in chart_kinds:
+        jobs.append((_chart_file_name("totals", "", image_format), "Totals", list(Context.TOTAL_NAMES), dates))
+    if "year" in chart_kinds:
+        for year, year_dates in itertools.groupby(dates, key=lambda x: x.year):
+            jobs.append((_chart_file_name("year", str(year), image_format), f"Value of all Accounts in {year}",
+                         account_list + ["Total Money"], list(year_dates)))
+
+    return jobs
+
+
+# The Context every batch worker renders from. Set once per worker process by _init_batch_worker.
+_batch_context = None
+
+
+def _init_batch_worker(c):
+    global _batch_context
+    _batch_context = c
+
+
+def _render_chart(output_dir, job, downsample_method, period=None):
+    """
+    Render a single chart to a file, without a display.
+    :param output_dir: Directory to write the chart to
+    :param job: (file name, title, account names, dates) tuple from chart_jobs
+    :param downsample_method: How to thin out each series
+    :param period: Optionally plot one point per period, from rollups.PERIODS
+    :return: Path of the written chart
+    """
+    from matplotlib.figure import Figure
+
+    file_name, title, account_list, dates = job
+    # A bare Figure is drawn by the Agg canvas on save, so no GUI backend or pyplot state is involved
+    fig = Figure(figsize=BATCH_FIGURE_SIZE, dpi=BATCH_FIGURE_DPI)
+    draw_accounts(fig, _batch_context, account_list, dates, downsample_method, title, period)
+    path = os.path.join(output_dir, file_name)
+    fig.savefig(path)
+    return path
+
+
+@profiling.timed("plotter.render_charts")
+def render_charts(c, output_dir, chart_kinds=CHART_KINDS, account_list=None, image_format=DEFAULT_CHART_FORMAT,
+                  downsample_method=DEFAULT_DOWNSAMPLE, max_workers=None, period=None):
+    """
+    Render a pack of charts to image files, spread across a pool of processes. Each worker is handed the loaded
+    Context once when it starts (on platforms that fork it is simply inherited), and only the small chart
+    descriptions are sent per chart.
+    :param c: Context object to plot from, with totals generated
+    :param output_dir: Directory to write the charts to. Created if needed.
+    :param chart_kinds: Kinds of chart to include, from CHART_KINDS
+    :param account_list: Names of the accounts to include, all accounts if None
+    :param image_format: File format of the charts, from CHART_FORMATS
+    :param downsample_method: How to thin out each series, from downsample.DOWNSAMPLE_METHODS
+    :param max_workers: Number of processes to use. Defaults to the number of CPUs. 1 renders in this process.
+    :param period: Optionally plot one point per period, from rollups.PERIODS
+    :return: List of paths of the written charts
+    """
+    if account_list is None:
+        account_list = list(c.all_accounts.keys())
+    if period is not None:
+        # Build the rollups once here rather than once in every worker
+        c.rollup(period)
+        c.rollup(period, totals=True)
+    jobs = chart_jobs(c, chart_kinds, account_list, image_format)
+    os.makedirs(output_dir, exist_ok=True)
+    max_workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+
+    if max_workers <= 1:
+        _init_batch_worker(c)
+        return [_render_chart(output_dir, job, downsample_method, period) for job in jobs]
+
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=_init_batch_worker,
+                                                initargs=(c,)) as executor:
+        return list(executor.map(functools.partial(_render_chart, output_dir, downsample_method=downsample_method,
+                                                   period=period), jobs))
+
+
+def _import_in_background(module_names):
+    """
+    Start importing modules on a background thread, so that the import overlaps with other work such as loading data.
+    :param module_names: Names of the modules to import
+    :return: The started thread. Join it before using the modules.
+    """
+    def _import_all():
+        for name in module_names:
+            importlib.import_module(name)
+
+    thread = threading.Thread(target=_import_all, daemon=True)
+    thread.start()
+    return thread
+
+
+def _project(c, account_list, args):
+    """
+    :return: projection.Projection of the accounts being plotted if --project was given, otherwise None
+    """
+    if not args.project:
+        return None
+    # Fitting the totals needs every account, even if only some were asked for
+    return project(c, args.project, args.paths, accounts=[x for x in account_list if x in c.all_accounts],
+                   seed=args.seed, max_workers=args.workers)
+
+
 def main(args):
     """
     Script entry with arguments from parseargs.
     :param args: Parseargs executed.
     :return: None
     """
+    if args.profile:
+        profiling.enable(args.profile, args.profile_memory)
     os.makedirs(DATA_DIRECTORY, exist_ok=True)
-    file_path = os.path.join(DATA_DIRECTORY, SAVE_FILE_NAME)
-
-    fullContext = initialise_context(file_path)
-
-    if args.accounts == "all":
-        plot_accounts(fullContext, fullContext.all_accounts.keys(), fullContext.all_dates)
+    file_path = data_file_path(args.storage)
 
+    if args.output:
+        matplotlib_loading = _import_in_background(BATCH_MODULES)
+        fullContext = initialise_context(file_path)
+        account_list = None if args.accounts == "all" else [x.strip().title() for x in args.accounts.split(",")]
+        # Finish importing before the pool forks, so that every worker starts with matplotlib already imported
+        with profiling.span("plotter.wait_for_matplotlib"):
+            matplotlib_loading.join()
+        written = render_charts(fullContext, args.output, [x.strip().lower() for x in args.charts.split(",")],
+                                account_list, args.format, args.downsample, args.workers, args.period)
+        print(f"Wrote {len(written)} charts to {args.output}")
+    elif args.accounts == "all":
+        matplotlib_loading = _import_in_background(INTERACTIVE_MODULES)
+        fullContext = initialise_context(file_path)
+        account_list = list(fullContext.all_accounts.keys()) + ["Total Money"]
+        projection = _project(fullContext, account_list, args)
+        with profiling.span("plotter.wait_for_matplotlib"):
+            matplotlib_loading.join()
+        plot_accounts(fullContext, account_list, fullContext.all_dates, args.downsample, args.period, projection)
+    else:
+        matplotlib_loading = _import_in_background(INTERACTIVE_MODULES)
+        account_list = [x.strip().title() for x in args.accounts.split(",")]
+        fullContext = initialise_context(file_path, accounts=[x for x in account_list if x not in Context.TOTAL_NAMES])
+        if any(x in Context.TOTAL_NAMES for x in account_list):
+            fullContext.generate_totals()
+        projection = _project(fullContext, account_list, args)
+        with profiling.span("plotter.wait_for_matplotlib"):
+            matplotlib_loading.join()
+        plot_accounts(fullContext, account_list, fullContext.all_dates, args.downsample, args.period, projection)
 
 
 if __name__ == "__main__":
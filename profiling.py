@@ -0,0 +1,158 @@
+import atexit
+import contextlib
+import functools
+import json
+import sys
+import time
+import tracemalloc
+
+# The active Profile, or None when profiling is off. Every instrumented function checks this first, so a disabled
+# profiler costs one global lookup per call.
+_profile = None
+
+
+class Profile(object):
+    """
+    Timings for named spans of work, and call counts for hot helper functions.
+    """
+    def __init__(self, trace_memory=False):
+        """
+        :param trace_memory: Also record the peak memory allocated within each span, using tracemalloc. This slows
+        everything down noticeably, so the timings are less representative.
+        """
+        self.trace_memory = trace_memory
+        self.start = time.perf_counter()
+        # name: {"calls": int, "total_s": float, "max_s": float, "peak_bytes": int}
+        self.spans = {}
+        # name: int
+        self.counts = {}
+        # [memory in use at the start of the span, highest absolute peak seen by spans nested inside it]
+        self._memory_stack = []
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _enter_memory(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if self._memory_stack:
+            self._memory_stack[-1][1] = max(self._memory_stack[-1][1], peak)
+        # The peak is global, so it is reset for each span and the outer span is told about the inner one on exit
+        tracemalloc.reset_peak()
+        self._memory_stack.append([current, 0])
+
+    def _exit_memory(self):
+        _, peak = tracemalloc.get_traced_memory()
+        start, inner_peak = self._memory_stack.pop()
+        peak = max(peak, inner_peak)
+        if self._memory_stack:
+            self._memory_stack[-1][1] = max(self._memory_stack[-1][1], peak)
+        return peak - start
+
+    @contextlib.contextmanager
+    def span(self, name):
+        if self.trace_memory:
+            self._enter_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            record = self.spans.setdefault(name, {"calls": 0, "total_s": 0.0, "max_s": 0.0})
+            record["calls"] += 1
+            record["total_s"] += elapsed
+            record["max_s"] = max(record["max_s"], elapsed)
+            if self.trace_memory:
+                record["peak_bytes"] = max(record.get("peak_bytes", 0), self._exit_memory())
+
+    def count(self, name):
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def summary(self):
+        """
+        :return: JSON-serialisable dictionary of the wall time since profiling started, the spans and the counts
+        """
+        return {"wall_s": time.perf_counter() - self.start,
+                "trace_memory": self.trace_memory,
+                "spans": self.spans,
+                "counts": self.counts}
+
+
+def enable(output="-", trace_memory=False):
+    """
+    Start profiling. The summary is written when the programme exits, however it exits.
+    :param output: Path to write the JSON summary to, or "-" for stderr
+    :param trace_memory: Record peak memory per span as well
+    :return: The new Profile
+    """
+    global _profile
+    _profile = Profile(trace_memory)
+    atexit.register(write_summary, _profile, output)
+    return _profile
+
+
+def disable():
+    """
+    Stop profiling.
+    :return: The Profile that was active, or None
+    """
+    global _profile
+    profile, _profile = _profile, None
+    return profile
+
+
+def write_summary(profile, output="-"):
+    """
+    :param profile: Profile to summarise
+    :param output: Path to write the JSON summary to, or "-" for stderr
+    :return: None
+    """
+    summary = json.dumps(profile.summary(), indent=2)
+    if output == "-":
+        print(summary, file=sys.stderr)
+    else:
+        with open(output, "w") as f:
+            f.write(summary + "\n")
+
+
+@contextlib.contextmanager
+def span(name):
+    """
+    Time a block of code as a named span, when profiling is on.
+    :param name: Span name
+    """
+    if _profile is None:
+        yield
+    else:
+        with _profile.span(name):
+            yield
+
+
+def timed(name):
+    """
+    Decorator that times every call of a function as a named span, when profiling is on.
+    :param name: Span name
+    """
+    def _decorator(func):
+        @functools.wraps(func)
+        def _wrapper(*args, **kwargs):
+            if _profile is None:
+                return func(*args, **kwargs)
+            with _profile.span(name):
+                return func(*args, **kwargs)
+        return _wrapper
+    return _decorator
+
+
+def counted(name):
+    """
+    Decorator that counts the calls of a function, when profiling is on. Cheaper than timed, for small functions
+    called many times.
+    :param name: Counter name
+    """
+    def _decorator(func):
+        @functools.wraps(func)
+        def _wrapper(*args, **kwargs):
+            if _profile is not None:
+                _profile.count(name)
+            return func(*args, **kwargs)
+        return _wrapper
+    return _decorator
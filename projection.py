@@ -0,0 +1,270 @@
+import calendar
+import datetime as dt
+import itertools
+
+import numpy as np
+
+import analytics
+from rollups import month_ids, month_start_ordinals
+from profiling import timed
+
+STEPS_PER_YEAR = 12
+DEFAULT_YEARS = 10
+DEFAULT_PATHS = 10000
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+# Paths simulated together. Each batch draws from its own random stream, so the result for a given seed is the same
+# however the batches are shared out between processes.
+BATCH_PATHS = 500
+# Fewest monthly changes an account needs for its growth and volatility to be fitted, with fewer it is held flat
+MIN_FIT_MONTHS = 3
+# Accounts with no entry in this many months before the last date are taken to be closed, and are held flat
+STALE_MONTHS = 12
+# Highest standard deviation of monthly log changes for which an account is grown geometrically. A noisier account
+# compounds into absurd values within a few years, so it is grown by its changes in money instead.
+MAX_GEOMETRIC_VOLATILITY = 0.2
+# Highest mean monthly log change (about 27% a year) for which an account is grown geometrically. A steeper drift is
+# almost always money paid in, e.g. an account funded from 50 to 2458 in one month, rather than growth, and
+# compounding it for years gives billions.
+MAX_GEOMETRIC_DRIFT = 0.02
+# Debts are paid down by amounts rather than by a fraction of what is owed, so they are always grown by their changes
+ARITHMETIC_TYPES = ["credit", "mortgage"]
+
+
+def _add_months(date, months):
+    """
+    :return: The same day of the month, months later, or the last day of that month if it is shorter
+    """
+    year, month = divmod(date.month - 1 + months, 12)
+    year += date.year
+    day = min(date.day, calendar.monthrange(year, month + 1)[1])
+    return date.replace(year=year, month=month + 1, day=day)
+
+
+def _month_ends(c):
+    """
+    :return: Datetimes of the last day of every month from the first to the last date of the Context, along with the
+    last date itself
+    """
+    ordinals = c.store.ordinals
+    months = np.arange(month_ids(ordinals[:1])[0], month_ids(ordinals[-1:])[0])
+    ends = month_start_ordinals(months + 1) - 1
+    return [dt.datetime.fromordinal(int(x)) for x in ends] + [c.all_dates[-1]]
+
+
+def _fit_changes(changes):
+    """
+    :param changes: (months x accounts) array of changes, NaN where there is no change to measure
+    :return: (number of changes, mean change, standard deviation of the changes) for each account
+    """
+    missing = np.isnan(changes)
+    counts = (~missing).sum(axis=0)
+    filled = np.where(missing, 0.0, changes)
+    mean = filled.sum(axis=0) / np.maximum(counts, 1)
+    squares = np.where(missing, 0.0, changes - mean) ** 2
+    return counts, mean, np.sqrt(squares.sum(axis=0) / np.maximum(counts - 1, 1))
+
+
+def _psd_root(correlation):
+    """
+    :param correlation: Symmetric matrix of correlations, which may not be positive semi-definite when estimated from
+    accounts with different spans of history
+    :return: Matrix root such that root @ root.T is the nearest valid correlation matrix (negative eigenvalues dropped
+    and the diagonal put back to 1)
+    """
+    eigenvalues, eigenvectors = np.linalg.eigh(correlation)
+    root = eigenvectors * np.sqrt(np.maximum(eigenvalues, 0))
+    scale = np.sqrt(np.einsum("ij,ij->i", root, root))
+    return root / np.where(scale > 0, scale, 1)[:, None]
+
+
+class ProjectionModel(object):
+    """
+    Monthly growth and volatility of every account, fitted from its history on a grid of month ends (see
+    fit_projection_model). An asset whose values have always been positive, and which is neither too volatile nor
+    growing too steeply, grows geometrically from its fitted log changes. Any other account, and every debt, grows arithmetically from its
+    fitted changes, and never drops below zero if it never has.
+    Each month's shocks are correlated across accounts as they have been historically.
+    """
+    def __init__(self, names, types, start, geometric, drift, volatility, floor, mixing, factors, weights, total_names,
+                 start_date):
+        self.names = list(names)
+        self.types = list(types)
+        # Values on the last date, in each account's currency
+        self.start = start
+        self.geometric = geometric
+        self.drift = drift
+        self.volatility = volatility
+        self.floor = floor
+        # (accounts x accounts) root of the correlation of the monthly shocks
+        self.mixing = mixing
+        # Exchange rates into the reporting currency on the last date, held there for the whole projection
+        self.factors = factors
+        # (accounts x totals) weights that turn values into totals, including the conversion to the reporting currency
+        self.weights = weights
+        self.total_names = list(total_names)
+        self.start_date = start_date
+
+
+@timed("projection.fit_projection_model")
+def fit_projection_model(c, weightings=None):
+    """
+    Fit the growth and volatility of every account from its month end values, interpolated between entries.
+    :param c: Context
+    :param weightings: Total definitions, as for Context.generate_totals. Defaults to those the Context uses.
+    :return: ProjectionModel
+    """
+    c._require_all()
+    store = c.store
+    assert store.n_dates, "There must be some history to project from."
+    if weightings is None:
+        from data_handler import TOTAL_WEIGHTINGS
+        weightings = c._totals_weightings or TOTAL_WEIGHTINGS
+    columns = np.arange(store.n_accounts)
+
+    # Each account starts from its last entry, or from nothing if it has none
+    any_entry = store.present.any(axis=0)
+    last_row = store.n_dates - 1 - np.argmax(store.present[::-1], axis=0)
+    start = np.where(any_entry, store.values[last_row, columns], 0.0)
+    stale = ~any_entry | (month_ids(store.ordinals[last_row]) < month_ids(store.ordinals[-1:]) - STALE_MONTHS)
+
+    grid = analytics.value_matrix(c, _month_ends(c), method="linear", convert=False)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        positive = any_entry & ~(grid <= 0).any(axis=0)
+        floor = np.where((grid < 0).any(axis=0), -np.inf, 0.0)
+        log_changes = np.diff(np.log(np.where(positive, grid, np.nan)), axis=0)
+    changes = np.diff(grid, axis=0)
+    counts, log_drift, log_volatility = _fit_changes(log_changes)
+    debts = np.array([x.lower() in ARITHMETIC_TYPES for x in store.types], dtype=bool)
+    geometric = (positive & ~debts & (log_volatility <= MAX_GEOMETRIC_VOLATILITY)
+                 & (np.abs(log_drift) <= MAX_GEOMETRIC_DRIFT))
+    changes = np.where(geometric, log_changes, changes)
+    counts, drift, volatility = _fit_changes(changes)
+    fitted = (counts >= MIN_FIT_MONTHS) & ~stale
+    drift = np.where(fitted, drift, 0.0)
+    volatility = np.where(fitted, volatility, 0.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Correlation of the standardised changes over the months each pair of accounts has in common
+        shocks = (changes - drift) / np.where(volatility > 0, volatility, np.nan)
+        common = (~np.isnan(shocks)).astype(np.float64)
+        shocks = np.nan_to_num(shocks)
+        shared = common.T @ common
+        correlation = np.where(shared >= MIN_FIT_MONTHS, (shocks.T @ shocks) / np.maximum(shared - 1, 1), 0.0)
+    np.fill_diagonal(correlation, 1.0)
+    correlation = np.clip(correlation, -1.0, 1.0)
+
+    factors = analytics._conversion_matrix(c, store.ordinals[-1:])[0]
+    return ProjectionModel(store.names, store.types, start, geometric, drift, volatility, floor,
+                           _psd_root(correlation), factors, c._weight_matrix(weightings) * factors[:, None],
+                           list(weightings), c.all_dates[-1])
+
+
+def _simulate_batch(model, steps, n_paths, seed, keep):
+    """
+    Simulate one batch of paths for every account at once. Runs in a worker process when a pool is used.
+    :param model: ProjectionModel
+    :param steps: Number of monthly steps
+    :param n_paths: Number of paths
+    :param seed: numpy SeedSequence for this batch
+    :param keep: Column indices of the accounts whose paths are returned
+    :return: (kept account values (kept x steps x paths) in the reporting currency, totals (totals x steps x paths))
+    """
+    rng = np.random.default_rng(seed)
+    # Laid out steps first, so the running sum over the steps adds whole contiguous blocks. Single precision is plenty
+    # for the random shocks and is quicker to draw and mix.
+    shocks = rng.standard_normal((steps, n_paths, len(model.names)), dtype=np.float32)
+    values = model.volatility * (shocks @ model.mixing.T.astype(np.float32))
+    del shocks
+    values += model.drift
+    np.cumsum(values, axis=0, out=values)
+    geometric = model.geometric
+    values += np.where(geometric, 0.0, model.start)
+    if geometric.any():
+        values[:, :, geometric] = model.start[geometric] * np.exp(values[:, :, geometric])
+    np.maximum(values, model.floor, out=values)
+    # Each account's paths are returned as one contiguous block, ready for taking percentiles over the paths. They are
+    # kept in single precision, as there can be a lot of them.
+    kept = (values[:, :, keep] * model.factors[keep]).transpose(2, 0, 1).astype(np.float32)
+    return kept, (values @ model.weights).transpose(2, 0, 1)
+
+
+def _collect(results, kept, totals):
+    """
+    Copy the results of _simulate_batch into kept and totals, one batch of paths after another.
+    """
+    first = 0
+    for batch_kept, batch_totals in results:
+        last = first + batch_totals.shape[2]
+        kept[:, :, first:last] = batch_kept
+        totals[:, :, first:last] = batch_totals
+        first = last
+
+
+class Projection(object):
+    """
+    Percentile bands of projected values for some accounts and every total, all in the reporting currency. Each band is
+    a (percentiles x dates) array, the first date being the last date of the history.
+    """
+    def __init__(self, dates, percentiles, bands, n_paths, entropy):
+        self.dates = dates
+        self.percentiles = list(percentiles)
+        self.bands = bands
+        self.n_paths = n_paths
+        # Pass as the seed to project to get the same projection again
+        self.entropy = entropy
+
+    def band(self, name, percentile):
+        """
+        :param name: Account or total name
+        :param percentile: One of the percentiles the projection was made with
+        :return: 1D array over self.dates
+        """
+        return self.bands[name][self.percentiles.index(percentile)]
+
+
+@timed("projection.project")
+def project(c, years=DEFAULT_YEARS, n_paths=DEFAULT_PATHS, percentiles=DEFAULT_PERCENTILES, accounts=None, seed=None,
+            max_workers=None, model=None):
+    """
+    Monte Carlo projection of every account and total, month by month.
+    :param c: Context
+    :param years: How far ahead to project
+    :param n_paths: Number of simulated paths
+    :param percentiles: Percentiles of the paths to return on each date
+    :param accounts: Names of the accounts to return bands for. Defaults to all of them. Totals are always returned.
+    :param seed: Seed for the random numbers. Defaults to a fresh one, which is kept on the result.
+    :param max_workers: Number of processes to simulate with. Defaults to simulating in this process.
+    :param model: ProjectionModel to simulate. Defaults to one fitted from the Context.
+    :return: Projection
+    """
+    assert years > 0 and n_paths > 0, "A projection needs a positive number of years and paths."
+    model = model or fit_projection_model(c)
+    steps = int(round(years * STEPS_PER_YEAR))
+    names = model.names if accounts is None else list(accounts)
+    keep = np.array([model.names.index(x) for x in names], dtype=np.int64)
+
+    seed_sequence = np.random.SeedSequence(seed)
+    sizes = [min(BATCH_PATHS, n_paths - x) for x in range(0, n_paths, BATCH_PATHS)]
+    seeds = seed_sequence.spawn(len(sizes))
+    args = ([model] * len(sizes), [steps] * len(sizes), sizes, seeds, [keep] * len(sizes))
+    # Every batch is copied into place as it arrives, so only one extra batch is held at a time
+    kept = np.empty((len(keep), steps, n_paths), dtype=np.float32)
+    totals = np.empty((len(model.total_names), steps, n_paths))
+    if max_workers is None or max_workers <= 1 or len(sizes) == 1:
+        _collect(map(_simulate_batch, *args), kept, totals)
+    else:
+        # Only needed when simulating in parallel, so not paid for at start up
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+            _collect(pool.map(_simulate_batch, *args), kept, totals)
+
+    start = np.concatenate([model.start[keep] * model.factors[keep], model.start @ model.weights])
+    bands = np.empty((len(percentiles), steps + 1, len(start)))
+    bands[:, 0] = start
+    # An account at a time, so only one account's paths are copied for partitioning at once
+    for idx, series in enumerate(itertools.chain(kept, totals)):
+        bands[:, 1:, idx] = np.percentile(series, percentiles, axis=1)
+
+    dates = [_add_months(model.start_date, x) for x in range(steps + 1)]
+    return Projection(dates, percentiles, {x: bands[:, :, idx] for idx, x in enumerate(names + model.total_names)},
+                      n_paths, seed_sequence.entropy)
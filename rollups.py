@@ -0,0 +1,237 @@
+import datetime as dt
+
+import numpy as np
+
+PERIODS = ["month", "quarter", "year"]
+# Months in each period. Quarters and years are built from the months rather than from the dates.
+PERIOD_MONTHS = {"month": 1, "quarter": 3, "year": 12}
+# Day ordinal of 1970-01-01, the epoch of numpy dates
+_EPOCH_ORDINAL = dt.date(1970, 1, 1).toordinal()
+
+
+def month_ids(ordinals):
+    """
+    :param ordinals: 1D array of day ordinals
+    :return: 1D int array of months since January 1970
+    """
+    days = (np.asarray(ordinals, dtype=np.int64) - _EPOCH_ORDINAL).astype("datetime64[D]")
+    return days.astype("datetime64[M]").astype(np.int64)
+
+
+def month_start_ordinals(month_ids):
+    """
+    :param month_ids: 1D int array of months since January 1970
+    :return: 1D int array of the day ordinal of the first day of each month
+    """
+    days = np.asarray(month_ids, dtype=np.int64).astype("datetime64[M]").astype("datetime64[D]")
+    return days.astype(np.int64) + _EPOCH_ORDINAL
+
+
+def _month_start(month_id):
+    return dt.datetime(1970 + int(month_id) // 12, int(month_id) % 12 + 1, 1)
+
+
+def _group_starts(group_ids):
+    """
+    :param group_ids: Sorted 1D array
+    :return: (unique ids, index of the first element of each)
+    """
+    keys, starts = np.unique(group_ids, return_index=True)
+    return keys, starts
+
+
+def _aggregate_dates(values, present, month):
+    """
+    Aggregate rows of account values into months, all accounts and months at once.
+    :param values: (dates x accounts) array
+    :param present: (dates x accounts) bool array
+    :param month: Sorted month id of each row
+    :return: (month ids, {"end", "min", "max", "sum", "count"}) with one row per month
+    """
+    keys, starts = _group_starts(month)
+    if not len(keys):
+        empty = np.zeros((0, values.shape[1]))
+        return keys, {"end": empty, "min": empty, "max": empty, "sum": empty, "count": empty}
+    rows = np.arange(len(values))[:, None]
+    # Index of the last row with an entry in each month, -1 for none
+    last = np.maximum.reduceat(np.where(present, rows, -1), starts, axis=0)
+    end = np.where(last >= 0, values[np.maximum(last, 0), np.arange(values.shape[1])], np.nan)
+    count = np.add.reduceat(present, starts, axis=0).astype(np.float64)
+    with np.errstate(invalid="ignore"):
+        low = np.minimum.reduceat(np.where(present, values, np.inf), starts, axis=0)
+        high = np.maximum.reduceat(np.where(present, values, -np.inf), starts, axis=0)
+    empty = count == 0
+    return keys, {"end": end,
+                  "min": np.where(empty, np.nan, low),
+                  "max": np.where(empty, np.nan, high),
+                  "sum": np.add.reduceat(np.where(present, values, 0.0), starts, axis=0),
+                  "count": count}
+
+
+def _combine(keys, stats, parent):
+    """
+    Combine consecutive rows of aggregates into coarser periods.
+    :param keys: Sorted ids of the rows
+    :param stats: Dictionary of aggregate arrays, as from _aggregate_dates
+    :param parent: Id of the coarser period of each row
+    :return: (parent ids, stats) with one row per parent period
+    """
+    parent_keys, starts = _group_starts(parent)
+    if not len(parent_keys):
+        return parent_keys, stats
+    rows = np.arange(len(keys))[:, None]
+    last = np.maximum.reduceat(np.where(stats["count"] > 0, rows, -1), starts, axis=0)
+    columns = np.arange(stats["end"].shape[1])
+    return parent_keys, {"end": np.where(last >= 0, stats["end"][np.maximum(last, 0), columns], np.nan),
+                         "min": np.fmin.reduceat(stats["min"], starts, axis=0),
+                         "max": np.fmax.reduceat(stats["max"], starts, axis=0),
+                         "sum": np.add.reduceat(stats["sum"], starts, axis=0),
+                         "count": np.add.reduceat(stats["count"], starts, axis=0)}
+
+
+def period_label(start, period):
+    """
+    :param start: Datetime of the first day of a period
+    :param period: One of PERIODS
+    :return: e.g. Jan-2020, Q1-2020 or 2020
+    """
+    if period == "month":
+        return start.strftime("%b-%Y")
+    if period == "quarter":
+        return f"Q{(start.month - 1) // 3 + 1}-{start.year}"
+    return str(start.year)
+
+
+class Rollup(object):
+    """
+    Aggregates of every account over every period of one length that has at least one date. Each statistic is a
+    (periods x accounts) array, NaN where an account has no entries in a period:
+        end: value on the last entry in the period
+        min, max, mean: of the entries in the period
+        change: end minus the end of the most recent earlier period with an entry
+        count: number of entries in the period
+    """
+    def __init__(self, period, names, keys, stats):
+        self.period = period
+        self.names = list(names)
+        # Periods are identified by the month they start in, counted from January 1970
+        self.keys = keys * PERIOD_MONTHS[period]
+        self.end = stats["end"]
+        self.min = stats["min"]
+        self.max = stats["max"]
+        self.count = stats["count"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean = np.where(self.count > 0, stats["sum"] / self.count, np.nan)
+        # Carry each account's last known end forward so that change skips periods without entries
+        rows = np.arange(len(self.end))[:, None]
+        last = np.maximum.accumulate(np.where(np.isnan(self.end), 0, rows), axis=0)
+        filled = self.end[last, np.arange(self.end.shape[1])]
+        self.change = np.full(self.end.shape, np.nan)
+        self.change[1:] = self.end[1:] - filled[:-1]
+
+    @property
+    def starts(self):
+        """
+        :return: List of datetimes for the first day of each period
+        """
+        return [_month_start(x) for x in self.keys]
+
+    @property
+    def ends(self):
+        """
+        :return: List of datetimes for the last day of each period
+        """
+        return [_month_start(x + PERIOD_MONTHS[self.period]) - dt.timedelta(days=1) for x in self.keys]
+
+    @property
+    def labels(self):
+        """
+        :return: List of display names for each period, e.g. Q1-2020
+        """
+        return [period_label(x, self.period) for x in self.starts]
+
+    def column(self, name):
+        """
+        :param name: Account name
+        :return: Dictionary of statistic name to a 1D array over the periods
+        """
+        idx = self.names.index(name)
+        return {x: getattr(self, x)[:, idx] for x in ["end", "min", "max", "mean", "change", "count"]}
+
+
+class RollupPyramid(object):
+    """
+    Monthly aggregates of an AccountStore, from which the quarterly and yearly ones are built. Only the months holding
+    changed dates are re-read from the store when it changes, and the coarser levels are rebuilt from the months, so
+    reading any level never scans every date again.
+    """
+    def __init__(self, store):
+        """
+        :param store: AccountStore to aggregate
+        """
+        self.store = store
+        self.names = None
+        self._keys = None
+        self._stats = None
+        # Months whose dates have changed since they were aggregated
+        self._stale = set()
+        self._levels = {}
+
+    def mark_stale(self, ordinals):
+        """
+        Record that values on some dates have changed, or that the dates were added or removed.
+        :param ordinals: Day ordinals of the changed dates
+        :return: None
+        """
+        if self._keys is None or not len(ordinals):
+            return
+        self._stale.update(month_ids(ordinals).tolist())
+        self._levels = {}
+
+    def _build(self):
+        self.names = list(self.store.names)
+        self._keys, self._stats = _aggregate_dates(self.store.values, self.store.present,
+                                                   month_ids(self.store.ordinals))
+        self._stale = set()
+        self._levels = {}
+
+    def _refresh(self):
+        """
+        Re-aggregate the stale months from the store and merge them into the monthly aggregates.
+        :return: None
+        """
+        stale = np.array(sorted(self._stale), dtype=np.int64)
+        # The dates are sorted, so each stale month is a slice of rows found with a binary search
+        ordinals = self.store.ordinals
+        first = np.searchsorted(ordinals, month_start_ordinals(stale))
+        after = np.searchsorted(ordinals, month_start_ordinals(stale + 1))
+        rows = np.concatenate([np.arange(lo, hi) for lo, hi in zip(first, after)])
+        month = np.repeat(stale, after - first)
+        new_keys, new_stats = _aggregate_dates(self.store.values[rows], self.store.present[rows], month)
+
+        keep = ~np.isin(self._keys, stale)
+        keys = np.concatenate([self._keys[keep], new_keys])
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._stats = {x: np.concatenate([self._stats[x][keep], new_stats[x]])[order] for x in self._stats}
+        self._stale = set()
+
+    def level(self, period):
+        """
+        :param period: One of PERIODS
+        :return: Rollup of the store for that period length
+        """
+        assert period in PERIODS, f"Invalid period {period}. Must be from: {PERIODS}"
+        if self._keys is None or self.names != self.store.names:
+            # Accounts have been added or removed, so every column needs building
+            self._build()
+        elif self._stale:
+            self._refresh()
+
+        if period not in self._levels:
+            keys, stats = self._keys, self._stats
+            if period != "month":
+                keys, stats = _combine(keys, stats, keys // PERIOD_MONTHS[period])
+            self._levels[period] = Rollup(period, self.names, keys, stats)
+
+        return self._levels[period]
@@ -0,0 +1,107 @@
+import csv
+import json
+import os
+
+from file_signature import file_signature, signature_matches
+
+# The index sits next to the csv it describes, e.g. latest_data.csv.index
+ROW_INDEX_SUFFIX = ".index"
+
+
+def row_index_path(csv_path):
+    """
+    :param csv_path: Path to a data file
+    :return: Path of the row index for that file
+    """
+    return csv_path + ROW_INDEX_SUFFIX
+
+
+def _leading_fields(line):
+    """
+    Read the account name and type from the start of a raw csv line without splitting the whole line.
+    :param line: bytes of a single csv row
+    :return: (name, type) strings
+    """
+    fields = line.rstrip(b"\r\n").split(b",", 2)
+    if any(x.startswith(b'"') for x in fields[:2]):
+        # Quoted fields need the csv module to read them properly
+        row = next(csv.reader([line.decode()]))
+        return row[0], row[1] if len(row) > 1 else ""
+    return fields[0].decode(), fields[1].decode() if len(fields) > 1 else ""
+
+
+def build_row_index(csv_path):
+    """
+    Scan a wide-format data file and record where each account row starts. Only the account name and type of each
+    row are read, the values are skipped.
+    :param csv_path: Path to a data file
+    :return: None if the file is not in the wide layout, otherwise a dictionary with the file signature, the
+    header location and {account name: [type, byte offset, byte length, row number]} in file order
+    """
+    rows = {}
+    with open(csv_path, "rb") as f:
+        header = f.readline()
+        if [x.strip().lower() for x in _leading_fields(header)] != ["account", "type"]:
+            return None
+        offset = len(header)
+        for row_number, line in enumerate(f, start=2):
+            if line.strip(b"\r\n, "):
+                name, account_type = _leading_fields(line)
+                name = name.strip().title()
+                if name in rows:
+                    raise ValueError(f"{csv_path} (row {row_number}): Account {name} appears more than once.")
+                rows[name] = [account_type, offset, len(line), row_number]
+            offset += len(line)
+
+    return {"source": file_signature(csv_path), "header": [0, len(header)], "rows": rows}
+
+
+def read_row_index(csv_path):
+    """
+    Get the row index for a data file, from the cached index file when it still matches the data file, otherwise by
+    building a new one in memory. Nothing is written here, the cache is only refreshed by write_row_index when the
+    data file is saved.
+    :param csv_path: Path to a data file
+    :return: Row index dictionary (see build_row_index), or None if the file is not in the wide layout
+    """
+    path = row_index_path(csv_path)
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                index = json.load(f)
+            if signature_matches(index.get("source"), csv_path):
+                return index
+        except (OSError, ValueError):
+            pass
+
+    return build_row_index(csv_path)
+
+
+def write_row_index(csv_path):
+    """
+    Build the row index for a data file and cache it next to the file, so later lazy loads can skip the scan.
+    :param csv_path: Path to a data file
+    :return: None
+    """
+    index = build_row_index(csv_path)
+    if index is None:
+        return
+    path = row_index_path(csv_path)
+    with open(path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(path + ".tmp", path)
+
+
+def read_row(csv_path, index, name):
+    """
+    Read the raw fields of a single account row using the index.
+    :param csv_path: Path to a data file
+    :param index: Row index dictionary
+    :param name: Account name
+    :return: List of csv fields for the row
+    """
+    _, offset, length, _ = index["rows"][name]
+    with open(csv_path, "rb") as f:
+        f.seek(offset)
+        line = f.read(length)
+    return next(csv.reader([line.decode()]))
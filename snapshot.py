@@ -0,0 +1,117 @@
+import datetime as dt
+import json
+import os
+import struct
+
+import numpy as np
+
+from file_signature import file_signature, signature_matches
+
+# A snapshot sits next to the csv it was taken from, e.g. latest_data.csv.snapshot
+SNAPSHOT_SUFFIX = ".snapshot"
+SNAPSHOT_MAGIC = b"SAVPLOT1"
+SNAPSHOT_VERSION = 1
+# Arrays start on a boundary of this many bytes so that they can be memory mapped directly
+SNAPSHOT_ALIGNMENT = 64
+
+
+def snapshot_path(csv_path):
+    """
+    :param csv_path: Path to a data file
+    :return: Path of the snapshot for that file
+    """
+    return csv_path + SNAPSHOT_SUFFIX
+
+
+def _align(offset):
+    return (offset + SNAPSHOT_ALIGNMENT - 1) // SNAPSHOT_ALIGNMENT * SNAPSHOT_ALIGNMENT
+
+
+def write_snapshot(csv_path, store, totals=None, totals_key=None):
+    """
+    Write a binary snapshot of a store, keyed on the current state of the csv it was saved to. The file is a short
+    magic string, a JSON header and then the raw ordinal, value and presence arrays. It is written to a temporary file
+    and renamed into place so a reader never sees a partial snapshot.
+    :param csv_path: Path to the data file the store was saved to
+    :param store: AccountStore to write
+    :param totals: Optional dictionary of total name to an array of values over the date axis
+    :param totals_key: Optional JSON-serialisable description of how the totals were calculated
+    :return: None
+    """
+    totals = totals or {}
+    arrays = [("ordinals", np.ascontiguousarray(store.ordinals, dtype=np.int64)),
+              ("values", np.asfortranarray(store.values, dtype=np.float64)),
+              ("present", np.asfortranarray(store.present, dtype=bool)),
+              ("totals", np.asfortranarray(np.column_stack(list(totals.values())) if totals
+                                           else np.zeros((store.n_dates, 0)), dtype=np.float64))]
+    header = {"version": SNAPSHOT_VERSION,
+              "source": file_signature(csv_path, with_hash=True),
+              "names": store.names,
+              "types": store.types,
+              "currencies": store.currencies,
+              "totals": list(totals.keys()),
+              "totals_key": totals_key,
+              "n_dates": store.n_dates,
+              "arrays": {}}
+
+    # Offsets depend on the header length, so lay the arrays out after a generous estimate of it
+    header_bytes = json.dumps(header).encode()
+    offset = _align(len(SNAPSHOT_MAGIC) + 8 + len(header_bytes) + 64 * len(arrays) + 256)
+    for name, array in arrays:
+        header["arrays"][name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+        offset = _align(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode()
+    first_offset = header["arrays"]["ordinals"]["offset"]
+    assert len(SNAPSHOT_MAGIC) + 8 + len(header_bytes) <= first_offset, "Snapshot header is too large."
+
+    path = snapshot_path(csv_path)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays:
+            f.seek(header["arrays"][name]["offset"])
+            f.write(array.tobytes(order="F"))
+    os.replace(temp_path, path)
+
+
+def read_snapshot(csv_path):
+    """
+    Read the snapshot for a data file, if there is one and it still matches the file.
+    The numeric arrays are memory mapped rather than read.
+    :param csv_path: Path to a data file
+    :return: None, or a dictionary of dates, names, types, currencies, values, present, totals and totals_key
+    """
+    path = snapshot_path(csv_path)
+    if not os.path.exists(path) or not os.path.exists(csv_path):
+        return None
+
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                return None
+            header_length = struct.unpack("<Q", f.read(8))[0]
+            header = json.loads(f.read(header_length))
+    except (OSError, ValueError, struct.error):
+        return None
+
+    if header.get("version") != SNAPSHOT_VERSION or not signature_matches(header["source"], csv_path):
+        return None
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        if 0 in shape:
+            arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+        else:
+            arrays[name] = np.memmap(path, dtype=spec["dtype"], mode="r", offset=spec["offset"], shape=shape, order="F")
+
+    return {"dates": [dt.datetime.fromordinal(int(x)) for x in arrays["ordinals"]],
+            "names": header["names"],
+            "types": header["types"],
+            "currencies": header["currencies"],
+            "values": arrays["values"],
+            "present": arrays["present"],
+            "totals": {name: arrays["totals"][:, idx] for idx, name in enumerate(header["totals"])},
+            "totals_key": header["totals_key"]}
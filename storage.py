@@ -0,0 +1,234 @@
+import datetime as dt
+import itertools
+import sqlite3
+
+import numpy as np
+
+from fx import BASE_CURRENCY
+from journal import decode_date
+
+STORAGE_BACKENDS = ["csv", "sqlite"]
+# Data files with these extensions are SQLite databases, anything else is a csv
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+SQLITE_FILE_NAME = "latest_data.db"
+# Seconds a connection waits for another writer to finish before giving up
+SQLITE_TIMEOUT = 30
+# One row per entry, keyed on (account, date) so an account's history is a single range of the primary key, with a
+# second index for everything held on one date. Dates are day ordinals. The dates table holds the date axis, which
+# can include dates with no entries.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    type TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dates (
+    date INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS entries (
+    account INTEGER NOT NULL REFERENCES accounts (id) ON DELETE CASCADE,
+    date INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (account, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_by_date ON entries (date, account);
+"""
+
+
+def storage_backend(path):
+    """
+    :param path: Path to a data file
+    :return: The backend from STORAGE_BACKENDS that reads and writes it, picked by the file extension
+    """
+    return "sqlite" if path.lower().endswith(SQLITE_SUFFIXES) else "csv"
+
+
+def _ordinal(date):
+    return date.toordinal()
+
+
+class SqliteStorage(object):
+    """
+    Account history held in a SQLite database, one row per entry. Unlike the csv, any single value can be read or
+    written without touching the rest of the file, so a Context loaded from a database writes each edit straight
+    through rather than journaling it. The database runs in WAL mode, so readers never block the writer or each other.
+    """
+    def __init__(self, path, read_only=False):
+        """
+        :param path: Path to the database. A missing or empty file is set up with an empty schema.
+        :param read_only: Open without write access, and without creating anything
+        """
+        self.path = path
+        if read_only:
+            self._connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=SQLITE_TIMEOUT)
+        else:
+            self._connection = sqlite3.connect(path, timeout=SQLITE_TIMEOUT)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            # In WAL mode a commit is still atomic without syncing every transaction, only the most recent ones can
+            # be lost in a power cut
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SQLITE_SCHEMA)
+        self._connection.execute("PRAGMA foreign_keys=ON")
+
+    def close(self):
+        self._connection.close()
+
+    def _account_ids(self, names=None):
+        """
+        :param names: Account names to look up. Defaults to every account.
+        :return: List of (id, name, type, currency) in account order
+        """
+        rows = self._connection.execute("SELECT id, name, type, currency FROM accounts ORDER BY position").fetchall()
+        if names is not None:
+            known = {x[1]: x for x in rows}
+            missing = [x for x in names if x not in known]
+            assert not missing, f"{', '.join(missing)} not found in {self.path}."
+            rows = [known[x] for x in names]
+        return rows
+
+    def account_names(self):
+        """
+        :return: List of account names, in the order they were added
+        """
+        return [x[1] for x in self._account_ids()]
+
+    def dates(self):
+        """
+        :return: Sorted list of datetimes on the date axis
+        """
+        return [dt.datetime.fromordinal(x[0]) for x in self._connection.execute("SELECT date FROM dates ORDER BY date")]
+
+    def read(self, accounts=None):
+        """
+        Read the whole date axis and the entries of some or all accounts, in the layout of data_handler.read_data_file.
+        :param accounts: Names of the accounts to read. Defaults to every account.
+        :return: dates (list of datetimes), names, types, currencies, values ((dates x accounts) array, NaN for no
+        entry)
+        """
+        rows = self._account_ids(accounts)
+        ordinals = np.array([x[0] for x in self._connection.execute("SELECT date FROM dates ORDER BY date")],
+                            dtype=np.int64)
+        values = np.full((len(ordinals), len(rows)), np.nan)
+        if rows:
+            query = "SELECT account, date, value FROM entries"
+            if accounts is not None:
+                query += f" WHERE account IN ({','.join('?' * len(rows))})"
+            entries = self._connection.execute(query, [x[0] for x in rows] if accounts is not None else []).fetchall()
+            if entries:
+                entries = np.fromiter(itertools.chain.from_iterable(entries), dtype=np.float64,
+                                      count=3 * len(entries)).reshape(-1, 3)
+                ids = np.array([x[0] for x in rows], dtype=np.int64)
+                order = np.argsort(ids)
+                columns = order[np.searchsorted(ids[order], entries[:, 0].astype(np.int64))]
+                values[np.searchsorted(ordinals, entries[:, 1].astype(np.int64)), columns] = entries[:, 2]
+
+        return ([dt.datetime.fromordinal(int(x)) for x in ordinals], [x[1] for x in rows], [x[2] for x in rows],
+                [x[3] for x in rows], values)
+
+    def read_account(self, name):
+        """
+        Read a single account, using the primary key to go straight to its entries.
+        :param name: Account name
+        :return: type, currency, day ordinals of its entries, values of its entries
+        """
+        row = self._connection.execute("SELECT id, type, currency FROM accounts WHERE name = ?", (name,)).fetchone()
+        assert row is not None, f"{name} not found in {self.path}."
+        entries = self._connection.execute("SELECT date, value FROM entries WHERE account = ? ORDER BY date",
+                                           (row[0],)).fetchall()
+        return (row[1], row[2], np.array([x[0] for x in entries], dtype=np.int64),
+                np.array([x[1] for x in entries], dtype=np.float64))
+
+    def write(self, dates, names, types, currencies, values, present):
+        """
+        Replace everything in the database in one transaction.
+        :param dates: Sorted list of datetimes
+        :param names: List of account names
+        :param types: List of account types
+        :param currencies: List of account currencies
+        :param values: (dates x accounts) array
+        :param present: (dates x accounts) bool array
+        :return: None
+        """
+        ordinals = np.array([_ordinal(x) for x in dates], dtype=np.int64)
+        # Transposed, so the entries go in in primary key order
+        accounts, rows = np.nonzero(np.asarray(present).T)
+        with self._connection:
+            self._connection.execute("DELETE FROM entries")
+            self._connection.execute("DELETE FROM accounts")
+            self._connection.execute("DELETE FROM dates")
+            self._connection.executemany("INSERT INTO accounts (id, name, type, currency, position) "
+                                         "VALUES (?, ?, ?, ?, ?)",
+                                         [(idx, *x, idx) for idx, x in enumerate(zip(names, types, currencies))])
+            self._connection.executemany("INSERT INTO dates (date) VALUES (?)", [(x,) for x in ordinals.tolist()])
+            self._connection.executemany("INSERT INTO entries (account, date, value) VALUES (?, ?, ?)",
+                                         zip(accounts.tolist(), ordinals[rows].tolist(),
+                                             np.asarray(values).T[accounts, rows].tolist()))
+
+    def checkpoint(self):
+        """
+        Fold the write-ahead log back into the database file.
+        :return: None
+        """
+        self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _add_account(self, name, account_type, currency):
+        self._connection.execute("INSERT INTO accounts (name, type, currency, position) "
+                                 "SELECT ?, ?, ?, COALESCE(MAX(position) + 1, 0) FROM accounts",
+                                 (name, account_type, currency))
+
+    def _set_values(self, entries):
+        """
+        :param entries: List of (account name, day ordinal, value) with None to remove an entry
+        """
+        ids = {x[1]: x[0] for x in self._account_ids()}
+        self._connection.executemany("INSERT OR IGNORE INTO dates (date) VALUES (?)", {(x[1],) for x in entries})
+        self._connection.executemany("INSERT OR REPLACE INTO entries (account, date, value) VALUES (?, ?, ?)",
+                                     [(ids[n], o, v) for n, o, v in entries if v is not None])
+        self._connection.executemany("DELETE FROM entries WHERE account = ? AND date = ?",
+                                     [(ids[n], o) for n, o, v in entries if v is None])
+
+    def _apply(self, op, fields):
+        """
+        Make the change described by one edit record. See append.
+        """
+        if op == "add_account":
+            self._add_account(fields["account"], fields["type"], fields["currency"] or BASE_CURRENCY)
+            self._set_values([(fields["account"], _ordinal(decode_date(d)), v) for d, v in fields["values"].items()])
+        elif op == "remove_account":
+            self._connection.execute("DELETE FROM accounts WHERE name = ?", (fields["account"],))
+        elif op == "add_date":
+            ordinal = _ordinal(decode_date(fields["date"]))
+            self._connection.execute("INSERT OR IGNORE INTO dates (date) VALUES (?)", (ordinal,))
+            self._set_values([(n, ordinal, v) for n, v in fields["values"].items()])
+        elif op == "remove_date":
+            ordinal = _ordinal(decode_date(fields["date"]))
+            self._connection.execute("DELETE FROM entries WHERE date = ?", (ordinal,))
+            self._connection.execute("DELETE FROM dates WHERE date = ?", (ordinal,))
+        elif op == "set_value":
+            self._set_values([(fields["account"], _ordinal(decode_date(fields["date"])), fields["value"])])
+        elif op == "merge_values":
+            for name, account_type in fields["account_types"].items():
+                self._add_account(name, account_type, fields["account_currencies"][name])
+            self._set_values([(n, _ordinal(decode_date(d)), v) for n, d, v in fields["entries"]])
+        elif op == "apply_edits":
+            for edit in fields["edits"]:
+                if edit["op"] == "add_account":
+                    # Values for a new account come in as separate set_value edits
+                    self._apply(edit["op"], dict(edit, values={}))
+                else:
+                    self._apply(edit["op"], edit)
+        else:
+            raise ValueError(f"Unknown edit operation {op}.")
+
+    def append(self, op, **fields):
+        """
+        Write a single edit straight into the database, in its own transaction. Takes the same edit records as
+        Journal.append, so a Context records its edits the same way whichever backend it was loaded from.
+        :param op: Name of the edit operation
+        :param fields: Details of the edit, with dates encoded by journal.encode_date
+        :return: None
+        """
+        with self._connection:
+            self._apply(op, fields)
@@ -0,0 +1,227 @@
+import csv
+import io
+import json
+import math
+import sys
+
+import numpy as np
+
+from account_store import to_ordinals
+from data_handler import OUTPUT_DATE_FORMAT
+from fx import currency_symbol, format_money
+
+TABLE_FORMATS = ["text", "csv", "json"]
+DEFAULT_TABLE_FORMAT = "text"
+# Rows formatted and written at a time. Anything longer is streamed a chunk at a time so memory stays flat.
+STREAM_ROWS = 20000
+COLUMN_GAP = "  "
+
+
+class Table(object):
+    """
+    A table held as columns of equal length, each a list or 1D array. Money columns hold floats, NaN for no entry, and
+    are shown in the currency of each row, taken from a currency column. Columns are only formatted as they are
+    written, a chunk of rows at a time.
+    """
+    def __init__(self, header, columns, money=None):
+        """
+        :param header: Column names
+        :param columns: List of columns, in the order of header
+        :param money: Dictionary of money column name to the name of the currency column it is in
+        """
+        assert len(header) == len(columns), "There must be one column per heading."
+        assert len(set(len(x) for x in columns)) <= 1, "Every column must be the same length."
+        self.header = list(header)
+        self.columns = list(columns)
+        self.money = money or {}
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def column(self, name):
+        return self.columns[self.header.index(name)]
+
+
+def date_table(c, dates=None, interp=False):
+    """
+    Every account and total on each of a list of dates, one row per account per date.
+    :param c: Context
+    :param dates: List of datetimes. Defaults to every date of the Context.
+    :param interp: Fill in accounts with no entry on a date by interpolating between entries
+    :return: Table with the columns Date, Account, Type, Currency, Value
+    """
+    c._require_all()
+    store = c.store
+    dates = list(c.all_dates if dates is None else dates)
+    ordinals = to_ordinals(dates)
+    n = store.n_dates
+    rows = np.searchsorted(store.ordinals, ordinals)
+    on_axis = rows < n
+    on_axis[on_axis] = store.ordinals[rows[on_axis]] == ordinals[on_axis]
+    rows = np.minimum(rows, max(n - 1, 0))
+
+    values = np.full((len(dates), store.n_accounts), np.nan)
+    if n:
+        present = on_axis[:, None] & store.present[rows]
+        values[present] = store.values[rows][present]
+    if interp and np.isnan(values).any():
+        # Imported here as analytics is only needed for interpolated reports
+        import analytics
+        values = np.where(np.isnan(values), analytics.value_matrix(c, dates, convert=False), values)
+
+    totals = list(c.totals.values())
+    if totals:
+        total_values = np.column_stack([x.interpolate_values(dates) for x in totals])
+        if not interp:
+            total_values[~on_axis] = np.nan
+        values = np.hstack([values, total_values])
+
+    names = np.array(store.names + [x.name for x in totals], dtype=object)
+    types = np.array(store.types + ["Total"] * len(totals), dtype=object)
+    currencies = np.array(store.currencies + [c.reporting_currency] * len(totals), dtype=object)
+    date_strings = np.array([x.strftime(OUTPUT_DATE_FORMAT) for x in dates], dtype=object)
+    return Table(["Date", "Account", "Type", "Currency", "Value"],
+                 [np.repeat(date_strings, len(names)), np.tile(names, len(dates)), np.tile(types, len(dates)),
+                  np.tile(currencies, len(dates)), values.ravel()],
+                 money={"Value": "Currency"})
+
+
+def account_table(c, name):
+    """
+    Every date of one account or total.
+    :param c: Context
+    :param name: Name of an account or a total
+    :return: Table with the columns Date, Currency, Value
+    """
+    _bc = c.totals[name] if name in c.totals else c.all_accounts[name]
+    values = np.where(_bc.present, _bc.values, np.nan)
+    return Table(["Date", "Currency", "Value"],
+                 [[x.strftime(OUTPUT_DATE_FORMAT) for x in _bc.dates], [_bc.currency] * len(values), values],
+                 money={"Value": "Currency"})
+
+
+def _money_strings(values, currencies):
+    """
+    :return: List of values formatted like fx.format_money, blank for NaN
+    """
+    # Looked up once per currency rather than once per value, this is the bulk of the work for a long table
+    symbols = {x: currency_symbol(x) for x in set(currencies)}
+    return ["" if math.isnan(v) else f"{symbols[cur]}{v:.2f}" for v, cur in zip(values.tolist(), currencies)]
+
+
+def _text_chunks(table, chunk_rows):
+    currency_columns = set(table.money.values())
+    shown = [idx for idx, x in enumerate(table.header) if x not in currency_columns]
+    money = [table.header[idx] in table.money for idx in shown]
+
+    # Widths are worked out for the whole table before anything is written, so every chunk lines up
+    widths = []
+    for idx, is_money in zip(shown, money):
+        column = table.columns[idx]
+        if not len(column):
+            widths.append(len(table.header[idx]))
+        elif is_money:
+            values = np.asarray(column, dtype=np.float64)
+            finite = values[~np.isnan(values)]
+            symbols = set(table.column(table.money[table.header[idx]]))
+            longest = max((len(f"{x:.2f}") for x in [finite.min(), finite.max()]), default=0) if len(finite) else 0
+            widths.append(max(len(table.header[idx]), longest + max(len(currency_symbol(x)) for x in symbols)))
+        else:
+            widths.append(max(len(table.header[idx]), max(len(str(x)) for x in set(column))))
+    template = COLUMN_GAP.join(f"{{:{'>' if m else '<'}{w}}}" for m, w in zip(money, widths)) + "\n"
+
+    # The header goes out with the first chunk, so a page never ends straight after it
+    header = template.format(*[table.header[x] for x in shown])
+    for start in range(0, len(table), chunk_rows):
+        stop = start + chunk_rows
+        cells = []
+        for idx, is_money in zip(shown, money):
+            if is_money:
+                currencies = table.column(table.money[table.header[idx]])[start:stop]
+                cells.append(_money_strings(np.asarray(table.columns[idx][start:stop], dtype=np.float64), currencies))
+            else:
+                cells.append(table.columns[idx][start:stop])
+        yield header + "".join(map(template.format, *cells))
+        header = ""
+    if header:
+        yield header
+
+
+def _raw_columns(table, start, stop):
+    """
+    :return: The columns for rows start to stop, with money as floats rounded to pennies and None for no entry
+    """
+    columns = []
+    for name, column in zip(table.header, table.columns):
+        if name in table.money:
+            values = np.round(np.asarray(column[start:stop], dtype=np.float64), 2).tolist()
+            columns.append([None if math.isnan(v) else v for v in values])
+        else:
+            columns.append(list(column[start:stop]))
+    return columns
+
+
+def _csv_chunks(table, chunk_rows):
+    buffer = io.StringIO()
+    write_out = csv.writer(buffer, delimiter=",", lineterminator="\n")
+    write_out.writerow(table.header)
+    for start in range(0, len(table), chunk_rows):
+        write_out.writerows(zip(*_raw_columns(table, start, start + chunk_rows)))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _json_chunks(table, chunk_rows):
+    # Each row is filled into a template with its cells already encoded. Text cells repeat a lot (the same few dates,
+    # names and types over and over), so each distinct one is only encoded once.
+    keys = [json.dumps(x).replace("{", "{{").replace("}", "}}") for x in table.header]
+    template = "{{" + ", ".join(f"{x}: {{}}" for x in keys) + "}}"
+    encoded = [{} for _ in table.header]
+    opening = "[\n"
+    for start in range(0, len(table), chunk_rows):
+        cells = []
+        for name, column, cache in zip(table.header, _raw_columns(table, start, start + chunk_rows), encoded):
+            if name in table.money:
+                cells.append(["null" if v is None else repr(v) for v in column])
+            else:
+                cells.append([cache[v] if v in cache else cache.setdefault(v, json.dumps(v)) for v in column])
+        closing = "\n]\n" if start + chunk_rows >= len(table) else ",\n"
+        yield opening + ",\n".join(map(template.format, *cells)) + closing
+        opening = ""
+    if opening:
+        yield "[\n]\n"
+
+
+_RENDERERS = {"text": _text_chunks, "csv": _csv_chunks, "json": _json_chunks}
+
+
+def write_table(table, table_format=None, out=None, page_rows=None, more=None):
+    """
+    Write a table in one go if it is short, or a chunk at a time if it is long.
+    :param table: Table to write
+    :param table_format: One of TABLE_FORMATS. text lines the columns up, csv and json give the raw values. Defaults to
+    DEFAULT_TABLE_FORMAT.
+    :param out: File-like object to write to. Defaults to stdout.
+    :param page_rows: Rows per page, to pause between pages. Defaults to no pauses.
+    :param more: With page_rows, called after each page. Return False to stop writing.
+    :return: None
+    """
+    table_format = table_format or DEFAULT_TABLE_FORMAT
+    assert table_format in TABLE_FORMATS, f"Invalid table format {table_format}. Must be from: {TABLE_FORMATS}"
+    out = sys.stdout if out is None else out
+    chunks = _RENDERERS[table_format](table, page_rows or STREAM_ROWS)
+    if page_rows is None and len(table) <= STREAM_ROWS:
+        out.write("".join(chunks))
+        return
+
+    chunk = next(chunks, None)
+    while chunk is not None:
+        out.write(chunk)
+        chunk = next(chunks, None)
+        if chunk is not None and page_rows is not None and more is not None:
+            out.flush()
+            if not more():
+                break
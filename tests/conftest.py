@@ -0,0 +1,26 @@
+import datetime as dt
+import os
+import sys
+
+import pytest
+
+# The modules sit in the root of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_handler import BankAccount, Context
+
+
+@pytest.fixture
+def savings(tmp_path):
+    """
+    :return: (path, Context) of a journaled data file with totals and a single savings account on two dates
+    """
+    path = tmp_path / "data.csv"
+    path.write_text("")
+    c = Context(str(path))
+    c.generate_totals()
+    _bc = BankAccount("Savings", "savings")
+    _bc.add_entry(100, dt.datetime(2020, 1, 31))
+    _bc.add_entry(150, dt.datetime(2020, 2, 29))
+    c.add_account(_bc)
+    return str(path), c
@@ -0,0 +1,65 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from account_store import AccountStore, INITIAL_CAPACITY, format_value, parse_value
+
+
+def _store():
+    store = AccountStore()
+    store.add_account("Savings", "Savings", "GBP")
+    store.add_account("Current", "Current", "GBP")
+    return store
+
+
+def test_values_are_parsed_and_formatted():
+    assert parse_value(" £1,250.50 ") == 1250.5
+    assert parse_value("") is None
+    assert parse_value(None) is None
+    with pytest.raises(ValueError):
+        parse_value("abc")
+    assert format_value(12.0) == "12"
+    assert format_value(0.5) == "0.5"
+    assert format_value(None) == ""
+
+
+def test_dates_stay_in_order():
+    store = _store()
+    for month in [3, 1, 2]:
+        store.set_value("Savings", dt.datetime(2020, month, 1), month)
+    assert store.dates == [dt.datetime(2020, x, 1) for x in [1, 2, 3]]
+    assert store.column("Savings")[0].tolist() == [1, 2, 3]
+    assert store.get_value("Current", dt.datetime(2020, 2, 1)) is None
+
+    store.add_dates([dt.datetime(2020, 2, 15), dt.datetime(2020, 1, 1), dt.datetime(2019, 12, 1)])
+    assert store.n_dates == 5
+    assert store.ordinals.tolist() == sorted(store.ordinals.tolist())
+    assert store.get_value("Savings", dt.datetime(2020, 3, 1)) == 3
+
+    store.remove_date(dt.datetime(2020, 2, 1))
+    assert store.date_index(dt.datetime(2020, 2, 1)) is None
+    assert store.get_value("Savings", dt.datetime(2020, 3, 1)) == 3
+
+
+def test_grows_past_initial_capacity():
+    store = _store()
+    dates = [dt.datetime(2020, 1, 1) + dt.timedelta(days=x) for x in range(INITIAL_CAPACITY * 3)]
+    for idx in range(INITIAL_CAPACITY * 2):
+        store.add_account(f"Account {idx}", "Current", "GBP")
+    store.set_values([f"Account {x % 5}" for x in range(len(dates))], dates, list(range(len(dates))))
+    assert store.values.shape == (len(dates), INITIAL_CAPACITY * 2 + 2)
+    assert store.get_value("Account 2", dates[7]) == 7
+    assert store.present.sum() == len(dates)
+
+
+def test_remove_account_keeps_other_columns():
+    store = _store()
+    store.set_values(["Savings", "Current"], [dt.datetime(2020, 1, 1)] * 2, [10, None])
+    store.remove_account("Savings")
+    assert store.names == ["Current"]
+    assert store.column_index("Current") == 0
+    assert not store.has_account("Savings")
+    values, present = store.column("Current")
+    assert not present.any()
+    assert np.all(values == 0)
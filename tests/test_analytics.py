@@ -0,0 +1,85 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+import analytics
+from data_handler import BankAccount
+
+START = dt.datetime(2018, 1, 1)
+END = dt.datetime(2020, 1, 1)
+
+
+@pytest.fixture
+def growing(savings):
+    path, c = savings
+    c.remove_account("Savings")
+    for name, account_type, start, end in [("Isa", "savings", 100, 121), ("Card", "credit", 50, 20),
+                                          ("Current", "current", 0, 10)]:
+        _bc = BankAccount(name, account_type)
+        _bc.add_entry(start, START)
+        _bc.add_entry(end, END)
+        c.add_account(_bc)
+    c.set_value("Isa", dt.datetime(2019, 1, 1), 105)
+    return c
+
+
+def test_annualized_growth(growing):
+    years = (END - START).days / analytics.DAYS_PER_YEAR
+    growth = analytics.annualized_growth(growing)
+    assert growth[0] == pytest.approx(1.21 ** (1 / years) - 1)
+    assert growth[1] == pytest.approx(0.4 ** (1 / years) - 1)
+    # No growth rate from a zero balance
+    assert np.isnan(growth[2])
+    # Measured from a date between entries, using the interpolated value
+    mid = dt.datetime(2018, 7, 2)
+    start_value = 100 + 5 * (mid - START).days / (dt.datetime(2019, 1, 1) - START).days
+    assert analytics.annualized_growth(growing, start=mid)[0] == pytest.approx(
+        (121 / start_value) ** (analytics.DAYS_PER_YEAR / (END - mid).days) - 1)
+
+
+def test_value_matrix_matches_account_interpolation(growing):
+    dates = [dt.datetime(2017, 12, 1), START, dt.datetime(2018, 3, 1), dt.datetime(2019, 6, 1), END]
+    for method in ["step", "linear", "monotone"]:
+        matrix = analytics.value_matrix(growing, dates, method)
+        for idx, name in enumerate(growing.store.names):
+            expected = growing.all_accounts[name].interpolate_values(dates, method)
+            assert np.allclose(matrix[:, idx], expected, equal_nan=True), (method, name)
+
+
+def test_rolling_windows():
+    rng = np.random.default_rng(1)
+    values = rng.normal(100, 10, (40, 3))
+    values[20, 1] = np.nan
+    window = 7
+    mean = analytics.rolling_mean(values, window)
+    volatility = analytics.rolling_volatility(values, window)
+    for row in range(len(values)):
+        for col in range(3):
+            if row < window - 1 or (col == 1 and row - window < 20 <= row):
+                assert np.isnan(mean[row, col])
+            else:
+                assert mean[row, col] == pytest.approx(values[row - window + 1:row + 1, col].mean())
+            changes = np.diff(values[max(row - window, 0):row + 1, col])
+            if row < window or np.isnan(changes).any():
+                assert np.isnan(volatility[row, col])
+            else:
+                assert volatility[row, col] == pytest.approx(changes.std(ddof=1))
+
+
+def test_contributions_add_up_to_the_total(growing):
+    growing.generate_totals()
+    dates = [START, dt.datetime(2019, 1, 1), END]
+    _, parts = analytics.contributions(growing, dates)
+    total = [growing.totals["Total Worth"].get_value_on_date(x) for x in dates]
+    assert np.allclose(parts.sum(axis=1), np.diff(total))
+    assert parts[:, 0].tolist() == [5, 16]
+    # Credit comes off the total, and as in the totals the card counts as nothing on the date it has no entry
+    assert parts[:, 1].tolist() == [50, -20]
+
+
+def test_period_change(growing):
+    labels, change, relative = analytics.period_change(growing, "year")
+    assert labels == ["2018", "2019", "2020"]
+    assert change[1:, 0].tolist() == [5, 16]
+    assert relative[1, 0] == pytest.approx(0.05)
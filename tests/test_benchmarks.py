@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from data_handler import CHECK_DATE_FORMATS, read_data_file
+
+# The benchmark scripts are run directly rather than imported as a package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import startup
+import suite
+from synthetic import generate_history, LAYOUTS, parse_type_mix, write_history
+
+
+@pytest.mark.parametrize("module, deferred", [("data_handler", ["matplotlib", "concurrent.futures"]),
+                                              ("inspect_data", ["numpy", "matplotlib", "data_handler"]),
+                                              ("plotter", ["matplotlib"])])
+def test_heavy_imports_are_deferred(module, deferred):
+    code = f"import sys, {module}; print([x for x in {deferred!r} if x in sys.modules])"
+    result = subprocess.run([sys.executable, "-c", code], cwd=startup.REPO_ROOT, capture_output=True, text=True,
+                            check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_startup_benchmark_runs():
+    results = startup.run_benchmarks(repeats=1, top=3)
+    assert list(results) == list(startup.COMMANDS)
+    for result in results.values():
+        assert 0 < result["wall"]["min"] <= result["wall"]["median"] <= result["wall"]["max"]
+        assert 0 < len(result["imports"]["slowest"]) <= 3
+    previous = {name: {"wall": {"median": result["wall"]["median"] / 10}} for name, result in results.items()}
+    assert startup.print_results(results, previous) == list(startup.COMMANDS)
+
+
+def test_history_is_repeatable():
+    dates, names, types, values = generate_history(12, 30, sparsity=0.5, type_mix=parse_type_mix("current=1,credit=1"))
+    assert values.shape == (30, 12)
+    assert set(types) <= {"current", "credit"}
+    assert not np.isnan(values[0]).any()
+    assert np.isnan(values).any()
+    assert np.array_equal(values, generate_history(12, 30, sparsity=0.5, type_mix={"current": 1, "credit": 1})[3],
+                          equal_nan=True)
+
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+@pytest.mark.parametrize("date_format", CHECK_DATE_FORMATS)
+def test_history_reads_back(tmp_path, layout, date_format):
+    dates, names, types, values = generate_history(5, 40, sparsity=0.3, step_days=7)
+    path = str(tmp_path / "history.csv")
+    write_history(path, dates, names, types, values, date_format, layout)
+    read_dates, read_names, read_types, _, read_values = read_data_file(path)
+    assert read_dates == dates
+    assert (read_names, read_types) == (names, [x.title() for x in types])
+    assert np.array_equal(read_values, values, equal_nan=True)
+
+
+def test_every_scenario_runs(tmp_path):
+    path = str(tmp_path / "history.csv")
+    write_history(path, *generate_history(4, 60, sparsity=0.2))
+    for name, setup in suite.SCENARIOS.items():
+        result = suite.measure(setup, path, str(tmp_path), 1)
+        assert result["min"] > 0 and result["peak_bytes"] > 0, name
@@ -0,0 +1,80 @@
+import asyncio
+import datetime as dt
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+import daemon
+from data_handler import data_file_path
+
+
+def test_default_socket_path():
+    assert daemon.DEFAULT_SOCKET_PATH == daemon.socket_path_for(data_file_path())
+    assert daemon.DEFAULT_SOCKET_PATH == daemon.socket_path_for(data_file_path("sqlite"))
+
+
+def test_query_client_does_without_numpy():
+    code = "import sys, inspect_data; assert 'numpy' not in sys.modules and 'asyncio' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(daemon.__file__)), check=True)
+
+
+def test_query_without_daemon(tmp_path, capsys):
+    socket_path = str(tmp_path / daemon.DAEMON_SOCKET_NAME)
+    assert daemon.run_client(socket_path, ['{"query": "ping"}']) == 1
+    assert "No daemon is listening" in capsys.readouterr().err
+
+
+def test_report_is_written_into_the_reply(savings, capsys):
+    path, c = savings
+    server = daemon.QueryServer(path)
+    server.context = c
+    reply = json.loads(asyncio.run(server.respond(b'{"query": "report", "kind": "quick"}')))
+    assert reply["ok"] and "Total Money" in reply["result"]
+    assert capsys.readouterr().out == ""
+
+
+def _wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out waiting for the daemon."
+        time.sleep(0.05)
+
+
+def test_daemon_round_trip(savings):
+    path, c = savings
+    c.generate_totals()
+    socket_path = daemon.socket_path_for(path)
+    code = "import sys, daemon; daemon.QueryServer(sys.argv[1], watch_interval=0.05).run()"
+    server = subprocess.Popen([sys.executable, "-c", code, path], cwd=os.path.dirname(os.path.abspath(daemon.__file__)),
+                              stdout=subprocess.DEVNULL)
+    try:
+        _wait_for(lambda: os.path.exists(socket_path))
+        client = daemon.DaemonClient(socket_path)
+        try:
+            assert client.query("ping") == {"accounts": 1, "dates": 2, "reloads": 1}
+            assert client.query("dates") == ["2020-01-31", "2020-02-29"]
+            assert client.query("value", account="savings", date=dt.datetime(2020, 2, 29)) == 150
+            assert client.query("values", account="Savings", dates=["2020-02-14"]) == [100 + 50 * 14 / 29]
+            assert client.query("range", account="Savings", start="2020-02-01", end="2020-12-31") == {
+                "dates": ["2020-02-29"], "values": [150]}
+            assert client.query("totals", date="2020-01-31") == {"Total Money": 100, "Total Worth": 100}
+            with pytest.raises(daemon.QueryError, match="Unknown account"):
+                client.query("value", account="Missing", date="2020-01-31")
+            assert not client.send({"query": "delete", "id": 7})["ok"]
+            assert client.send({"query": "ping", "id": 7})["id"] == 7
+
+            # An edit made elsewhere is picked up without restarting
+            c.set_value("Savings", dt.datetime(2020, 2, 29), 175)
+            _wait_for(lambda: client.query("ping")["reloads"] == 2)
+            assert client.query("value", account="Savings", date="2020-02-29") == 175
+        finally:
+            client.close()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+    assert not os.path.exists(socket_path)
@@ -0,0 +1,91 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from data_handler import (Context, DataFileError, handle_date_string, parse_date_column, read_data_file,
+                          sniff_date_format)
+
+
+def test_column_decides_day_month_order():
+    # Only day first puts these in order
+    assert sniff_date_format(["12-01-20", "01-02-20"]) == "%d-%m-%y"
+    # Only month first puts these in order
+    assert sniff_date_format(["01-12-20", "02-01-20"]) == "%m-%d-%y"
+    assert parse_date_column(["01-12-20", "02-01-20"]) == [dt.datetime(2020, 1, 12), dt.datetime(2020, 2, 1)]
+    assert sniff_date_format(["31-Jan-2020", "29-Feb-2020"]) == "%d-%b-%Y"
+
+
+def test_single_value_is_day_first():
+    assert handle_date_string("01-02-20") == dt.datetime(2020, 2, 1)
+
+
+@pytest.mark.parametrize("column", [["01-02-20", "31-Jan-2020"], ["13-13-20"], ["2020/01/01"]])
+def test_unparseable_columns_are_rejected(column):
+    with pytest.raises(AssertionError):
+        sniff_date_format(column)
+
+
+def test_future_dates_are_rejected():
+    future = (dt.date.today() + dt.timedelta(days=400)).strftime("%d-%b-%Y")
+    with pytest.raises(AssertionError):
+        parse_date_column([future])
+    with pytest.raises(AssertionError):
+        handle_date_string(future)
+
+
+def test_long_and_wide_files_read_the_same(tmp_path):
+    wide = tmp_path / "wide.csv"
+    wide.write_text("Account,Type,31-Jan-2020,29-Feb-2020\nSavings,Savings,100,150\nCard,Credit,,10\n")
+    long = tmp_path / "long.csv"
+    long.write_text("Date,Account,Type,Value\n31-Jan-2020,Savings,Savings,100\n29-Feb-2020,Savings,Savings,150\n"
+                    "29-Feb-2020,card,credit,10\n")
+    for path in [wide, long]:
+        dates, names, types, currencies, values = read_data_file(str(path))
+        assert dates == [dt.datetime(2020, 1, 31), dt.datetime(2020, 2, 29)]
+        assert (names, types, currencies) == (["Savings", "Card"], ["Savings", "Credit"], ["GBP", "GBP"])
+        assert np.array_equal(values, [[100, np.nan], [150, 10]], equal_nan=True)
+
+
+@pytest.mark.parametrize("contents, row, column", [
+    ("Account,Type,31-Jan-2020\nSavings,Savings,abc\n", 2, 3),
+    ("Account,Type,31-Jan-2020\nSavings,Shares,1\n", 2, 2),
+    ("Account,Type,31-Jan-2020\nSavings,Savings,1,2\n", 2, 4),
+    ("Date,Account,Type,Value\n31-Jan-2020,Savings,Savings,1\n29-Feb-2020,Savings,Savings,x\n", 3, 4),
+    ("Date,Account,Type,Value\n31-Jan-2020,Savings,Savings,1\n31-Jan-2020,Savings,Savings,2\n", 3, None),
+    ("Date,Account,Type,Value\n31-Jan-2020,Savings,Savings,1\n29-Feb-2020,Savings,Current,2\n", 3, 3),
+])
+def test_bad_rows_are_located(tmp_path, contents, row, column):
+    path = tmp_path / "data.csv"
+    path.write_text(contents)
+    with pytest.raises(DataFileError) as e:
+        read_data_file(str(path))
+    assert (e.value.row, e.value.column) == (row, column)
+
+
+def test_save_only_rewrites_changed_rows(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("Account,Type,31-Jan-2020,29-Feb-2020\nSavings,Savings,100,150\nCurrent,Current,1.50,2.00\n")
+    c = Context(str(path), use_journal=False)
+    assert not c.test_updated()
+    c.set_value("Savings", dt.datetime(2020, 2, 29), 175)
+    assert c.test_updated()
+    assert c.dirty_accounts == {"Savings"}
+    assert c.dirty_dates == {dt.datetime(2020, 2, 29)}
+    assert not c.axis_changed
+
+    assert c.save_to_csv(str(path), allow_overwrite=True)
+    # The untouched row is copied across as it was written, rather than formatted again
+    assert path.read_text().splitlines()[1:] == ["Savings,Savings,100,175", "Current,Current,1.50,2.00"]
+    assert c.dirty_accounts == set()
+    assert c.test_updated()
+
+
+def test_new_date_rewrites_every_row(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("Account,Type,31-Jan-2020\nSavings,Savings,100\nCurrent,Current,1.50\n")
+    c = Context(str(path), use_journal=False)
+    c.add_date(dt.datetime(2020, 2, 29), {"Savings": 150})
+    assert c.axis_changed
+    assert c.save_to_csv(str(path), allow_overwrite=True)
+    assert path.read_text().splitlines()[1:] == ["Savings,Savings,100,150", "Current,Current,1.5,"]
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from downsample import downsample, lttb, min_max
+
+X = np.arange(1000, dtype=np.float64)
+Y = np.sin(X / 50) * 100 + np.where(X == 437, 500, 0)
+
+
+def test_lttb_length_and_end_points():
+    x, y = lttb(X, Y, 100)
+    assert len(x) == 100
+    assert (x[0], x[-1]) == (X[0], X[-1])
+    assert np.all(np.diff(x) > 0)
+    # The spike makes the largest triangle in its bucket
+    assert 437 in x
+
+
+def test_min_max_keeps_extremes():
+    x, y = min_max(X, Y, 100)
+    assert len(x) <= 102
+    assert (x[0], x[-1]) == (X[0], X[-1])
+    assert np.all(np.diff(x) > 0)
+    assert y.max() == Y.max() and y.min() == Y.min()
+    assert 437 in x
+
+
+@pytest.mark.parametrize("method", ["none", "lttb", "minmax"])
+def test_short_series_are_left_alone(method):
+    x, y = downsample(X[:50], Y[:50], 100, method)
+    assert np.array_equal(x, X[:50]) and np.array_equal(y, Y[:50])
+
+
+def test_unknown_method():
+    with pytest.raises(AssertionError):
+        downsample(X, Y, 100, "average")
@@ -0,0 +1,93 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+import data_handler
+
+
+def _totals(c):
+    return {k: (list(v.dates), v.values.copy()) for k, v in c.totals.items()}
+
+
+def test_failed_totals_are_rolled_back(savings, monkeypatch):
+    path, c = savings
+    before_values = c.store.values.copy()
+    before_totals = _totals(c)
+    totals_store, weightings = c._totals_store, c._totals_weightings
+
+    class FailingAccount(data_handler.BankAccount):
+        def __init__(self, account_name, *args, **kwargs):
+            # Fails part way through building the new totals
+            assert account_name != "Total Worth", "Failed building totals."
+            super().__init__(account_name, *args, **kwargs)
+
+    monkeypatch.setattr(data_handler, "BankAccount", FailingAccount)
+    edits = [{"op": "set_value", "account": "Savings", "date": dt.datetime(2020, 3, 31), "value": 300}]
+    with pytest.raises(AssertionError):
+        c.apply_edits(edits)
+    monkeypatch.undo()
+
+    assert np.array_equal(c.store.values, before_values)
+    assert c._totals_store is totals_store and c._totals_weightings is weightings
+    after_totals = _totals(c)
+    assert after_totals.keys() == before_totals.keys()
+    for name, (dates, values) in before_totals.items():
+        assert after_totals[name][0] == dates
+        assert np.array_equal(after_totals[name][1], values)
+
+    # Later edits keep the totals up to date in the restored store
+    c.set_value("Savings", dt.datetime(2020, 2, 29), 175)
+    assert c.totals["Total Money"].get_value_on_date(dt.datetime(2020, 2, 29)) == 175
+
+
+EDIT_CSV = """Operation,Account,Type,Date,Value
+add_account,current,current,,
+set_value,Current,,31-Jan-2020,20
+add_date,Savings,,31-Mar-2020,160
+set_value,Savings,,31-Jan-2020,
+remove_date,,,29-Feb-2020,
+"""
+
+
+def test_batch_is_applied_and_journaled_once(savings, tmp_path):
+    path, c = savings
+    edit_path = tmp_path / "edits.csv"
+    edit_path.write_text(EDIT_CSV)
+    edits = data_handler.read_edit_file(str(edit_path))
+    assert [x["op"] for x in edits] == ["add_account", "set_value", "add_date", "set_value", "remove_date"]
+    entries = c.journal.entry_count
+    c.apply_edits(edits)
+    assert c.journal.entry_count == entries + 1
+
+    for context in [c, data_handler.Context(path)]:
+        assert context.all_dates == [dt.datetime(2020, 1, 31), dt.datetime(2020, 3, 31)]
+        assert context.all_accounts["Savings"].values.tolist() == [0, 160]
+        assert context.all_accounts["Savings"].present.tolist() == [False, True]
+        assert context.all_accounts["Current"].values.tolist() == [20, 0]
+    assert c.totals["Total Money"].values.tolist() == [20, 160]
+
+
+def test_json_edits(tmp_path):
+    edit_path = tmp_path / "edits.json"
+    edit_path.write_text('{"edits": [{"operation": "add_date", "date": "31-Mar-2020", "values": {"savings": 5}}]}')
+    edit = data_handler.read_edit_file(str(edit_path))[0]
+    assert (edit["op"], edit["date"], edit["values"]) == ("add_date", dt.datetime(2020, 3, 31), {"Savings": 5})
+    edit_path.write_text('[{"operation": "rename_account", "account": "Savings"}]')
+    with pytest.raises(data_handler.DataFileError):
+        data_handler.read_edit_file(str(edit_path))
+
+
+def test_invalid_batch_changes_nothing(savings):
+    path, c = savings
+    before = c.store.values.copy()
+    entries = c.journal.entry_count
+    edits = [{"op": "set_value", "account": "Savings", "date": dt.datetime(2020, 1, 31), "value": 1},
+             {"op": "remove_account", "account": "Savings"},
+             # The account has gone by now
+             {"op": "set_value", "account": "Savings", "date": dt.datetime(2020, 2, 29), "value": 2}]
+    with pytest.raises(ValueError, match="1 invalid edits"):
+        c.apply_edits(edits)
+    assert np.array_equal(c.store.values, before)
+    assert c.journal.entry_count == entries
+    assert data_handler.Context(path).all_accounts["Savings"].values.tolist() == [100, 150]
@@ -0,0 +1,10 @@
+from data_handler import initialise_context
+
+
+def test_initialise_empty_file(tmp_path, capsys):
+    path = tmp_path / "empty.csv"
+    path.write_text("")
+    c = initialise_context(str(path))
+    assert c.all_dates == []
+    assert c.daily_dates() == []
+    assert "No data" in capsys.readouterr().out
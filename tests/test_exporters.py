@@ -0,0 +1,62 @@
+import datetime as dt
+import json
+import sys
+
+import numpy as np
+import pytest
+
+import exporters
+import inspect_data
+from data_handler import BankAccount, read_data_file
+from journal import encode_date
+
+
+@pytest.mark.parametrize("layout", exporters.EXPORT_LAYOUTS)
+def test_layout_choices(layout, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["inspect_data.py", "-a", "export", "-t", "-", "-l", layout])
+    assert inspect_data.parse_args().layout == layout
+
+
+def test_unknown_layout_is_a_usage_error(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["inspect_data.py", "-a", "export", "-t", "-", "-l", "wide"])
+    with pytest.raises(SystemExit):
+        inspect_data.parse_args()
+
+
+@pytest.fixture
+def mixed(savings, monkeypatch):
+    path, c = savings
+    _bc = BankAccount("Joint, Account", "current")
+    _bc.add_entry(12.5, dt.datetime(2020, 2, 29))
+    _bc.add_entry(7, dt.datetime(2020, 3, 31))
+    c.add_account(_bc)
+    # A block per date, so the export is built from several blocks
+    monkeypatch.setattr(exporters, "EXPORT_BLOCK_DATES", 1)
+    return c
+
+
+def test_export_layout_from_path():
+    assert exporters.export_layout("out.JSONL") == "jsonl"
+    assert exporters.export_layout("-") == "long"
+    assert exporters.export_layout("out.csv") is None
+
+
+def test_long_export_reads_back(mixed, tmp_path):
+    path = str(tmp_path / "export.csv")
+    assert exporters.write_export(mixed, path, "long", totals=False)
+    dates, names, types, currencies, values = read_data_file(path)
+    assert dates == mixed.all_dates
+    assert (names, types, currencies) == (mixed.store.names, mixed.store.types, mixed.store.currencies)
+    assert np.array_equal(values, np.where(mixed.store.present, mixed.store.values, np.nan), equal_nan=True)
+
+
+def test_jsonl_export_matches_entries(mixed, tmp_path):
+    path = str(tmp_path / "export.jsonl")
+    assert exporters.write_export(mixed, path)
+    with open(path) as f:
+        records = [json.loads(x) for x in f]
+    expected = [{"date": encode_date(d), "account": n, "type": t, "currency": cur, "value": v}
+                for d, n, t, cur, v in exporters.iter_entries(mixed)]
+    assert records == expected
+    assert {"date": "2020-03-31", "account": "Total Money", "type": "Total", "currency": "GBP", "value": 7.0} in records
+    assert len([x for x in records if x["type"] != "Total"]) == int(mixed.store.present.sum())
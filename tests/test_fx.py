@@ -0,0 +1,71 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from data_handler import BankAccount, Context, DataFileError, read_rate_table
+from fx import RateTable, format_money
+
+JAN = dt.datetime(2020, 1, 31)
+FEB = dt.datetime(2020, 2, 29)
+
+
+def _rates():
+    table = RateTable()
+    table.add_rates("USD", [JAN.toordinal(), FEB.toordinal()], [0.8, 0.75])
+    table.add_rates("EUR", [JAN.toordinal()], [0.9])
+    return table
+
+
+def test_nearest_previous_rate_is_used():
+    table = _rates()
+    ordinals = [JAN.toordinal(), JAN.toordinal() + 5, FEB.toordinal(), FEB.toordinal() + 100]
+    assert table.factors("USD", "GBP", ordinals).tolist() == [0.8, 0.8, 0.75, 0.75]
+    assert np.allclose(table.factors("USD", "EUR", ordinals[:1]), [0.8 / 0.9])
+    assert table.factors("GBP", "GBP", ordinals).tolist() == [1, 1, 1, 1]
+    with pytest.raises(ValueError):
+        table.factors("USD", "GBP", [JAN.toordinal() - 1])
+    with pytest.raises(ValueError):
+        table.factors("JPY", "GBP", ordinals)
+
+
+def test_later_rates_replace_earlier_ones():
+    table = _rates()
+    table.add_rates("USD", [FEB.toordinal()], [0.7])
+    assert table.factors("USD", "GBP", [FEB.toordinal()]).tolist() == [0.7]
+    assert format_money(12.5, "USD") == "$12.50"
+    assert format_money(3, "CHF") == "CHF 3.00"
+
+
+def test_rate_table_file(tmp_path):
+    path = tmp_path / "fx_rates.csv"
+    path.write_text("Currency,Date,Rate\nusd,31-Jan-2020,0.8\nUSD,29-Feb-2020,0.75\n")
+    assert read_rate_table(str(path)).factors("USD", "GBP", [FEB.toordinal()]).tolist() == [0.75]
+    path.write_text("Currency,Date,Rate\nUSD,31-Jan-2020,-1\n")
+    with pytest.raises(DataFileError):
+        read_rate_table(str(path))
+
+
+def test_totals_are_converted(savings):
+    path, c = savings
+    c.set_fx_rates(_rates())
+    _bc = BankAccount("Dollars", "current", "USD")
+    _bc.add_entry(100, JAN)
+    _bc.add_entry(200, FEB)
+    c.add_account(_bc)
+    assert c.totals["Total Money"].values.tolist() == [180, 300]
+    assert c.totals["Total Money"].currency == "GBP"
+
+    c.set_fx_rates(_rates(), "USD")
+    assert np.allclose(c.totals["Total Money"].values, [100 + 100 / 0.8, 200 + 150 / 0.75])
+    assert Context(path, fx_rates=_rates()).all_accounts["Dollars"].currency == "USD"
+
+
+def test_unknown_currency_is_rejected(savings):
+    path, c = savings
+    _bc = BankAccount("Dollars", "current", "USD")
+    _bc.add_entry(200, dt.datetime(2020, 1, 31))
+    with pytest.raises(ValueError):
+        c.add_account(_bc)
+    assert c.store.names == ["Savings"]
+    assert list(Context(path).all_accounts.keys()) == ["Savings"]
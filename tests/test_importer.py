@@ -0,0 +1,70 @@
+import datetime as dt
+
+import pytest
+
+from data_handler import Context
+
+
+def test_empty_merge_is_not_journaled(savings):
+    path, c = savings
+    count = c.mutation_count
+    c.merge_values([])
+    assert c.mutation_count == count
+    assert len(c.journal.entries()) == 1
+
+
+def test_merge_creates_accounts_under_their_display_names(savings):
+    path, c = savings
+    date = dt.datetime(2020, 3, 31)
+    c.merge_values([("new acct", date, 3.0), ("Savings", date, 175)], {"new acct": "savings"}, {"new acct": "GBP"})
+    assert c.all_accounts["New Acct"].get_value_on_date(date) == 3.0
+    assert c.totals["Total Money"].get_value_on_date(date) == 178.0
+
+    reloaded = Context(path)
+    assert list(reloaded.all_accounts.keys()) == ["Savings", "New Acct"]
+    assert reloaded.all_accounts["New Acct"].get_value_on_date(date) == 3.0
+
+
+def _write_long(path, rows):
+    path.write_text("Date,Account,Type,Value\n" + "".join(f"{d},{a},{t},{v}\n" for d, a, t, v in rows))
+
+
+def _imports(tmp_path):
+    folder = tmp_path / "imports"
+    folder.mkdir()
+    _write_long(folder / "a.csv", [("31-Jan-2020", "Savings", "Savings", 100),
+                                   ("31-Mar-2020", "Savings", "Savings", 200),
+                                   ("31-Mar-2020", "Card", "Credit", 50)])
+    _write_long(folder / "b.csv", [("31-Mar-2020", "Card", "Credit", 50),
+                                   ("29-Feb-2020", "Savings", "Savings", 160)])
+    return str(folder)
+
+
+def test_import_merges_agreeing_entries(savings, tmp_path, capsys):
+    path, c = savings
+    folder = tmp_path / "imports"
+    folder.mkdir()
+    _write_long(folder / "a.csv", [("31-Jan-2020", "Savings", "Savings", 100), ("31-Mar-2020", "Card", "Credit", 50)])
+    _write_long(folder / "b.csv", [("31-Mar-2020", "Card", "Credit", 50), ("31-Mar-2020", "Savings", "Savings", 200)])
+    # Savings on 31-Jan-2020 matches what is held and Card appears twice with the same value
+    assert c.update_from_file(str(folder), max_workers=1) == 2
+    assert "0 conflicts skipped" in capsys.readouterr().out
+    assert c.all_accounts["Card"].get_value_on_date(dt.datetime(2020, 3, 31)) == 50
+
+
+def test_import_conflict_changes_nothing(savings, tmp_path):
+    path, c = savings
+    count = c.mutation_count
+    with pytest.raises(ValueError, match="1 conflicting entries"):
+        c.update_from_file(_imports(tmp_path), max_workers=1)
+    assert c.mutation_count == count
+    assert c.all_accounts["Savings"].get_value_on_date(dt.datetime(2020, 2, 29)) == 150
+
+
+def test_import_overwrites_conflicts(savings, tmp_path, capsys):
+    path, c = savings
+    assert c.update_from_file(_imports(tmp_path), overwrite=True, max_workers=1) == 3
+    assert "1 conflicts overwritten" in capsys.readouterr().out
+    assert c.all_accounts["Savings"].get_value_on_date(dt.datetime(2020, 2, 29)) == 160
+    # Credit is owed, so it comes off the total
+    assert c.totals["Total Money"].get_value_on_date(dt.datetime(2020, 3, 31)) == 150
@@ -0,0 +1,29 @@
+import datetime as dt
+import os
+
+from data_handler import Context
+from inspect_data import exit_programme
+from journal import JOURNAL_COMPACT_ENTRIES
+
+
+def _files(directory):
+    return {x: (open(os.path.join(directory, x), "rb").read(), os.stat(os.path.join(directory, x)).st_mtime_ns)
+            for x in os.listdir(directory)}
+
+
+def test_exit_without_changes_writes_nothing(savings):
+    path, _ = savings
+    c = Context(path)
+    before = _files(os.path.dirname(path))
+    exit_programme(c, path, overwrite_save=True)
+    assert _files(os.path.dirname(path)) == before
+
+
+def test_exit_compacts_a_long_journal(savings):
+    path, c = savings
+    for idx in range(JOURNAL_COMPACT_ENTRIES):
+        c.set_value("Savings", dt.datetime(2020, 2, 29), idx)
+    exit_programme(c, path)
+    assert c.journal.entry_count == 0
+    saved = Context(path, use_journal=False)
+    assert saved.all_accounts["Savings"].values.tolist() == [100, JOURNAL_COMPACT_ENTRIES - 1]
@@ -0,0 +1,47 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from data_handler import BankAccount
+from interpolation import interpolate, INTERPOLATION_METHODS
+
+KNOWN_X = [0, 10, 20, 30]
+KNOWN_Y = [0, 10, 10, 40]
+
+
+def test_linear():
+    result = interpolate(KNOWN_X, KNOWN_Y, [0, 5, 15, 25, 30])
+    assert result.tolist() == [0, 5, 10, 25, 40]
+
+
+def test_step():
+    result = interpolate(KNOWN_X, KNOWN_Y, [0, 5, 10, 29, 30], method="step")
+    assert result.tolist() == [0, 0, 10, 10, 40]
+
+
+def test_monotone_never_overshoots():
+    query = np.arange(0, 31)
+    result = interpolate(KNOWN_X, KNOWN_Y, query, method="monotone")
+    assert result[KNOWN_X].tolist() == KNOWN_Y
+    # Flat between the two equal entries, where a plain cubic spline would dip or bulge
+    assert np.allclose(result[10:21], 10)
+    assert np.all(np.diff(result) > -1e-9)
+
+
+@pytest.mark.parametrize("method", INTERPOLATION_METHODS)
+def test_no_extrapolation(method):
+    result = interpolate(KNOWN_X, KNOWN_Y, [-1, 31], method=method)
+    assert np.isnan(result).all()
+    assert np.isnan(interpolate([], [], [1], method=method)).all()
+
+
+def test_account_interpolates_between_entries():
+    _bc = BankAccount("Savings", "savings")
+    _bc.add_entry(100, dt.datetime(2020, 1, 1))
+    _bc.add_entry(200, dt.datetime(2020, 1, 11))
+    assert _bc.get_value_on_date(dt.datetime(2020, 1, 6)) is None
+    assert _bc.get_value_on_date(dt.datetime(2020, 1, 6), interp=True) == 150
+    assert _bc.get_value_on_date(dt.datetime(2020, 1, 6), interp=True, method="step") == 100
+    assert _bc.get_value_on_date(dt.datetime(2020, 2, 1), interp=True) is None
+    assert _bc.interpolate_values([dt.datetime(2020, 1, 1), dt.datetime(2020, 1, 3)]).tolist() == [100, 120]
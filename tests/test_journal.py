@@ -0,0 +1,95 @@
+import datetime as dt
+import os
+import pathlib
+
+import pytest
+
+from data_handler import BankAccount, Context
+from journal import journal_path
+
+
+def test_failed_edits_are_not_journaled(savings):
+    path, c = savings
+    with pytest.raises(AssertionError):
+        c.set_value("Missing", dt.datetime(2020, 3, 31), 5)
+    with pytest.raises(AssertionError):
+        c.add_date(dt.datetime(2020, 3, 31), {"Missing": 5})
+    with pytest.raises(AssertionError):
+        c.remove_date(dt.datetime(2020, 4, 30))
+    with pytest.raises(AssertionError):
+        c.remove_account("Missing")
+    c.set_value("Savings", dt.datetime(2020, 2, 29), 175)
+
+    reloaded = Context(path)
+    assert reloaded.all_dates == [dt.datetime(2020, 1, 31), dt.datetime(2020, 2, 29)]
+    assert list(reloaded.all_accounts.keys()) == ["Savings"]
+    assert reloaded.all_accounts["Savings"].get_value_on_date(dt.datetime(2020, 2, 29)) == 175
+
+
+def _files(directory):
+    """
+    :return: {file name: (contents, mtime)} for every file in the directory
+    """
+    return {x: (open(directory / x, "rb").read(), os.stat(directory / x).st_mtime_ns) for x in os.listdir(directory)}
+
+
+def test_partial_entry_is_ignored_without_writing(savings):
+    path, c = savings
+    with open(journal_path(path), "ab") as f:
+        f.write(b'{"op": "set_va')
+    directory = pathlib.Path(path).parent
+    before = _files(directory)
+    reloaded = Context(path)
+    assert _files(directory) == before
+    assert reloaded.all_accounts["Savings"].get_value_on_date(dt.datetime(2020, 2, 29)) == 150
+
+    # The next edit cuts off the partial entry before appending
+    reloaded.set_value("Savings", dt.datetime(2020, 2, 29), 175)
+    assert Context(path).all_accounts["Savings"].get_value_on_date(dt.datetime(2020, 2, 29)) == 175
+
+
+def test_stale_journal_is_ignored_without_writing(savings):
+    path, c = savings
+    # Rewritten behind the journal's back, so the journaled edits no longer apply
+    with open(path, "w") as f:
+        f.write("Account,Type\n")
+    directory = pathlib.Path(path).parent
+    before = _files(directory)
+    reloaded = Context(path, use_snapshot=False)
+    assert _files(directory) == before
+    assert list(reloaded.all_accounts.keys()) == []
+
+    # The next edit replaces the stale journal rather than appending to it
+    _bc = BankAccount("Current", "current")
+    _bc.add_entry(20, dt.datetime(2020, 1, 31))
+    reloaded.add_account(_bc)
+    assert list(Context(path).all_accounts.keys()) == ["Current"]
+
+
+def test_edits_are_replayed_without_rewriting_the_csv(savings):
+    path, c = savings
+    csv_before = _files(pathlib.Path(path).parent)["data.csv"]
+    c.add_date(dt.datetime(2020, 3, 31), {"Savings": 160})
+    c.set_value("Savings", dt.datetime(2020, 1, 31), 90)
+    c.remove_date(dt.datetime(2020, 2, 29))
+    _bc = BankAccount("Current", "current")
+    _bc.add_entry(20, dt.datetime(2020, 3, 31))
+    c.add_account(_bc)
+    c.remove_account("Current")
+    assert _files(pathlib.Path(path).parent)["data.csv"] == csv_before
+    assert c.journal.entry_count == 6
+
+    reloaded = Context(path)
+    assert reloaded.all_dates == [dt.datetime(2020, 1, 31), dt.datetime(2020, 3, 31)]
+    assert reloaded.all_accounts["Savings"].values.tolist() == [90, 160]
+    assert list(reloaded.all_accounts.keys()) == ["Savings"]
+    assert reloaded.journal.entry_count == 6
+
+
+def test_compact_folds_the_journal_into_the_csv(savings):
+    path, c = savings
+    assert c.compact()
+    assert not os.path.exists(journal_path(path))
+    assert c.journal.entry_count == 0
+    reloaded = Context(path, use_snapshot=False, use_journal=False)
+    assert reloaded.all_accounts["Savings"].values.tolist() == [100, 150]
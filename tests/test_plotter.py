@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+from plotter import chart_jobs, render_charts
+
+
+def test_chart_jobs(savings):
+    path, c = savings
+    names = [x[0] for x in chart_jobs(c, ["account", "type", "totals", "year"], ["Savings"], "svg")]
+    assert names == ["account_Savings.svg", "type_savings.svg", "totals.svg", "year_2020.svg"]
+    with pytest.raises(AssertionError):
+        chart_jobs(c, ["pie"], ["Savings"])
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_render_charts(savings, tmp_path, max_workers):
+    path, c = savings
+    output_dir = str(tmp_path / "charts")
+    paths = render_charts(c, output_dir, ["account", "totals"], max_workers=max_workers)
+    assert sorted(os.listdir(output_dir)) == ["account_Savings.png", "totals.png"]
+    for chart in paths:
+        with open(chart, "rb") as f:
+            assert f.read(8) == b"\x89PNG\r\n\x1a\n"
@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+
+import pytest
+
+import profiling
+from data_handler import Context
+
+
+@pytest.fixture
+def profile(monkeypatch):
+    profile = profiling.Profile()
+    monkeypatch.setattr(profiling, "_profile", profile)
+    return profile
+
+
+def test_nothing_is_recorded_when_off(savings):
+    path, _ = savings
+    assert profiling._profile is None
+    Context(path).generate_totals()
+    assert profiling.disable() is None
+
+
+def test_spans_and_counts(savings, profile):
+    path, _ = savings
+    c = Context(path, use_snapshot=False)
+    c.generate_totals()
+    c.all_accounts["Savings"].get_value_on_date(c.all_dates[0])
+    with profiling.span("outer"):
+        with profiling.span("outer"):
+            pass
+    assert profile.spans["Context.generate_totals"]["calls"] == 1
+    assert profile.spans["Context._replay_journal"]["calls"] == 1
+    assert profile.spans["outer"]["calls"] == 2
+    assert profile.spans["outer"]["max_s"] <= profile.spans["outer"]["total_s"]
+    assert profile.counts["BankAccount.get_value_on_date"] == 1
+
+
+def test_memory_is_traced(monkeypatch):
+    profile = profiling.Profile(trace_memory=True)
+    monkeypatch.setattr(profiling, "_profile", profile)
+    try:
+        with profiling.span("outer"):
+            with profiling.span("inner"):
+                data = bytearray(10 ** 6)
+            del data
+    finally:
+        tracemalloc.stop()
+    assert profile.spans["inner"]["peak_bytes"] >= 10 ** 6
+    assert profile.spans["outer"]["peak_bytes"] >= profile.spans["inner"]["peak_bytes"]
+
+
+def test_summary_is_written_on_exit(savings, tmp_path):
+    path, _ = savings
+    output = tmp_path / "profile.json"
+    code = "import sys, profiling, data_handler; profiling.enable(sys.argv[1]); data_handler.Context(sys.argv[2])"
+    subprocess.run([sys.executable, "-c", code, str(output), path], check=True,
+                   cwd=os.path.dirname(os.path.abspath(profiling.__file__)))
+    summary = json.loads(output.read_text())
+    assert summary["wall_s"] > 0
+    assert "Context._replay_journal" in summary["spans"]
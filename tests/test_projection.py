@@ -0,0 +1,60 @@
+import datetime as dt
+
+import numpy as np
+
+import projection
+from data_handler import BankAccount, Context
+
+
+def _context(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("")
+    c = Context(str(path))
+    dates = [dt.datetime(2018 + x // 12, x % 12 + 1, 28) for x in range(36)]
+    # Opened with a token amount and funded years later, after which it grows slowly. Interpolated between the two,
+    # the funding looks like steady growth of about 13% a month.
+    funded = BankAccount("Funded", "savings")
+    funded.add_entry(50, dates[0])
+    for idx in range(30, 36):
+        funded.add_entry(2458 * 1.004 ** (idx - 30), dates[idx])
+    steady = BankAccount("Steady", "savings")
+    for idx, date in enumerate(dates):
+        steady.add_entry(1000 * 1.003 ** idx + (25 if idx % 2 else -25), date)
+    c.add_account(funded)
+    c.add_account(steady)
+    c.generate_totals()
+    return c
+
+
+def test_funding_jump_is_not_compounded(tmp_path):
+    c = _context(tmp_path)
+    model = projection.fit_projection_model(c)
+    assert list(model.geometric) == [False, True]
+
+    result = projection.project(c, years=10, n_paths=2000, seed=1)
+    assert np.all(result.band("Total Worth", 95) < 1e6)
+
+
+def test_same_seed_same_projection(tmp_path):
+    c = _context(tmp_path)
+    result = projection.project(c, years=2, n_paths=1200, seed=5)
+    assert len(result.dates) == 25
+    assert (result.dates[0], result.dates[1]) == (c.all_dates[-1], dt.datetime(2021, 1, 28))
+    # However the batches are shared out, each one has its own random stream
+    parallel = projection.project(c, years=2, n_paths=1200, seed=result.entropy, max_workers=2)
+    for name in ["Funded", "Steady", "Total Money", "Total Worth"]:
+        assert np.array_equal(result.bands[name], parallel.bands[name])
+    assert not np.array_equal(result.bands["Steady"], projection.project(c, years=2, n_paths=1200).bands["Steady"])
+
+
+def test_bands_are_ordered(tmp_path):
+    c = _context(tmp_path)
+    result = projection.project(c, years=3, n_paths=1000, seed=2, accounts=["Steady"])
+    assert list(result.bands) == ["Steady", "Total Money", "Total Worth"]
+    for name, band in result.bands.items():
+        assert np.all(np.diff(band, axis=0) >= 0), name
+        # Every percentile starts from the last value held
+        assert np.all(band[:, 0] == band[0, 0])
+    assert result.band("Total Worth", 50)[0] == c.totals["Total Worth"].values[-1]
+    # The steady account keeps growing by a few percent a year
+    assert 1.05 < result.band("Steady", 50)[-1] / result.band("Steady", 50)[0] < 1.25
@@ -0,0 +1,79 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from data_handler import BankAccount
+from rollups import PERIODS, RollupPyramid
+
+STATS = ["end", "min", "max", "mean", "change", "count"]
+
+
+@pytest.fixture
+def monthly(savings):
+    """
+    Savings on the last day of 2020-01 to 2020-06, plus a second entry in March, and a current account from April
+    """
+    path, c = savings
+    c.add_date(dt.datetime(2020, 3, 15), {"Savings": 120})
+    for month, value in [(3, 130), (4, 160), (5, 140), (6, 170)]:
+        c.set_value("Savings", dt.datetime(2020, month + 1, 1) - dt.timedelta(days=1), value)
+    _bc = BankAccount("Current", "current")
+    _bc.add_entry(10, dt.datetime(2020, 4, 30))
+    c.add_account(_bc)
+    return c
+
+
+def _same(a, b):
+    assert a.labels == b.labels
+    assert a.names == b.names
+    for stat in STATS:
+        assert np.array_equal(getattr(a, stat), getattr(b, stat), equal_nan=True), stat
+
+
+def test_periods(monthly):
+    month = monthly.rollup("month").column("Savings")
+    assert monthly.rollup("month").labels == ["Jan-2020", "Feb-2020", "Mar-2020", "Apr-2020", "May-2020", "Jun-2020"]
+    assert month["end"].tolist() == [100, 150, 130, 160, 140, 170]
+    assert month["count"].tolist() == [1, 1, 2, 1, 1, 1]
+    assert month["mean"][2] == 125
+
+    quarter = monthly.rollup("quarter")
+    assert quarter.labels == ["Q1-2020", "Q2-2020"]
+    assert quarter.ends == [dt.datetime(2020, 3, 31), dt.datetime(2020, 6, 30)]
+    savings = quarter.column("Savings")
+    assert (savings["end"].tolist(), savings["min"].tolist(), savings["max"].tolist()) == ([130, 170], [100, 140],
+                                                                                            [150, 170])
+    assert savings["change"][1] == 40
+    current = quarter.column("Current")
+    assert np.isnan(current["end"][0]) and current["end"][1] == 10
+
+    # Totals are not carried forward, so Current counts nothing on the last date
+    year = monthly.rollup("year", totals=True).column("Total Worth")
+    assert year["end"].tolist() == [170]
+
+
+def test_edits_only_refresh_their_months(monthly):
+    for period in PERIODS:
+        monthly.rollup(period)
+        monthly.rollup(period, totals=True)
+    monthly.set_value("Savings", dt.datetime(2020, 2, 29), 155)
+    monthly.add_date(dt.datetime(2020, 7, 31), {"Current": 15})
+    monthly.remove_date(dt.datetime(2020, 3, 15))
+    # Months since January 1970 of February, March and July 2020
+    assert monthly._rollups._stale == {601, 602, 606}
+
+    for period in PERIODS:
+        _same(monthly.rollup(period), RollupPyramid(monthly.store).level(period))
+        _same(monthly.rollup(period, totals=True), RollupPyramid(monthly._totals_store).level(period))
+    assert monthly.rollup("month").column("Savings")["end"][1] == 155
+    assert monthly.rollup("year", totals=True).column("Total Worth")["end"].tolist() == [15]
+
+
+def test_new_account_rebuilds(monthly):
+    monthly.rollup("year")
+    _bc = BankAccount("Card", "credit")
+    _bc.add_entry(5, dt.datetime(2020, 1, 31))
+    monthly.add_account(_bc)
+    assert monthly.rollup("year").names == ["Savings", "Current", "Card"]
+    assert monthly.rollup("year").column("Card")["end"].tolist() == [5]
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from data_handler import Context, DataFileError
+from row_index import build_row_index, read_row_index, row_index_path
+
+
+def _write_wide(path):
+    path.write_text("Account,Type,31-Jan-2020,29-Feb-2020\n"
+                    "Savings,Savings,100,150\n"
+                    "Current,Current,20,\n"
+                    "Card,Credit,5,10\n")
+
+
+def test_index_records_each_row(tmp_path):
+    path = tmp_path / "data.csv"
+    _write_wide(path)
+    index = build_row_index(str(path))
+    assert list(index["rows"]) == ["Savings", "Current", "Card"]
+    with open(path, "rb") as f:
+        data = f.read()
+    _, offset, length, row_number = index["rows"]["Current"]
+    assert data[offset:offset + length] == b"Current,Current,20,\n"
+    assert row_number == 3
+
+
+def test_lazy_load_reads_only_requested_rows(tmp_path):
+    path = tmp_path / "data.csv"
+    _write_wide(path)
+    c = Context(str(path), accounts=["Savings"], use_journal=False)
+    assert sorted(c.all_accounts.pending) == ["Card", "Current"]
+    assert c.all_accounts["Current"].values.tolist() == [20, 0]
+    assert c.all_accounts.pending == ["Card"]
+
+
+def test_loading_writes_no_index(tmp_path):
+    path = tmp_path / "data.csv"
+    _write_wide(path)
+    Context(str(path), accounts=["Savings"])
+    assert os.listdir(tmp_path) == ["data.csv"]
+
+
+def test_saving_writes_index(tmp_path):
+    path = tmp_path / "data.csv"
+    _write_wide(path)
+    c = Context(str(path), use_journal=False)
+    c.save_to_csv(str(path), allow_overwrite=True)
+    assert os.path.exists(row_index_path(str(path)))
+    assert read_row_index(str(path)) == build_row_index(str(path))
+
+
+def test_unrequested_rows_are_not_parsed(tmp_path):
+    path = tmp_path / "data.csv"
+    _write_wide(path)
+    with open(path, "a") as f:
+        f.write("Broken,Current,abc,\n")
+    c = Context(str(path), accounts=["Card"], use_journal=False)
+    assert c.all_accounts["Card"].values.tolist() == [5, 10]
+    with pytest.raises(DataFileError):
+        c.all_accounts["Broken"]
+
+
+def test_stale_index_is_not_used(tmp_path):
+    path = tmp_path / "data.csv"
+    _write_wide(path)
+    Context(str(path), use_journal=False).save_to_csv(str(path), allow_overwrite=True)
+    with open(path, "w") as f:
+        f.write("Account,Type,31-Jan-2020\nCurrent,Current,7\n")
+    c = Context(str(path), accounts=["Current"], use_journal=False)
+    assert c.all_accounts["Current"].values.tolist() == [7]
+    assert list(read_row_index(str(path))["rows"]) == ["Current"]
@@ -0,0 +1,56 @@
+import datetime as dt
+import os
+
+import numpy as np
+
+from data_handler import Context
+from snapshot import read_snapshot, snapshot_path
+
+
+def _saved(savings):
+    path, c = savings
+    c.compact()
+    return path, c
+
+
+def test_snapshot_matches_saved_data(savings):
+    path, c = _saved(savings)
+    snapshot = read_snapshot(path)
+    assert snapshot["dates"] == c.all_dates
+    assert snapshot["names"] == ["Savings"]
+    assert np.array_equal(snapshot["values"], c.store.values)
+    assert list(snapshot["totals"]) == list(c.totals)
+
+
+def test_load_uses_snapshot(savings, monkeypatch):
+    path, c = _saved(savings)
+
+    def fail(*args):
+        raise AssertionError("The csv should not be read.")
+    monkeypatch.setattr(Context, "_load_historical", fail)
+    reloaded = Context(path)
+    assert reloaded.all_accounts["Savings"].get_value_on_date(dt.datetime(2020, 2, 29)) == 150
+    assert reloaded.totals["Total Worth"].values.tolist() == [100, 150]
+
+
+def test_touched_file_keeps_snapshot(savings):
+    path, _ = _saved(savings)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert read_snapshot(path) is not None
+
+
+def test_changed_file_invalidates_snapshot(savings):
+    path, _ = _saved(savings)
+    with open(path) as f:
+        contents = f.read()
+    # Same size, different contents
+    with open(path, "w") as f:
+        f.write(contents.replace("150", "175"))
+    assert os.path.exists(snapshot_path(path))
+    assert read_snapshot(path) is None
+
+    with open(path, "a") as f:
+        f.write("Current,Current,1,2\n")
+    assert read_snapshot(path) is None
+    assert list(Context(path).all_accounts.keys()) == ["Savings", "Current"]
@@ -0,0 +1,39 @@
+import datetime as dt
+
+from data_handler import BankAccount, Context
+from storage import SqliteStorage, storage_backend
+
+
+def test_backend_is_picked_by_extension():
+    assert storage_backend("latest_data.db") == "sqlite"
+    assert storage_backend("latest_data.SQLITE3") == "sqlite"
+    assert storage_backend("latest_data.csv") == "csv"
+
+
+def _contents(context):
+    return {name: (_bc.type, _bc.currency, list(zip(_bc.dates, _bc.values.tolist())))
+            for name, _bc in context.all_accounts.items()}
+
+
+def test_csv_sqlite_round_trip(savings, tmp_path):
+    path, c = savings
+    _bc = BankAccount("Card", "credit")
+    _bc.add_entry(30, dt.datetime(2020, 2, 29))
+    c.add_account(_bc)
+    c.add_date(dt.datetime(2020, 3, 31), {"Savings": 160})
+
+    db_path = str(tmp_path / "data.db")
+    assert c.save(db_path)
+    from_db = Context(db_path)
+    assert from_db.all_dates == c.all_dates
+    assert _contents(from_db) == _contents(c)
+
+    # Edits to a database go straight into it
+    from_db.set_value("Card", dt.datetime(2020, 3, 31), 40)
+    database = SqliteStorage(db_path, read_only=True)
+    assert database.read_account("Card")[3].tolist() == [30, 40]
+    database.close()
+
+    csv_path = str(tmp_path / "back.csv")
+    assert from_db.save(csv_path)
+    assert _contents(Context(csv_path)) == _contents(Context(db_path))
@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+import sys
+
+import numpy as np
+import pytest
+
+import inspect_data
+import tables
+
+
+@pytest.mark.parametrize("table_format", tables.TABLE_FORMATS)
+def test_format_choices(table_format, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["inspect_data.py", "-a", "print", "-f", table_format])
+    assert inspect_data.parse_args().format == table_format
+
+
+def test_unknown_format_is_a_usage_error(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["inspect_data.py", "-a", "print", "-f", "xml"])
+    with pytest.raises(SystemExit):
+        inspect_data.parse_args()
+
+
+def _table(n_rows):
+    return tables.Table(["Date", "Currency", "Value"],
+                        [[f"{x:02d}-Jan-2020" for x in range(n_rows)], ["GBP", "USD"] * (n_rows // 2),
+                         np.where(np.arange(n_rows) % 3 == 0, np.nan, np.arange(n_rows) * 1.25)],
+                        money={"Value": "Currency"})
+
+
+def _render(table, table_format, **kwargs):
+    out = io.StringIO()
+    tables.write_table(table, table_format, out=out, **kwargs)
+    return out.getvalue()
+
+
+def test_text_columns_line_up():
+    lines = _render(_table(6), "text").splitlines()
+    assert lines[0].split() == ["Date", "Value"]
+    assert lines[1] == "00-Jan-2020       "
+    assert lines[2] == "01-Jan-2020  $1.25"
+    assert lines[6] == "05-Jan-2020  $6.25"
+    assert len(set(len(x) for x in lines)) == 1
+
+
+def test_csv_and_json_hold_raw_values(savings):
+    table = _table(4)
+    rows = list(csv.reader(io.StringIO(_render(table, "csv"))))
+    assert rows == [["Date", "Currency", "Value"], ["00-Jan-2020", "GBP", ""], ["01-Jan-2020", "USD", "1.25"],
+                    ["02-Jan-2020", "GBP", "2.5"], ["03-Jan-2020", "USD", ""]]
+    records = [{"Date": x[0], "Currency": x[1], "Value": float(x[2]) if x[2] else None} for x in rows[1:]]
+    assert json.loads(_render(table, "json")) == records
+    assert json.loads(_render(_table(0), "json")) == []
+
+    path, c = savings
+    c.generate_totals()
+    records = json.loads(_render(tables.date_table(c), "json"))
+    assert [(x["Account"], x["Value"]) for x in records if x["Date"] == "29-Feb-2020"] == [
+        ("Savings", 150), ("Total Money", 150), ("Total Worth", 150)]
+
+
+@pytest.mark.parametrize("table_format", tables.TABLE_FORMATS)
+def test_streamed_output_matches(table_format, monkeypatch):
+    whole = _render(_table(50), table_format)
+    monkeypatch.setattr(tables, "STREAM_ROWS", 7)
+    assert _render(_table(50), table_format) == whole
+    assert _render(_table(50), table_format, page_rows=9, more=lambda: True) == whole
+
+
+def test_paging_stops_when_asked():
+    pages = []
+    output = _render(_table(50), "text", page_rows=10, more=lambda: pages.append(1) and False)
+    assert len(pages) == 1
+    assert len(output.splitlines()) == 11
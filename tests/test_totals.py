@@ -0,0 +1,79 @@
+import datetime as dt
+
+import pytest
+
+from data_handler import BankAccount, Context, TOTAL_WEIGHTINGS
+
+DATES = [dt.datetime(2020, 1, 31), dt.datetime(2020, 2, 29), dt.datetime(2020, 3, 31)]
+ACCOUNTS = {"Savings": ("savings", [100, 150, None]),
+            "Current": ("current", [20, None, 35]),
+            "Card": ("credit", [5, 10, 15]),
+            "House": ("mortgage", [None, 1000, 990])}
+
+
+@pytest.fixture
+def context(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("")
+    c = Context(str(path), use_journal=False)
+    for name, (account_type, values) in ACCOUNTS.items():
+        _bc = BankAccount(name, account_type)
+        for date, value in zip(DATES, values):
+            if value is not None:
+                _bc.add_entry(value, date)
+        c.add_account(_bc)
+    return c
+
+
+def _expected(c, weightings):
+    """
+    The totals worked out one value at a time, to check the vectorised version against
+    """
+    expected = {}
+    for total, weights in weightings.items():
+        expected[total] = [sum(weights.get(_bc.type.lower(), 0) * (_bc.get_value_on_date(date) or 0)
+                               for _bc in c.all_accounts.values()) for date in c.all_dates]
+    return expected
+
+
+def _totals(c):
+    return {name: _bc.values.tolist() for name, _bc in c.totals.items()}
+
+
+def test_totals_match_dict_arithmetic(context):
+    context.generate_totals()
+    assert _totals(context) == _expected(context, TOTAL_WEIGHTINGS)
+    assert _totals(context)["Total Worth"] == [115, -860, -970]
+
+
+def test_custom_weightings(context):
+    weightings = {"Cash": {"current": 1, "savings": 1}, "Debt": {"credit": 1, "mortgage": 1}}
+    context.generate_totals(weightings)
+    assert list(context.totals) == ["Cash", "Debt"]
+    assert _totals(context) == _expected(context, weightings)
+
+
+def _add_loan(c):
+    _bc = BankAccount("Loan Account", "credit")
+    _bc.add_entry(300, DATES[1])
+    c.add_account(_bc)
+
+
+EDITS = [lambda c: c.set_value("Card", DATES[1], 12),
+         lambda c: c.set_value("Savings", DATES[2], 170),
+         lambda c: c.set_value("Current", dt.datetime(2020, 4, 30), 50),
+         lambda c: c.add_date(dt.datetime(2020, 2, 15), {"Savings": 120, "House": 1005}),
+         lambda c: c.remove_date(DATES[0]),
+         lambda c: c.remove_account("Current"),
+         _add_loan,
+         lambda c: c.merge_values([("Savings", DATES[1], 155), ("Pension", DATES[2], 400)], {"Pension": "savings"})]
+
+
+def test_totals_follow_every_edit(context):
+    context.generate_totals()
+    for edit in EDITS:
+        edit(context)
+        assert _totals(context) == _expected(context, TOTAL_WEIGHTINGS)
+    incremental = _totals(context)
+    context.generate_totals()
+    assert incremental == _totals(context)